@@ -0,0 +1,147 @@
+"""
+Бенчмарк хранилища сессий: ходов диалога в секунду (load -> append)
+
+Каждый "ход" повторяет работу /chat/turn с хранилищем без вызова LLM.
+По умолчанию работает с локальным Redis (REDIS_URL), с флагом --fake — с fakeredis.
+С флагом --codecs сравнивает кодеки сессий (байт на сессию, время encode/decode) без Redis.
+
+Пример:
+    python bench_sessions.py --sessions 200 --turns 8 --concurrency 50
+    python bench_sessions.py --fake --codec json
+    python bench_sessions.py --codecs
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from session_codec import JsonCodec, MsgpackCodec, create_codec, msgpack
+from session_store import RedisSessionStore
+
+VACANCY_TEXT = "Senior Python Developer. Требуется опыт 5+ лет, FastAPI, PostgreSQL, Redis, Kafka. " * 20
+CV_TEXT = "Иван Иванов. 6 лет коммерческой разработки на Python, FastAPI, Django, PostgreSQL. " * 20
+ANSWER = "Да, готов к переезду. Последние два года работал с Kafka и Redis в высоконагруженном сервисе."
+QUESTION = "Спасибо! Уточню: был ли у вас опыт менторства младших разработчиков? [Да/Нет]"
+
+
+def new_session(session_id: str) -> dict:
+    now = datetime.utcnow().isoformat()
+    return {
+        "session_id": session_id,
+        "vacancy_text": VACANCY_TEXT,
+        "cv_text": CV_TEXT,
+        "messages": [{"role": "assistant", "content": QUESTION}],
+        "question_count": 0,
+        "is_completed": False,
+        "relevance_percent": 50,
+        "summary": "Идет уточнение деталей",
+        "reasons": [],
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def full_transcript(turns: int) -> dict:
+    """Сессия после turns ходов: поля, тексты и диалог, как их пишет ассистент"""
+    session = new_session("codec_bench")
+    for _ in range(turns):
+        session["messages"].append({"role": "user", "content": ANSWER})
+        session["messages"].append({"role": "assistant", "content": QUESTION})
+    session["detailed_analysis"] = "**ОБЩАЯ ОЦЕНКА:** кандидат подходит на 78%. " * 40
+    return session
+
+
+def codec_report(turns: int, iterations: int):
+    """Байт на сессию и время encode/decode для каждого кодека (значения кодируются по отдельности, как в Redis)"""
+    session = full_transcript(turns)
+    values = [value for name, value in session.items() if name != "messages"] + session["messages"]
+    codecs = [("json", JsonCodec(compress_threshold=0)), ("json+zlib", JsonCodec())]
+    if msgpack is not None:
+        codecs += [("msgpack", MsgpackCodec(compress_threshold=0)), ("msgpack+zlib", MsgpackCodec())]
+    else:
+        print("msgpack не установлен — сравниваются только JSON-кодеки")
+
+    print(f"Transcript: {len(session['messages'])} messages, {len(values)} values")
+    print(f"{'codec':<14} {'bytes':>9} {'encode us':>10} {'decode us':>10}")
+    for name, codec in codecs:
+        encoded = [codec.encode(v) for v in values]
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for v in values:
+                codec.encode(v)
+        encode_us = (time.perf_counter() - started) / iterations * 1e6
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for data in encoded:
+                codec.decode(data)
+        decode_us = (time.perf_counter() - started) / iterations * 1e6
+        print(f"{name:<14} {sum(len(e) for e in encoded):>9} {encode_us:>10.1f} {decode_us:>10.1f}")
+
+
+async def run_turn(store: RedisSessionStore, session_id: str):
+    session = await store.load(session_id)
+    new_messages = [
+        {"role": "user", "content": ANSWER},
+        {"role": "assistant", "content": QUESTION},
+    ]
+    await store.append(session_id, new_messages, {
+        "question_count": session["question_count"] + 1,
+        "updated_at": datetime.utcnow().isoformat(),
+    }, blob_hashes=(session["vacancy_hash"], session["cv_hash"]))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк хранилища сессий")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--fake", action="store_true", help="Использовать fakeredis вместо Redis")
+    parser.add_argument("--codec", default="msgpack", choices=["msgpack", "json"])
+    parser.add_argument("--codecs", action="store_true", help="Только сравнить кодеки, без Redis")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.codecs:
+        codec_report(args.turns, args.iterations)
+        return
+
+    codec = create_codec(args.codec)
+    if args.fake:
+        from fakeredis import aioredis as fake_aioredis
+
+        store = RedisSessionStore("fakeredis://", client=fake_aioredis.FakeRedis(), codec=codec)
+    else:
+        store = RedisSessionStore(
+            os.getenv("REDIS_URL", "redis://localhost:6379"), max_connections=args.concurrency, codec=codec
+        )
+    if not await store.connect():
+        raise SystemExit("Redis недоступен")
+
+    session_ids = [f"bench_{i}" for i in range(args.sessions)]
+    for sid in session_ids:
+        await store.create(sid, new_session(sid))
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def session_worker(sid: str):
+        # Ходы одной сессии последовательны, разные сессии — параллельны
+        for _ in range(args.turns):
+            async with semaphore:
+                await run_turn(store, sid)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session_worker(sid) for sid in session_ids))
+    elapsed = time.perf_counter() - started
+
+    total_turns = args.sessions * args.turns
+    print(f"Codec: {codec.name}, sessions: {args.sessions}, turns/session: {args.turns}, concurrency: {args.concurrency}")
+    print(f"Total turns: {total_turns}, elapsed: {elapsed:.2f}s, throughput: {total_turns / elapsed:.1f} turns/s")
+
+    for sid in session_ids:
+        await store.delete(sid)
+    await store.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
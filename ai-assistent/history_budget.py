@@ -0,0 +1,104 @@
+"""
+Бюджет токенов промпта: сжатие старой части диалога в краткое содержание
+"""
+from functools import lru_cache
+from typing import Any, Dict, List
+
+try:
+    import tiktoken
+except ImportError:  # без tiktoken считаем приблизительно
+    tiktoken = None
+
+SUMMARY_HEADER = "Краткое содержание предыдущей части диалога (вопросы и ответы кандидата):"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    return tiktoken.get_encoding("o200k_base") if tiktoken else None
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Токены текста (o200k_base, как у gpt-4o); без tiktoken — ~3 символа на токен"""
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 3 + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    # ~4 служебных токена на сообщение (роль и разделители)
+    return sum(count_tokens(m.get("content") or "") + 4 for m in messages)
+
+
+def shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+
+class HistoryBudget:
+    """
+    Держит промпт хода в пределах max_prompt_tokens: самые старые сообщения диалога
+    сворачиваются в строки краткого содержания (без вызова LLM), последние
+    keep_recent_messages всегда идут дословно. Свернутая часть сохраняется в сессии
+    и дальше только растет, поэтому начало промпта от хода к ходу не меняется.
+    """
+
+    def __init__(
+        self,
+        max_prompt_tokens: int = 4000,
+        keep_recent_messages: int = 4,
+        question_chars: int = 160,
+        answer_chars: int = 300,
+    ):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.question_chars = question_chars
+        self.answer_chars = answer_chars
+
+    def summarize(self, message: Dict[str, str]) -> str:
+        """Строка краткого содержания для одного сообщения ('' — сообщение отбрасывается)"""
+        content = (message.get("content") or "").split("[RESULT]")[0]
+        if message.get("role") == "assistant":
+            return f"- Вопрос: {shorten(content, self.question_chars)}"
+        if message.get("role") == "user":
+            return f"- Ответ: {shorten(content, self.answer_chars)}"
+        return ""
+
+    @staticmethod
+    def assemble(initial: List[Dict[str, str]], summary: str, recent: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        if not summary:
+            return initial + recent
+        return initial + [{"role": "system", "content": f"{SUMMARY_HEADER}\n{summary}"}] + recent
+
+    def build(self, initial: List[Dict[str, str]], session: Dict[str, Any]) -> List[Dict[str, str]]:
+        """
+        Промпт для хода. Обновляет в сессии history_summary, compacted_messages,
+        prompt_tokens и накопленный tokens_saved (их нужно сохранить вместе с ходом).
+        """
+        dialog = session["messages"]
+        compacted = min(session.get("compacted_messages", 0), len(dialog))
+        summary = session.get("history_summary", "")
+
+        prompt = self.assemble(initial, summary, dialog[compacted:])
+        prompt_tokens = count_message_tokens(prompt)
+        candidate, candidate_summary, candidate_compacted = prompt, summary, compacted
+        while prompt_tokens > self.max_prompt_tokens and len(dialog) - candidate_compacted > self.keep_recent_messages:
+            line = self.summarize(dialog[candidate_compacted])
+            if line:
+                candidate_summary = f"{candidate_summary}\n{line}" if candidate_summary else line
+            candidate_compacted += 1
+            candidate = self.assemble(initial, candidate_summary, dialog[candidate_compacted:])
+            candidate_tokens = count_message_tokens(candidate)
+            # Короткие сообщения в сжатом виде могут стоить дороже — принимаем только выигрыш
+            if candidate_tokens < prompt_tokens:
+                prompt, summary, compacted, prompt_tokens = candidate, candidate_summary, candidate_compacted, candidate_tokens
+
+        saved = count_message_tokens(initial + dialog) - prompt_tokens
+        if compacted > session.get("compacted_messages", 0):
+            print(f"🗜️ Compacted {compacted} messages, prompt {prompt_tokens} tokens (saved {saved})")
+        session["history_summary"] = summary
+        session["compacted_messages"] = compacted
+        session["prompt_tokens"] = prompt_tokens
+        session["tokens_saved"] = session.get("tokens_saved", 0) + max(saved, 0)
+        return prompt
@@ -0,0 +1,92 @@
+"""
+Ограничение параллельности и бюджета токенов для вызовов LLM
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """
+    Грубая оценка токенов запроса до вызова: ~3 символа на токен (русский текст)
+    плюс зарезервированные max_tokens на ответ
+    """
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    return prompt_chars // 3 + 4 * len(messages) + max_tokens
+
+
+class TokenReservation:
+    """Резерв токенов в скользящем окне; после ответа уточняется по фактическому usage"""
+
+    def __init__(self, entry: List[float]):
+        self._entry = entry
+
+    def commit(self, actual_tokens: int):
+        self._entry[1] = actual_tokens
+
+
+class LLMGovernor:
+    """
+    Глобальный регулятор вызовов LLM:
+    - семафор ограничивает число одновременных запросов к провайдеру
+    - бюджет tokens-per-minute (скользящее окно 60 с) не дает упереться в rate limit
+    """
+
+    WINDOW_SECONDS = 60.0
+
+    def __init__(self, max_concurrency: int = 16, tokens_per_minute: int = 0):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._window: deque = deque()  # [timestamp, tokens]
+        self._lock = asyncio.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+
+    def _used_tokens(self, now: float) -> int:
+        while self._window and now - self._window[0][0] >= self.WINDOW_SECONDS:
+            self._window.popleft()
+        return int(sum(entry[1] for entry in self._window))
+
+    async def _reserve(self, tokens: int) -> TokenReservation:
+        """Ждет, пока в окне появится место под tokens, и резервирует его"""
+        if self.tokens_per_minute > 0:
+            # Один запрос больше бюджета целиком все равно должен пройти
+            tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while self.tokens_per_minute > 0:
+                now = time.monotonic()
+                if self._used_tokens(now) + tokens <= self.tokens_per_minute:
+                    break
+                # Спим до освобождения самой старой записи окна
+                await asyncio.sleep(max(0.05, self.WINDOW_SECONDS - (now - self._window[0][0])))
+            entry = [time.monotonic(), tokens]
+            self._window.append(entry)
+        return TokenReservation(entry)
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int):
+        """Контекст одного вызова LLM: бюджет токенов + слот параллельности"""
+        self._waiting += 1
+        try:
+            reservation = await self._reserve(estimated_tokens)
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        try:
+            yield reservation
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "tokens_per_minute_limit": self.tokens_per_minute,
+            "tokens_last_minute": self._used_tokens(time.monotonic()),
+        }
@@ -1,18 +1,32 @@
 """
 SmartBot - AI-ассистент для автоматизированного скрининга кандидатов
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Set
 import uvicorn
+import asyncio
 import os
+import re
+import time
+import uuid
 from datetime import datetime
 import json
 from pathlib import Path
+import httpx
 import openai
-from openai import OpenAI
-import redis
+from openai import AsyncOpenAI
+
+from history_budget import HistoryBudget, count_message_tokens
+from llm_governor import LLMGovernor, estimate_tokens
+from model_router import ModelRouter, empty_usage, merge_usage
+from profile_extractor import ProfileExtractor, render_vacancy_digest
+from response_cache import ResponseCache, response_cache_key
+from session_codec import create_codec
+from session_store import content_hash, create_session_store
+from triage import Triage
 
 # LangChain imports
 from langchain_openai import ChatOpenAI
@@ -40,77 +54,96 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     print("WARNING: OPENAI_API_KEY not found in environment variables")
     
-client = OpenAI(api_key=openai_api_key) if openai_api_key else None
+client = AsyncOpenAI(api_key=openai_api_key) if openai_api_key else None
+
+# Глобальный регулятор вызовов LLM: параллельность и бюджет токенов в минуту (0 — без лимита)
+llm_governor = LLMGovernor(
+    max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+    tokens_per_minute=int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+)
+
+# Бюджет токенов промпта одного хода: старые вопросы/ответы сворачиваются в краткое содержание
+history_budget = HistoryBudget(
+    max_prompt_tokens=int(os.getenv("PROMPT_TOKEN_BUDGET", "4000")),
+    keep_recent_messages=int(os.getenv("PROMPT_KEEP_RECENT_MESSAGES", "4")),
+)
+
+# Быстрый разбор резюме/вакансий без LLM (/parse, /analyze), кеш по хешу текста
+profile_extractor = ProfileExtractor(cache_size=int(os.getenv("PARSE_CACHE_SIZE", "2048")))
+
+# Локальный отбор перед LLM-диалогом: явные несоответствия не тратят токены
+triage = Triage(
+    profile_extractor,
+    reject_below=int(os.getenv("TRIAGE_REJECT_BELOW", "25")),
+    priority_above=int(os.getenv("TRIAGE_PRIORITY_ABOVE", "75")),
+    min_cv_chars=int(os.getenv("TRIAGE_MIN_CV_CHARS", "80")),
+    enabled=os.getenv("TRIAGE_ENABLED", "true").lower() == "true",
+)
+# Сколько LLM-вызовов в среднем занимает скрининг одного кандидата (для оценки экономии токенов)
+TRIAGE_EXPECTED_LLM_CALLS = int(os.getenv("TRIAGE_EXPECTED_LLM_CALLS", "6"))
+TRIAGE_REJECT_REPLY = (
+    "Спасибо за отклик! Мы изучили ваше резюме и передали его работодателю. "
+    "Если ваш опыт подойдет, с вами свяжутся."
+)
+
+# Модель, max_tokens и temperature по стадиям диалога (LLM_<STAGE>_MODEL и т.д.)
+model_router = ModelRouter.from_env()
+
+# Кеш ответов LLM по хешу модели, параметров и сообщений (LRU + общий Redis при LLM_CACHE_REDIS=true)
+response_cache = ResponseCache(
+    stages=[stage.strip() for stage in os.getenv("LLM_CACHE_STAGES", "detailed_analysis").split(",") if stage.strip()],
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("LLM_CACHE_TTL", "3600")),
+    redis_url=os.getenv("REDIS_URL", "redis://localhost:6379") if os.getenv("LLM_CACHE_REDIS", "false").lower() == "true" else None,
+    enabled=os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true",
+)
 
 # Инициализация LangChain LLM
 llm = None
 if openai_api_key:
     try:
+        # Параметры по умолчанию; на каждый вызов call_langchain подставляет параметры стадии
         llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0.7,
+            model=model_router.route("follow_up")["model"],
+            temperature=model_router.route("follow_up")["temperature"],
             openai_api_key=openai_api_key
         )
         print("✅ LangChain ChatOpenAI initialized")
     except Exception as e:
         print(f"❌ Failed to initialize LangChain: {e}")
 
-# Инициализация Redis
+# Хранилище сессий: Redis (асинхронный клиент с пулом соединений), память процесса или файл-снимок
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-try:
-    redis_client = redis.from_url(redis_url, decode_responses=True)
-    redis_client.ping()
-    print(f"✅ Connected to Redis at {redis_url}")
-except Exception as e:
-    print(f"❌ Failed to connect to Redis: {e}")
-    redis_client = None
-
-# Функции для работы с сессиями через Redis
-def load_session_from_redis(session_id: str) -> Optional[Dict[str, Any]]:
-    """Получить сессию из Redis"""
-    if not redis_client:
-        return None
-    try:
-        session_data = redis_client.get(f"session:{session_id}")
-        if session_data:
-            return json.loads(session_data)
-        return None
-    except Exception as e:
-        print(f"Error getting session {session_id}: {e}")
-        return None
-
-def save_session_to_redis(session_id: str, session_data: Dict[str, Any], expire_seconds: int = 86400):
-    """Сохранить сессию в Redis (по умолчанию истекает через 24 часа)"""
-    if not redis_client:
-        return
-    try:
-        redis_client.setex(
-            f"session:{session_id}",
-            expire_seconds,
-            json.dumps(session_data, ensure_ascii=False)
-        )
-    except Exception as e:
-        print(f"Error saving session {session_id}: {e}")
+session_store_options = {
+    "max_connections": int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+    "socket_timeout": float(os.getenv("REDIS_SOCKET_TIMEOUT", "2.0")),
+    "codec": create_codec(
+        os.getenv("SESSION_CODEC", "msgpack"),
+        compress_threshold=int(os.getenv("SESSION_COMPRESS_THRESHOLD", "1024")),
+    ),
+    "max_sessions": int(os.getenv("SESSION_MAX_IN_MEMORY", "10000")),
+    "snapshot_path": os.getenv("SESSION_SNAPSHOT_PATH", "sessions_snapshot.json"),
+    "snapshot_interval": float(os.getenv("SESSION_SNAPSHOT_INTERVAL", "30")),
+}
+session_store = create_session_store(os.getenv("SESSION_BACKEND", "redis"), redis_url, **session_store_options)
+# Куда переключаться, если основное хранилище недоступно при старте (none — не переключаться)
+SESSION_FALLBACK_BACKEND = os.getenv("SESSION_FALLBACK_BACKEND", "memory")
 
-def delete_session_from_redis(session_id: str):
-    """Удалить сессию из Redis"""
-    if not redis_client:
-        return
-    try:
-        redis_client.delete(f"session:{session_id}")
-    except Exception as e:
-        print(f"Error deleting session {session_id}: {e}")
+@app.on_event("startup")
+async def connect_session_store():
+    global session_store
+    if await session_store.connect():
+        # Досоздаем индекс для сессий, созданных до его появления, не блокируя старт
+        asyncio.create_task(session_store.rebuild_index())
+    elif SESSION_FALLBACK_BACKEND != "none":
+        # Без хранилища каждый /chat/turn отвечал бы 404 и скрининг начинался бы заново
+        print(f"⚠️ Session store '{session_store.backend}' unavailable, using '{SESSION_FALLBACK_BACKEND}' backend")
+        session_store = create_session_store(SESSION_FALLBACK_BACKEND, redis_url, **session_store_options)
+        await session_store.connect()
 
-def get_all_session_ids() -> List[str]:
-    """Получить все ID сессий из Redis"""
-    if not redis_client:
-        return []
-    try:
-        keys = redis_client.keys("session:*")
-        return [key.replace("session:", "") for key in keys]
-    except Exception as e:
-        print(f"Error getting session IDs: {e}")
-        return []
+@app.on_event("shutdown")
+async def close_session_store():
+    await session_store.close()
 
 def get_langchain_memory(session_id: str) -> RedisChatMessageHistory:
     """Получить LangChain memory для сессии из Redis"""
@@ -172,18 +205,57 @@ reasons: ["причина 1", "причина 2", ...]
 — Задай минимум 2-3 важных вопроса, даже если первый ответ показывает несоответствие.
 — После 4-8 вопросов: отправь вежливое сообщение "Спасибо за отклик! Мы свяжемся с вами в ближайшее время." и добавь [RESULT] с оценкой в ТОМ ЖЕ сообщении."""
 
+# Исходный запрос: вакансия, затем резюме, затем неизменная инструкция.
+# Вместе с SYSTEM_PROMPT образует префикс, одинаковый байт в байт для всех ходов сессии
+# (а SYSTEM_PROMPT + вакансия — для всех кандидатов на вакансию), что дает попадания
+# в кеш промптов провайдера. Все, что меняется от хода к ходу, идет после него.
+INITIAL_MESSAGE_TEMPLATE = """<JOB_DESCRIPTION>
+{vacancy_text}
+</JOB_DESCRIPTION>
+
+<CANDIDATE_RESUME>
+{cv_text}
+</CANDIDATE_RESUME>
+
+Проанализируй вакансию и резюме. Если информации достаточно для оценки, сразу выдай [RESULT]. Если нужны уточнения, задай ОДИН самый важный вопрос."""
+
+NO_RESUME_TEXT = "Резюме не предоставлено. Нужно узнать информацию о кандидате."
+
+# Инструкция детального анализа (неизменная часть промпта; данные кандидата — в сообщении после нее)
+DETAILED_ANALYSIS_PROMPT = """Ты HR-аналитик, создающий детальные отчеты о кандидатах.
+
+На основе диалога с кандидатом, создай детальный анализ в формате:
+
+**СИЛЬНЫЕ СТОРОНЫ:**
+- [перечисли 3-5 сильных сторон кандидата с примерами из ответов]
+
+**ОБЛАСТИ ДЛЯ РАЗВИТИЯ:**
+- [перечисли 2-3 области, где кандидат может улучшиться]
+
+**СООТВЕТСТВИЕ ВАКАНСИИ:**
+- Ключевые навыки: [анализ соответствия требуемым навыкам]
+- Опыт работы: [оценка релевантного опыта]
+- Мотивация: [оценка заинтересованности кандидата]
+
+**РЕКОМЕНДАЦИИ:**
+[2-3 конкретные рекомендации для работодателя]
+
+**ОБЩАЯ ОЦЕНКА:** [оценка соответствия из данных]%"""
+
 # ===== LANGCHAIN PROMPT TEMPLATES =====
 
-# Prompt template для начала диалога
+# Prompt template для начала диалога (та же раскладка, что и у прямых вызовов OpenAI)
 START_CHAT_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", SYSTEM_PROMPT + "\n\n<JOB_DESCRIPTION>\n{vacancy_text}\n</JOB_DESCRIPTION>\n\n<CANDIDATE_RESUME>\n{cv_text}\n</CANDIDATE_RESUME>"),
-    ("human", "Я хочу откликнуться на эту вакансию. Готов ответить на ваши вопросы.")
+    ("system", SYSTEM_PROMPT),
+    ("human", INITIAL_MESSAGE_TEMPLATE)
 ])
 
-# Prompt template для продолжения диалога
+# Prompt template для продолжения диалога: счетчик вопросов — в конце, после стабильного префикса
 CONTINUE_CHAT_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", SYSTEM_PROMPT + "\n\n<JOB_DESCRIPTION>\n{vacancy_text}\n</JOB_DESCRIPTION>\n\n<CANDIDATE_RESUME>\n{cv_text}\n</CANDIDATE_RESUME>\n\nВопросов задано: {question_count}/8"),
+    ("system", SYSTEM_PROMPT),
+    ("human", INITIAL_MESSAGE_TEMPLATE),
     MessagesPlaceholder(variable_name="chat_history"),
+    ("system", "Вопросов задано: {question_count}/8"),
     ("human", "{user_message}")
 ])
 
@@ -192,13 +264,75 @@ CONTINUE_CHAT_PROMPT = ChatPromptTemplate.from_messages([
 class ChatStartRequest(BaseModel):
     """Запрос на начало диалога с кандидатом"""
     vacancy_text: str = Field(..., description="Описание вакансии")
+    vacancy_digest: Optional[Dict[str, Any]] = Field(None, description="Дайджест вакансии — в промпт идет вместо полного текста")
     cv_text: Optional[str] = Field(None, description="Текст резюме кандидата (если есть)")
     session_id: Optional[str] = Field(None, description="ID сессии (если нужно продолжить)")
+    analysis_callback_url: Optional[str] = Field(None, description="URL, куда отправить детальный анализ, когда он будет готов")
 
 class ChatTurnRequest(BaseModel):
     """Запрос на продолжение диалога"""
     session_id: str = Field(..., description="ID сессии")
     message_from_candidate: str = Field(..., description="Сообщение от кандидата")
+    client_message_id: Optional[str] = Field(
+        None, max_length=128, description="ID сообщения на клиенте: повтор с тем же ID получит тот же ответ"
+    )
+
+class ParseRequest(BaseModel):
+    """Запрос на разбор резюме или вакансии"""
+    text: str = Field(..., min_length=1, description="Текст резюме или вакансии")
+    kind: str = Field(..., pattern="^(cv|vacancy)$", description="cv — резюме, vacancy — вакансия")
+
+class AnalyzeRequest(BaseModel):
+    """Запрос на быструю оценку соответствия резюме и вакансии"""
+    cv_text: str = Field(..., min_length=1, description="Текст резюме")
+    vacancy_text: str = Field(..., min_length=1, description="Описание вакансии")
+    session_id: Optional[str] = Field(None, description="ID сессии (для связи с диалогом)")
+
+class ScreeningCandidate(BaseModel):
+    """Кандидат в пакетном скрининге"""
+    candidate_id: str = Field(..., description="ID кандидата у вызывающей стороны (например, ID заявки)")
+    cv_text: Optional[str] = Field(None, description="Текст резюме")
+    session_id: Optional[str] = Field(None, description="ID сессии (по умолчанию генерируется)")
+    analysis_callback_url: Optional[str] = Field(None, description="URL для детального анализа")
+
+class BatchScreeningRequest(BaseModel):
+    """Пакетный скрининг: одна вакансия, много резюме"""
+    vacancy_text: str = Field(..., description="Описание вакансии")
+    vacancy_digest: Optional[Dict[str, Any]] = Field(None, description="Дайджест вакансии — в промпт идет вместо полного текста")
+    candidates: List[ScreeningCandidate] = Field(..., min_length=1, max_length=1000)
+    concurrency: int = Field(8, ge=1, le=32, description="Сколько кандидатов обрабатывать одновременно (online)")
+    mode: str = Field("online", pattern="^(online|offline)$", description="online — поток результатов, offline — OpenAI Batch API")
+
+class ImportedMessage(BaseModel):
+    """Сообщение восстановленного диалога"""
+    role: str = Field(..., pattern="^(user|assistant)$", description="user — кандидат, assistant — бот")
+    content: str
+
+class ImportedSession(BaseModel):
+    """Диалог, восстановленный из внешней истории (например, сообщений заявки в backend)"""
+    session_id: str
+    vacancy_text: str = Field(..., description="Описание вакансии")
+    vacancy_digest: Optional[Dict[str, Any]] = Field(None, description="Дайджест вакансии — в промпт идет вместо полного текста")
+    cv_text: Optional[str] = None
+    messages: List[ImportedMessage] = Field(..., min_length=1, description="Диалог по порядку, начиная с первого ответа бота")
+    is_completed: bool = False
+    relevance_percent: Optional[int] = None
+    summary: Optional[str] = None
+    reasons: List[str] = []
+    rejection_tags: List[str] = []
+    detailed_analysis: Optional[str] = None
+    analysis_callback_url: Optional[str] = None
+
+class SessionImportRequest(BaseModel):
+    """Пакетное восстановление сессий"""
+    sessions: List[ImportedSession] = Field(..., min_length=1, max_length=500)
+    overwrite: bool = Field(False, description="Перезаписать существующие сессии (по умолчанию они пропускаются)")
+
+class SessionRenameRequest(BaseModel):
+    """Перенос сессии под другой ID"""
+    target_session_id: str
+    overwrite: bool = Field(False, description="Заменить существующую сессию с целевым ID")
+    analysis_callback_url: Optional[str] = Field(None, description="URL для детального анализа перенесенной сессии")
 
 class ChatResponse(BaseModel):
     """Ответ AI-ассистента"""
@@ -210,9 +344,12 @@ class ChatResponse(BaseModel):
     dialog_stage: str  # "questioning", "completed"
     is_completed: bool
     rejection_tags: List[str] = []  # Теги причин отклонения
-    detailed_analysis: Optional[str] = None  # Детальный анализ (только при завершении)
+    detailed_analysis: Optional[str] = None  # Детальный анализ (готовится в фоне после завершения)
+    analysis_status: Optional[str] = None  # pending, ready — статус детального анализа
     suggest_alternative_vacancy: bool = False  # Предложить альтернативную вакансию
     alternative_vacancy_reason: Optional[str] = None  # Причина предложения
+    triage: Optional[Dict[str, Any]] = None  # Локальная предварительная оценка (verdict, score, reasons)
+    duplicate: bool = False  # Повтор уже обработанного сообщения: ответ взят из сохраненного хода
 
 
 # ===== УТИЛИТЫ =====
@@ -271,34 +408,156 @@ def extract_result_from_message(message: str) -> Optional[Dict[str, Any]]:
         print(f"Error parsing [RESULT]: {e}")
         return None
 
-def call_openai(messages: List[Dict[str, str]], max_tokens: int = 500) -> str:
+# Попадания в кеш промптов провайдера (usage.prompt_tokens_details.cached_tokens)
+prompt_cache_stats = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+def record_prompt_cache(prompt_tokens: int, cached_tokens: int):
+    """Учитывает долю закешированных токенов промпта одного вызова"""
+    prompt_cache_stats["calls"] += 1
+    prompt_cache_stats["prompt_tokens"] += prompt_tokens
+    prompt_cache_stats["cached_tokens"] += cached_tokens
+    ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+    print(f"💾 Prompt cache: {cached_tokens}/{prompt_tokens} prompt tokens cached ({ratio:.0%})")
+
+def record_usage_cache(usage: Any) -> int:
+    """Учитывает usage вызова OpenAI SDK; возвращает число закешированных токенов промпта"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) or 0
+    record_prompt_cache(usage.prompt_tokens or 0, cached_tokens)
+    return cached_tokens
+
+def cache_request_options(cache_key: Optional[str]) -> Dict[str, Any]:
+    # prompt_cache_key направляет запросы с общим префиксом на один кеш провайдера
+    return {"extra_body": {"prompt_cache_key": cache_key}} if cache_key else {}
+
+async def create_completion(
+    messages: List[Dict[str, str]],
+    stage: str = "follow_up",
+    cache_key: Optional[str] = None,
+    session_usage: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Асинхронный вызов Chat Completions через регулятор параллельности и бюджета токенов.
+    Для кешируемых стадий одинаковый запрос (модель, параметры, сообщения) берется из response_cache.
+    session_usage — сводка токенов и стоимости сессии, дополняется этим вызовом.
+    """
+    route = model_router.route(stage)
+    response_key = response_cache_key(route, messages)
+    cached = await response_cache.get(stage, response_key)
+    if cached is not None:
+        return cached
+    
+    async with llm_governor.slot(estimate_tokens(messages, route["max_tokens"])) as reservation:
+        with model_router.trace(stage, session_usage) as trace:
+            response = await client.chat.completions.create(
+                messages=messages,
+                **route,
+                **cache_request_options(cache_key),
+            )
+            if response.usage:
+                reservation.commit(response.usage.total_tokens)
+                cached_tokens = record_usage_cache(response.usage)
+                trace.usage(response.usage.prompt_tokens, response.usage.completion_tokens, cached_tokens)
+        content = response.choices[0].message.content
+        await response_cache.set(
+            stage, response_key, content, time.perf_counter() - trace.started,
+            response.usage.total_tokens if response.usage else 0
+        )
+        return content
+
+async def call_openai(
+    messages: List[Dict[str, str]],
+    stage: str = "follow_up",
+    cache_key: Optional[str] = None,
+    session_usage: Optional[Dict[str, Any]] = None
+) -> str:
     """Вызов OpenAI API (legacy метод, используется как fallback)"""
     if not client:
         # Fallback если нет ключа
         return "Спасибо за ответ! Расскажите еще что-нибудь о себе."
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Используем более дешевую модель
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=0.7,
-        )
-        return response.choices[0].message.content
+        # Модель и лимиты выбирает model_router по стадии
+        return await create_completion(messages, stage=stage, cache_key=cache_key, session_usage=session_usage)
     except Exception as e:
         print(f"OpenAI API error: {e}")
         raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
 
-def call_langchain(
+async def stream_openai(
+    messages: List[Dict[str, str]],
+    stage: str = "follow_up",
+    cache_key: Optional[str] = None,
+    session_usage: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """Потоковый вызов OpenAI API: отдает фрагменты ответа по мере генерации"""
+    if not client:
+        # Fallback если нет ключа
+        yield "Спасибо за ответ! Расскажите еще что-нибудь о себе."
+        return
+    
+    route = model_router.route(stage)
+    response_key = response_cache_key(route, messages)
+    cached = await response_cache.get(stage, response_key)
+    if cached is not None:
+        yield cached
+        return
+    
+    content, tokens = "", 0
+    async with llm_governor.slot(estimate_tokens(messages, route["max_tokens"])) as reservation:
+        with model_router.trace(stage, session_usage) as trace:
+            stream = await client.chat.completions.create(
+                messages=messages,
+                **route,
+                stream=True,
+                stream_options={"include_usage": True},
+                **cache_request_options(cache_key),
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    reservation.commit(chunk.usage.total_tokens)
+                    cached_tokens = record_usage_cache(chunk.usage)
+                    trace.usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens, cached_tokens)
+                    tokens = chunk.usage.total_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    trace.first_token()
+                    content += chunk.choices[0].delta.content
+                    yield chunk.choices[0].delta.content
+    # Только полностью полученный ответ (при обрыве потока сюда не доходим)
+    await response_cache.set(stage, response_key, content, time.perf_counter() - trace.started, tokens)
+
+RESULT_MARKER = "[RESULT]"
+
+def visible_prefix_length(text: str) -> int:
+    """
+    Длина части ответа, которую можно показать кандидату.
+    Все начиная с [RESULT] (и незавершенный префикс маркера в конце) придерживается.
+    """
+    marker_pos = text.find(RESULT_MARKER)
+    if marker_pos != -1:
+        return marker_pos
+    for size in range(min(len(RESULT_MARKER) - 1, len(text)), 0, -1):
+        if text.endswith(RESULT_MARKER[:size]):
+            return len(text) - size
+    return len(text)
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Форматирует событие Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def call_langchain(
     prompt_template: ChatPromptTemplate,
     variables: Dict[str, Any],
-    chat_history: Optional[List] = None
+    chat_history: Optional[List] = None,
+    stage: str = "follow_up",
+    session_usage: Optional[Dict[str, Any]] = None
 ) -> str:
     """Вызов LLM через LangChain с поддержкой chat history"""
     if not llm:
         # Fallback на старый метод
         print("⚠️ LangChain not available, using legacy OpenAI client")
-        return call_openai([{"role": "system", "content": str(variables)}])
+        return await call_openai([{"role": "system", "content": str(variables)}], stage=stage, session_usage=session_usage)
     
     try:
         # Подготавливаем переменные
@@ -308,14 +567,28 @@ def call_langchain(
         # Форматируем промпт
         messages = prompt_template.format_messages(**variables)
         
-        # Вызываем LLM
-        response = llm.invoke(messages)
-        
+        # Вызываем LLM с параметрами стадии
+        route = model_router.route(stage)
+        response_key = response_cache_key(route, [{"role": m.type, "content": str(m.content)} for m in messages])
+        cached = await response_cache.get(stage, response_key)
+        if cached is not None:
+            return cached
+        async with llm_governor.slot(estimate_tokens([{"content": str(m.content)} for m in messages], route["max_tokens"])):
+            with model_router.trace(stage, session_usage) as trace:
+                response = await llm.bind(**route).ainvoke(messages)
+                usage = (response.response_metadata or {}).get("token_usage") or {}
+                if usage:
+                    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+                    record_prompt_cache(usage.get("prompt_tokens", 0), cached_tokens)
+                    trace.usage(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), cached_tokens)
+        await response_cache.set(
+            stage, response_key, response.content, time.perf_counter() - trace.started, usage.get("total_tokens", 0)
+        )
         return response.content
     except Exception as e:
         print(f"❌ LangChain Error: {e}")
         # Fallback на старый метод
-        return call_openai([{"role": "system", "content": str(variables)}])
+        return await call_openai([{"role": "system", "content": str(variables)}], stage=stage, session_usage=session_usage)
 
 
 # ===== ЭНДПОИНТЫ =====
@@ -333,9 +606,93 @@ async def root():
 async def health():
     return {
         "status": "healthy",
-        "openai_configured": client is not None
+        "openai_configured": client is not None,
+        "session_store": session_store.stats(),
+        "llm_governor": llm_governor.stats(),
+        "model_router": model_router.stats(),
+        "response_cache": response_cache.stats(),
+        "parse_cache": profile_extractor.stats(),
+        "triage": triage.stats(),
+        "turns": turn_stats,
+        "prompt_cache": {
+            **prompt_cache_stats,
+            "cached_ratio": round(prompt_cache_stats["cached_tokens"] / prompt_cache_stats["prompt_tokens"], 3)
+            if prompt_cache_stats["prompt_tokens"] else 0.0
+        }
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Метрики LLM-вызовов в формате Prometheus: вызовы, ошибки, токены, стоимость и задержки по стадиям"""
+    return PlainTextResponse(model_router.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.post("/parse")
+async def parse_text(request: ParseRequest):
+    """Структурированные данные резюме/вакансии: навыки, опыт, город, зарплата, языки, грейд (без LLM)"""
+    return profile_extractor.parse(request.text, request.kind)
+
+@app.post("/analyze")
+async def analyze(request: AnalyzeRequest):
+    """Быстрая оценка соответствия по пересечению навыков, опыту и городу (без LLM)"""
+    analysis = profile_extractor.analyze(request.cv_text, request.vacancy_text)
+    matched, missing = analysis["matched_skills"], analysis["missing_skills"]
+    
+    reasons = []
+    if matched:
+        reasons.append(f"Совпадают навыки: {', '.join(matched)}")
+    if missing:
+        reasons.append(f"Нет в резюме: {', '.join(missing)}")
+    if analysis["experience_gap"]:
+        reasons.append(f"Опыта меньше требуемого на {analysis['experience_gap']:g} г.")
+    if analysis["location_mismatch"]:
+        reasons.append(f"Город кандидата ({analysis['cv']['city']}) не совпадает с городом вакансии ({analysis['vacancy']['city']})")
+    
+    followup_questions = [f"Есть ли у вас опыт работы с {skill}?" for skill in missing[:3]]
+    if analysis["location_mismatch"]:
+        followup_questions.append(f"Готовы ли вы к переезду в {analysis['vacancy']['city']}?")
+    
+    return {
+        "session_id": request.session_id or f"analyze_{content_hash(request.cv_text + request.vacancy_text)[:16]}",
+        "relevance_percent": analysis["relevance_percent"],
+        "reasons": reasons,
+        "summary_for_employer": f"Соответствие {analysis['relevance_percent']}%: совпало {len(matched)} из {len(matched) + len(missing)} навыков вакансии",
+        "mismatches": {
+            "missing_skills": missing,
+            "experience_gap_years": analysis["experience_gap"],
+            "location_mismatch": analysis["location_mismatch"]
+        },
+        "followup_questions": followup_questions,
+        "matched_skills": matched,
+        "cv": analysis["cv"],
+        "vacancy": analysis["vacancy"]
+    }
+
+def build_initial_messages(vacancy_text: str, cv_text: Optional[str]) -> List[Dict[str, str]]:
+    """Стабильный префикс промпта: системный промпт и исходный запрос с вакансией и резюме (в сессии не хранятся)"""
+    initial_message = INITIAL_MESSAGE_TEMPLATE.format(
+        vacancy_text=vacancy_text.strip(),
+        cv_text=(cv_text or "").strip() or NO_RESUME_TEXT,
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": initial_message}
+    ]
+
+def vacancy_prompt_text(vacancy_text: str, vacancy_digest: Optional[Dict[str, Any]]) -> str:
+    """Текст вакансии для промпта и сессии: компактный дайджест, если он передан"""
+    if vacancy_digest:
+        return render_vacancy_digest(vacancy_digest)
+    return vacancy_text.strip()
+
+def prompt_cache_key(vacancy_text: str) -> str:
+    """Ключ маршрутизации кеша промптов: запросы по одной вакансии делят префикс"""
+    return f"vacancy-{content_hash(vacancy_text.strip())[:16]}"
+
+def build_prompt_messages(session: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Контекст для LLM: начальные сообщения + диалог из сессии в пределах бюджета токенов"""
+    initial = build_initial_messages(session.get("vacancy_text") or "", session.get("cv_text"))
+    return history_budget.build(initial, session)
+
 @app.post("/chat/start", response_model=ChatResponse)
 async def start_chat(request: ChatStartRequest):
     """
@@ -349,24 +706,38 @@ async def start_chat(request: ChatStartRequest):
     session_id = request.session_id or f"session_{datetime.utcnow().timestamp()}"
     
     # Формируем начальный контекст
-    initial_message = f"""<JOB_DESCRIPTION>
-{request.vacancy_text}
-</JOB_DESCRIPTION>
-
-<CANDIDATE_RESUME>
-{request.cv_text or "Резюме не предоставлено. Нужно узнать информацию о кандидате."}
-</CANDIDATE_RESUME>
-
-Проанализируй вакансию и резюме. Если информации достаточно для оценки, сразу выдай [RESULT]. Если нужны уточнения, задай ОДИН самый важный вопрос."""
+    vacancy_text = vacancy_prompt_text(request.vacancy_text, request.vacancy_digest)
     
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": initial_message}
-    ]
+    # Явное несоответствие — предварительная оценка без LLM
+    decision = triage.assess(request.cv_text, vacancy_text)
+    if decision["verdict"] == "reject":
+        return await open_triaged_session(session_id, vacancy_text, request.cv_text, decision, request.analysis_callback_url)
+    
+    messages = build_initial_messages(vacancy_text, request.cv_text)
     
     # Вызываем OpenAI
-    ai_response = call_openai(messages, max_tokens=800)
+    llm_usage = empty_usage()
+    ai_response = await call_openai(
+        messages, stage="first_question", cache_key=prompt_cache_key(vacancy_text), session_usage=llm_usage
+    )
     
+    return await open_session(
+        session_id, vacancy_text, request.cv_text, ai_response, request.analysis_callback_url, decision, llm_usage
+    )
+
+async def open_session(
+    session_id: str,
+    vacancy_text: str,
+    cv_text: Optional[str],
+    ai_response: str,
+    analysis_callback_url: Optional[str] = None,
+    triage_decision: Optional[Dict[str, Any]] = None,
+    llm_usage: Optional[Dict[str, Any]] = None
+) -> ChatResponse:
+    """
+    Разбирает первый ответ LLM и создает сессию (общая часть /chat/start и пакетного скрининга).
+    llm_usage — токены и стоимость первого вызова (сводка сессии)
+    """
     # Проверяем, есть ли [RESULT] в ответе
     result_data = extract_result_from_message(ai_response)
     
@@ -391,22 +762,27 @@ async def start_chat(request: ChatStartRequest):
         summary = "Идет уточнение деталей"
         reasons = ["Требуется дополнительная информация"]
     
-    # Сохраняем сессию в Redis
-    messages.append({"role": "assistant", "content": ai_response})
+    # Сохраняем сессию в Redis: тексты уходят в общие blob, в истории только диалог
     session_data = {
         "session_id": session_id,
-        "vacancy_text": request.vacancy_text,
-        "cv_text": request.cv_text,
-        "messages": messages,
+        "vacancy_text": vacancy_text,
+        "cv_text": cv_text,
+        "messages": [{"role": "assistant", "content": ai_response}],
         "question_count": 0,
         "is_completed": is_completed,
         "relevance_percent": relevance_percent,
         "summary": summary,
         "reasons": reasons,
+        "analysis_callback_url": analysis_callback_url,
+        "analysis_status": "pending" if is_completed else None,
+        "triage": triage_decision,
+        "llm_usage": llm_usage or empty_usage(),
         "created_at": datetime.utcnow().isoformat(),
         "updated_at": datetime.utcnow().isoformat()
     }
-    save_session_to_redis(session_id, session_data)
+    await session_store.create(session_id, session_data)
+    if is_completed:
+        schedule_detailed_analysis(session_id, session_data)
     
     return ChatResponse(
         session_id=session_id,
@@ -415,57 +791,220 @@ async def start_chat(request: ChatStartRequest):
         reasons=reasons,
         summary_for_employer=summary,
         dialog_stage=dialog_stage,
-        is_completed=is_completed
+        is_completed=is_completed,
+        analysis_status="pending" if is_completed else None,
+        triage=triage_decision
     )
 
-@app.post("/chat/turn", response_model=ChatResponse)
-async def chat_turn(request: ChatTurnRequest):
-    """
-    Продолжает диалог с кандидатом
-    
-    1. Получает ответ кандидата
-    2. Анализирует и задает следующий вопрос или завершает диалог
-    3. Обновляет оценку релевантности
-    """
-    # Проверяем существование сессии в Redis
-    session = load_session_from_redis(request.session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+async def open_triaged_session(
+    session_id: str,
+    vacancy_text: str,
+    cv_text: Optional[str],
+    decision: Dict[str, Any],
+    analysis_callback_url: Optional[str] = None
+) -> ChatResponse:
+    """Завершенная сессия по локальной оценке triage — без вызовов LLM"""
+    reasons = decision["reasons"] or ["Резюме не соответствует ключевым требованиям вакансии"]
+    summary = f"Предварительная оценка {decision['score']}% без диалога: {reasons[0]}"
+    detailed_analysis = "\n".join(
+        ["**ПРЕДВАРИТЕЛЬНАЯ ОЦЕНКА (без диалога с кандидатом):**", f"Соответствие: {decision['score']}%"]
+        + [f"- {reason}" for reason in reasons]
+    )
+    now = datetime.utcnow().isoformat()
+    session_data = {
+        "session_id": session_id,
+        "vacancy_text": vacancy_text,
+        "cv_text": cv_text,
+        "messages": [{"role": "assistant", "content": TRIAGE_REJECT_REPLY}],
+        "question_count": 0,
+        "is_completed": True,
+        "relevance_percent": decision["score"],
+        "summary": summary,
+        "reasons": reasons,
+        "rejection_tags": decision["rejection_tags"],
+        "detailed_analysis": detailed_analysis,
+        "analysis_callback_url": analysis_callback_url,
+        "analysis_status": "ready",
+        "triage": decision,
+        "llm_usage": empty_usage(),
+        "created_at": now,
+        "updated_at": now
+    }
+    await session_store.create(session_id, session_data)
     
-    # Проверяем, не завершен ли уже диалог
-    if session.get("is_completed", False):
-        return ChatResponse(
-            session_id=request.session_id,
-            bot_reply="Спасибо! Анализ уже завершен.",
-            relevance_percent=session["relevance_percent"],
-            reasons=session["reasons"],
-            summary_for_employer=session["summary"],
-            dialog_stage="completed",
-            is_completed=True
-        )
+    saved = count_message_tokens(build_initial_messages(vacancy_text, cv_text)) * TRIAGE_EXPECTED_LLM_CALLS
+    triage.record_saved(saved)
+    print(f"🚦 Triage rejected session {session_id}: {decision['score']}% (~{saved} tokens saved)")
     
-    # Добавляем сообщение кандидата
-    session["messages"].append({
+    return ChatResponse(
+        session_id=session_id,
+        bot_reply=TRIAGE_REJECT_REPLY,
+        relevance_percent=decision["score"],
+        reasons=reasons,
+        summary_for_employer=summary,
+        dialog_stage="completed",
+        is_completed=True,
+        rejection_tags=decision["rejection_tags"],
+        detailed_analysis=detailed_analysis,
+        analysis_status="ready",
+        triage=decision
+    )
+
+def completed_response(session_id: str, session: Dict[str, Any]) -> ChatResponse:
+    """Ответ для уже завершенного диалога"""
+    return ChatResponse(
+        session_id=session_id,
+        bot_reply="Спасибо! Анализ уже завершен.",
+        relevance_percent=session["relevance_percent"],
+        reasons=session["reasons"],
+        summary_for_employer=session["summary"],
+        dialog_stage="completed",
+        is_completed=True,
+        rejection_tags=session.get("rejection_tags", []),
+        detailed_analysis=session.get("detailed_analysis"),
+        analysis_status=session.get("analysis_status")
+    )
+
+# После стольких ответов кандидата диалог завершается принудительно
+FORCE_COMPLETION_AFTER = 8
+
+def session_llm_usage(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Сводка LLM-вызовов сессии (у сессий, созданных до ее появления, — с нуля)"""
+    if not session.get("llm_usage"):
+        session["llm_usage"] = empty_usage()
+    return session["llm_usage"]
+
+def turn_stage(session: Dict[str, Any]) -> str:
+    """Стадия хода для model_router (после prepare_turn)"""
+    return "forced_completion" if session.get("question_count", 0) >= FORCE_COMPLETION_AFTER else "follow_up"
+
+def prepare_turn(session: Dict[str, Any], message_from_candidate: str) -> List[Dict[str, str]]:
+    """
+    Добавляет сообщение кандидата в сессию перед вызовом LLM.
+    Возвращает новые сообщения хода (их нужно дописать в хранилище).
+    """
+    new_messages = [{
         "role": "user",
-        "content": request.message_from_candidate
-    })
+        "content": message_from_candidate
+    }]
     session["question_count"] = session.get("question_count", 0) + 1
     
     # Проверяем, не достигли ли лимита вопросов
-    if session["question_count"] >= 8:
+    if session["question_count"] >= FORCE_COMPLETION_AFTER:
         # Принудительно завершаем диалог
         force_completion_msg = "Кандидат ответил на все вопросы. Теперь ОБЯЗАТЕЛЬНО выдай [RESULT] с финальной оценкой."
-        session["messages"].append({
+        new_messages.append({
             "role": "system",
             "content": force_completion_msg
         })
     
-    # Вызываем OpenAI
-    ai_response = call_openai(session["messages"], max_tokens=800)
+    session["messages"].extend(new_messages)
+    return new_messages
+
+# Фоновые задачи детального анализа: session_id -> задача (ссылка не дает задаче собраться GC)
+analysis_tasks: Dict[str, asyncio.Task] = {}
+# Сессии, перенесенные под другой ID во время генерации анализа: старый ID -> новый ID
+analysis_renames: Dict[str, str] = {}
+# Задачи, которые уже сохранили анализ и отправляют callback
+analysis_deliveries: Set[asyncio.Task] = set()
+
+def schedule_detailed_analysis(session_id: str, session: Dict[str, Any]):
+    """Запускает генерацию детального анализа в фоне, если она еще не идет"""
+    if session_id in analysis_tasks:
+        return
+    task = asyncio.create_task(generate_detailed_analysis(session_id, dict(session)))
+    analysis_tasks[session_id] = task
+    task.add_done_callback(forget_detailed_analysis)
+
+def forget_detailed_analysis(task: asyncio.Task):
+    """Снимает задачу анализа с учета (после rename она числится под новым ID)"""
+    for key in [key for key, running in analysis_tasks.items() if running is task]:
+        del analysis_tasks[key]
+    analysis_deliveries.discard(task)
+
+def rekey_detailed_analysis(session_id: str, target_session_id: str) -> bool:
+    """Идущая генерация анализа сохранит результат под новым ID сессии. False — генерация не идет"""
+    task = analysis_tasks.pop(session_id, None)
+    if task is None:
+        return False
+    analysis_tasks[target_session_id] = task
+    analysis_renames[session_id] = target_session_id
+    return True
+
+async def generate_detailed_analysis(session_id: str, session: Dict[str, Any]):
+    """Генерирует детальный анализ, сохраняет его в сессию и отправляет в backend (если задан callback)"""
+    relevance_percent = session.get("relevance_percent", 0)
+    summary = session.get("summary", "")
+    reasons = session.get("reasons", [])
+    print(f"📊 Generating detailed analysis for {session_id}...")
+    # Данные кандидата — после неизменной инструкции
+    detailed_prompt = f"""Оценка соответствия: {relevance_percent}%
+
+Вакансия: {(session.get('vacancy_text') or '')[:500]}
+Резюме: {(session.get('cv_text') or '')[:500]}
+Ответы кандидата: {' '.join([m['content'] for m in session['messages'] if m['role'] == 'user'][:5])}
+"""
     
+    analysis_usage = empty_usage()
+    try:
+        detailed_response = await create_completion(
+            messages=[
+                {"role": "system", "content": DETAILED_ANALYSIS_PROMPT},
+                {"role": "user", "content": detailed_prompt}
+            ],
+            stage="detailed_analysis",
+            session_usage=analysis_usage
+        )
+        detailed_analysis = detailed_response.strip()
+        print(f"✅ Detailed analysis generated: {len(detailed_analysis)} chars")
+    except Exception as e:
+        print(f"❌ Error generating detailed analysis: {e}")
+        detailed_analysis = f"**КРАТКИЙ АНАЛИЗ:** {summary}\n\n**РЕЛЕВАНТНОСТЬ:** {relevance_percent}%\n\n**ПРИЧИНЫ:** {', '.join(reasons)}"
+    
+    async def save_analysis(stored: Dict[str, Any]):
+        stored["detailed_analysis"] = detailed_analysis
+        stored["analysis_status"] = "ready"
+        stored["llm_usage"] = merge_usage(stored.get("llm_usage"), analysis_usage)
+    # Пока шла генерация, сессию могли перенести под другой ID (POST /sessions/{id}/rename)
+    session_id = analysis_renames.pop(session_id, session_id)
+    stored = await session_store.update(session_id, save_analysis)
+    # Анализ сохранен: rename больше не должен перенаправлять эту задачу
+    task = asyncio.current_task()
+    forget_detailed_analysis(task)
+    analysis_deliveries.add(task)
+    
+    # Callback берем из сохраненной сессии: при переносе он мог быть задан заново
+    callback_url = stored.get("analysis_callback_url") if stored else None
+    if callback_url:
+        await push_detailed_analysis(callback_url, session_id, detailed_analysis)
+
+async def push_detailed_analysis(callback_url: str, session_id: str, detailed_analysis: str, attempts: int = 3):
+    """Отправляет готовый анализ в backend; при недоступности backend заберет его сам через GET /sessions/{id}/analysis"""
+    payload = {"session_id": session_id, "analysis_status": "ready", "detailed_analysis": detailed_analysis}
+    for attempt in range(1, attempts + 1):
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as http:
+                response = await http.post(callback_url, json=payload)
+                response.raise_for_status()
+            print(f"📨 Detailed analysis for {session_id} delivered to {callback_url}")
+            return
+        except httpx.HTTPError as e:
+            print(f"⚠️ Detailed analysis callback failed (attempt {attempt}/{attempts}): {e}")
+            await asyncio.sleep(attempt)
+
+async def finalize_turn(
+    session_id: str,
+    session: Dict[str, Any],
+    new_messages: List[Dict[str, str]],
+    ai_response: str
+) -> ChatResponse:
+    """
+    Обрабатывает ответ LLM: разбирает [RESULT], дописывает ход в сессию
+    и при завершении запускает фоновый детальный анализ
+    """
     # Проверяем, есть ли [RESULT] в ответе
     result_data = extract_result_from_message(ai_response)
-    print(f"🔍 [DEBUG] session_id={request.session_id}, question_count={session['question_count']}, result_data={result_data is not None}")
+    print(f"🔍 [DEBUG] session_id={session_id}, question_count={session['question_count']}, result_data={result_data is not None}")
     
     rejection_tags = []
     
@@ -511,61 +1050,32 @@ async def chat_turn(request: ChatTurnRequest):
         alternative_reason = f"Соответствие текущей вакансии составляет {relevance_percent}%. Возможно, у компании есть более подходящие позиции."
         print(f"💡 Low match ({relevance_percent}%), suggesting alternative vacancy")
     
-    # Генерируем детальный анализ при завершении диалога
-    detailed_analysis = ""
+    # Дописываем ход в Redis: новые сообщения + измененные поля, без перезаписи истории
+    assistant_message = {"role": "assistant", "content": ai_response}
+    session["messages"].append(assistant_message)
+    await session_store.append(session_id, new_messages + [assistant_message], {
+        "question_count": session["question_count"],
+        "is_completed": session.get("is_completed", False),
+        "relevance_percent": relevance_percent,
+        "summary": summary,
+        "reasons": reasons,
+        "rejection_tags": rejection_tags,
+        "analysis_status": "pending" if is_completed else None,
+        "history_summary": session.get("history_summary", ""),
+        "compacted_messages": session.get("compacted_messages", 0),
+        "prompt_tokens": session.get("prompt_tokens", 0),
+        "tokens_saved": session.get("tokens_saved", 0),
+        "llm_usage": session_llm_usage(session),
+        "updated_at": datetime.utcnow().isoformat()
+    }, blob_hashes=(session.get("vacancy_hash"), session.get("cv_hash")))
+    
     if is_completed:
-        print("📊 Generating detailed analysis...")
-        detailed_prompt = f"""На основе диалога с кандидатом, создай детальный анализ в формате:
-
-**СИЛЬНЫЕ СТОРОНЫ:**
-- [перечисли 3-5 сильных сторон кандидата с примерами из ответов]
-
-**ОБЛАСТИ ДЛЯ РАЗВИТИЯ:**
-- [перечисли 2-3 области, где кандидат может улучшиться]
-
-**СООТВЕТСТВИЕ ВАКАНСИИ:**
-- Ключевые навыки: [анализ соответствия требуемым навыкам]
-- Опыт работы: [оценка релевантного опыта]
-- Мотивация: [оценка заинтересованности кандидата]
-
-**РЕКОМЕНДАЦИИ:**
-[2-3 конкретные рекомендации для работодателя]
-
-**ОБЩАЯ ОЦЕНКА:** {relevance_percent}%
-
-Вакансия: {session.get('vacancy_text', '')[:500]}
-Резюме: {session.get('cv_text', '')[:500]}
-Ответы кандидата: {' '.join([m['content'] for m in session['messages'] if m['role'] == 'user'][:5])}
-"""
-        
-        try:
-            detailed_response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "Ты HR-аналитик, создающий детальные отчеты о кандидатах."},
-                    {"role": "user", "content": detailed_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1500
-            )
-            detailed_analysis = detailed_response.choices[0].message.content.strip()
-            print(f"✅ Detailed analysis generated: {len(detailed_analysis)} chars")
-        except Exception as e:
-            print(f"❌ Error generating detailed analysis: {e}")
-            detailed_analysis = f"**КРАТКИЙ АНАЛИЗ:** {summary}\n\n**РЕЛЕВАНТНОСТЬ:** {relevance_percent}%\n\n**ПРИЧИНЫ:** {', '.join(reasons)}"
-    
-    # Обновляем сессию в Redis
-    session["messages"].append({"role": "assistant", "content": ai_response})
-    session["relevance_percent"] = relevance_percent
-    session["summary"] = summary
-    session["reasons"] = reasons
-    session["rejection_tags"] = rejection_tags
-    session["detailed_analysis"] = detailed_analysis
-    session["updated_at"] = datetime.utcnow().isoformat()
-    save_session_to_redis(request.session_id, session)
+        # Детальный анализ — уже после ответа кандидату
+        session.update(relevance_percent=relevance_percent, summary=summary, reasons=reasons)
+        schedule_detailed_analysis(session_id, session)
     
     return ChatResponse(
-        session_id=request.session_id,
+        session_id=session_id,
         bot_reply=bot_reply,
         relevance_percent=relevance_percent,
         reasons=reasons,
@@ -573,15 +1083,497 @@ async def chat_turn(request: ChatTurnRequest):
         summary_for_employer=summary,
         dialog_stage=dialog_stage,
         is_completed=is_completed,
-        detailed_analysis=detailed_analysis if is_completed else None,
+        analysis_status="pending" if is_completed else None,
         suggest_alternative_vacancy=suggest_alternative,
         alternative_vacancy_reason=alternative_reason
     )
 
+# Ход диалога выполняется под замком сессии: параллельные ходы одной сессии иначе
+# читают одну и ту же историю и оба платят за LLM, а в сессии остается только один
+TURN_LOCK_TTL = float(os.getenv("TURN_LOCK_TTL", "120"))  # больше таймаута вызова LLM
+TURN_RESULT_TTL = int(os.getenv("TURN_RESULT_TTL", "900"))  # сколько помним ответы для повторов
+TURN_WAIT_INTERVAL = 0.2
+TURN_COALESCE_TTL = 60  # ответ по токену замка для ждавших этот ход
+turn_stats = {"deduplicated": 0, "coalesced": 0, "rejected": 0}
+
+def turn_message_id(request: ChatTurnRequest) -> tuple:
+    """
+    (ID сообщения, задан ли он клиентом). Без client_message_id сообщение узнается
+    по тексту — этого хватает, чтобы склеить двойную отправку, пока ход еще идет,
+    но не для повтора после ответа: кандидат может ответить тем же текстом дважды.
+    """
+    if request.client_message_id:
+        return request.client_message_id, True
+    return "text-" + content_hash(request.message_from_candidate)[:16], False
+
+async def begin_turn(request: ChatTurnRequest) -> tuple:
+    """
+    Занимает ход сессии. Возвращает (готовый ответ, None) для повтора уже обработанного
+    сообщения или (None, токен замка) — ход можно выполнять.
+    Пока идет ход с тем же сообщением, ждем его ответа; с другим — 409.
+    Ответ по client_message_id хранится TURN_RESULT_TTL; сообщение без него получает
+    только ответ хода, который шел в момент запроса (ответ ищется по токену его замка).
+    """
+    message_id, from_client = turn_message_id(request)
+    if from_client:
+        stored = await session_store.load_turn_result(request.session_id, message_id)
+        if stored:
+            turn_stats["deduplicated"] += 1
+            return ChatResponse(**{**stored, "duplicate": True}), None
+
+    token = f"{message_id}:{uuid.uuid4().hex}"
+    deadline = time.monotonic() + TURN_LOCK_TTL
+    while time.monotonic() < deadline:
+        if await session_store.try_lock_turn(request.session_id, token, TURN_LOCK_TTL):
+            return None, token
+        owner = await session_store.turn_lock_owner(request.session_id)
+        if owner is None:
+            continue  # замок освободился между запросами
+        if owner.rsplit(":", 1)[0] != message_id:
+            turn_stats["rejected"] += 1
+            raise HTTPException(status_code=409, detail="Previous message is still being processed")
+        # То же сообщение уже обрабатывается (двойная отправка, повтор по таймауту) — ждем его ответ
+        while await session_store.turn_lock_owner(request.session_id) == owner and time.monotonic() < deadline:
+            await asyncio.sleep(TURN_WAIT_INTERVAL)
+        stored = await session_store.load_turn_result(request.session_id, message_id if from_client else owner)
+        if stored:
+            turn_stats["coalesced"] += 1
+            print(f"🔗 Coalesced duplicate message for session {request.session_id}")
+            return ChatResponse(**{**stored, "duplicate": True}), None
+        # Ход завершился ошибкой — пробуем выполнить его сами
+    turn_stats["rejected"] += 1
+    raise HTTPException(status_code=409, detail="Previous message is still being processed")
+
+async def check_turn(request: ChatTurnRequest):
+    """409, если сейчас идет ход с другим сообщением (без ожидания и без захвата замка)"""
+    owner = await session_store.turn_lock_owner(request.session_id)
+    message_id, _ = turn_message_id(request)
+    if owner is not None and owner.rsplit(":", 1)[0] != message_id:
+        turn_stats["rejected"] += 1
+        raise HTTPException(status_code=409, detail="Previous message is still being processed")
+
+async def end_turn(request: ChatTurnRequest, token: str, result: Optional[ChatResponse]):
+    """
+    Запоминает ответ хода для повторов и освобождает замок сессии. Ответ на сообщение
+    без client_message_id хранится по токену замка и недолго: его забирают только
+    запросы, ждавшие этот ход.
+    """
+    if result is not None:
+        message_id, from_client = turn_message_id(request)
+        if from_client:
+            await session_store.save_turn_result(request.session_id, message_id, result.model_dump(), TURN_RESULT_TTL)
+        else:
+            await session_store.save_turn_result(request.session_id, token, result.model_dump(), TURN_COALESCE_TTL)
+    await session_store.unlock_turn(request.session_id, token)
+
+@app.post("/chat/turn", response_model=ChatResponse)
+async def chat_turn(request: ChatTurnRequest):
+    """
+    Продолжает диалог с кандидатом
+    
+    1. Получает ответ кандидата
+    2. Анализирует и задает следующий вопрос или завершает диалог
+    3. Обновляет оценку релевантности
+    
+    Повтор сообщения (тот же client_message_id) получает сохраненный ответ без вызова LLM.
+    """
+    stored, token = await begin_turn(request)
+    if stored:
+        return stored
+    
+    result = None
+    try:
+        # Сессию читаем уже под замком: предыдущий ход гарантированно сохранен
+        session = await session_store.load(request.session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        
+        # Проверяем, не завершен ли уже диалог
+        if session.get("is_completed", False):
+            return completed_response(request.session_id, session)
+        
+        new_messages = prepare_turn(session, request.message_from_candidate)
+        
+        # Вызываем OpenAI
+        ai_response = await call_openai(
+            build_prompt_messages(session), stage=turn_stage(session), cache_key=prompt_cache_key(session.get("vacancy_text") or ""),
+            session_usage=session_llm_usage(session)
+        )
+        
+        result = await finalize_turn(request.session_id, session, new_messages, ai_response)
+        return result
+    finally:
+        await end_turn(request, token, result)
+
+@app.post("/chat/turn/stream")
+async def chat_turn_stream(request: ChatTurnRequest):
+    """
+    Потоковая версия /chat/turn (Server-Sent Events)
+    
+    События:
+    - token: очередной фрагмент ответа бота ({"text": "..."}), блок [RESULT] не передается
+    - result: финальный ChatResponse после сохранения сессии
+    - error: ошибка генерации ({"detail": "..."})
+    
+    Замок хода занимается внутри потока и держится до его конца: если клиент отключится
+    до чтения ответа, замок не останется висеть. Повтор сообщения сразу получает result.
+    Ошибки хода с HTTP-статусом (409 — идет ход с другим сообщением, 404 — сессия пропала)
+    приходят событием error с полем status_code.
+    """
+    if not await session_store.load_meta(request.session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    # Явный конфликт — 409 до начала потока (замок при этом не занимается)
+    await check_turn(request)
+    
+    async def event_stream():
+        try:
+            stored, token = await begin_turn(request)
+        except HTTPException as e:
+            yield format_sse("error", {"detail": e.detail, "status_code": e.status_code})
+            return
+        if stored:
+            yield format_sse("result", stored.model_dump())
+            return
+        
+        final = None
+        try:
+            session = await session_store.load(request.session_id)
+            if not session:
+                yield format_sse("error", {"detail": "Session not found", "status_code": 404})
+                return
+            if session.get("is_completed", False):
+                yield format_sse("result", completed_response(request.session_id, session).model_dump())
+                return
+            
+            new_messages = prepare_turn(session, request.message_from_candidate)
+            ai_response = ""
+            emitted = 0
+            try:
+                async for delta in stream_openai(
+                    build_prompt_messages(session), stage=turn_stage(session), cache_key=prompt_cache_key(session.get("vacancy_text") or ""),
+                    session_usage=session_llm_usage(session)
+                ):
+                    ai_response += delta
+                    safe_length = visible_prefix_length(ai_response)
+                    if safe_length > emitted:
+                        yield format_sse("token", {"text": ai_response[emitted:safe_length]})
+                        emitted = safe_length
+            except Exception as e:
+                print(f"❌ Streaming error for session {request.session_id}: {e}")
+                yield format_sse("error", {"detail": f"OpenAI API error: {str(e)}"})
+                return
+            
+            final = await finalize_turn(request.session_id, session, new_messages, ai_response)
+        finally:
+            # В том числе при обрыве соединения клиентом и ошибке подготовки хода
+            await end_turn(request, token, final)
+        yield format_sse("result", final.model_dump())
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def parse_initial_message(content: str) -> tuple:
+    """Обратная операция к INITIAL_MESSAGE_TEMPLATE: (vacancy_text, cv_text)"""
+    vacancy = re.search(r"<JOB_DESCRIPTION>\n(.*)\n</JOB_DESCRIPTION>", content, re.DOTALL)
+    resume = re.search(r"<CANDIDATE_RESUME>\n(.*)\n</CANDIDATE_RESUME>", content, re.DOTALL)
+    cv_text = resume.group(1) if resume else None
+    return (vacancy.group(1) if vacancy else ""), (None if cv_text == NO_RESUME_TEXT else cv_text)
+
+async def screen_candidate(
+    vacancy_text: str,
+    cache_key: str,
+    candidate: ScreeningCandidate,
+    decision: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Первый шаг скрининга одного кандидата — то же, что /chat/start"""
+    session_id = candidate.session_id or f"screening_{uuid.uuid4().hex}"
+    if decision["verdict"] == "reject":
+        result = await open_triaged_session(
+            session_id, vacancy_text, candidate.cv_text, decision, candidate.analysis_callback_url
+        )
+    else:
+        messages = build_initial_messages(vacancy_text, candidate.cv_text)
+        llm_usage = empty_usage()
+        ai_response = await call_openai(messages, stage="first_question", cache_key=cache_key, session_usage=llm_usage)
+        result = await open_session(
+            session_id, vacancy_text, candidate.cv_text, ai_response, candidate.analysis_callback_url, decision, llm_usage
+        )
+    return {"candidate_id": candidate.candidate_id, "session_id": session_id, "result": result.model_dump()}
+
+def triage_batch(vacancy_text: str, candidates: List[ScreeningCandidate]) -> tuple:
+    """
+    Локальный отбор пакета: (отклоненные, очередь на LLM). В очереди явные совпадения
+    идут первыми, дальше — по убыванию локальной оценки.
+    """
+    decisions = triage.assess_many([c.cv_text for c in candidates], vacancy_text)
+    pairs = list(zip(candidates, decisions))
+    rejected = [(c, d) for c, d in pairs if d["verdict"] == "reject"]
+    queue = sorted(
+        ((c, d) for c, d in pairs if d["verdict"] != "reject"),
+        key=lambda item: (item[1]["verdict"] != "priority", -(item[1]["score"] or 0))
+    )
+    print(f"🚦 Batch triage: {len(rejected)} rejected, {len(queue)} for LLM screening")
+    return rejected, queue
+
+@app.post("/screening/batch")
+async def screening_batch(request: BatchScreeningRequest):
+    """
+    Пакетный скрининг резюме по одной вакансии.
+    
+    Сначала локальный triage: явные несоответствия получают предварительную оценку
+    без LLM, явные совпадения идут в очередь первыми.
+    
+    online — SSE-поток: событие candidate (или candidate_error) по мере готовности каждого
+    кандидата, затем done. Первый кандидат очереди обрабатывается отдельно, чтобы префикс
+    SYSTEM_PROMPT + вакансия попал в кеш провайдера до параллельных запросов.
+    offline — задача OpenAI Batch API (дешевле, результат в пределах 24 часов),
+    результаты забираются через GET /screening/batch/{batch_id}.
+    """
+    # Общая подготовка вакансии на весь пакет
+    vacancy_text = vacancy_prompt_text(request.vacancy_text, request.vacancy_digest)
+    cache_key = prompt_cache_key(vacancy_text)
+    rejected, queue = triage_batch(vacancy_text, request.candidates)
+    
+    if request.mode == "offline":
+        return await submit_offline_screening(vacancy_text, queue, rejected)
+    
+    semaphore = asyncio.Semaphore(request.concurrency)
+    
+    async def run(candidate: ScreeningCandidate, decision: Dict[str, Any]) -> tuple:
+        async with semaphore:
+            try:
+                return "candidate", await screen_candidate(vacancy_text, cache_key, candidate, decision)
+            except HTTPException as e:
+                return "candidate_error", {"candidate_id": candidate.candidate_id, "detail": e.detail}
+            except Exception as e:
+                return "candidate_error", {"candidate_id": candidate.candidate_id, "detail": str(e)}
+    
+    async def event_stream():
+        started = time.perf_counter()
+        counts = {"candidate": 0, "candidate_error": 0}
+        # Отклоненные локально отдаются сразу, LLM не нужен
+        for candidate, decision in rejected:
+            event, data = await run(candidate, decision)
+            counts[event] += 1
+            yield format_sse(event, data)
+        
+        if queue:
+            event, data = await run(*queue[0])
+            counts[event] += 1
+            yield format_sse(event, data)
+        
+        tasks = [asyncio.create_task(run(candidate, decision)) for candidate, decision in queue[1:]]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                event, data = await finished
+                counts[event] += 1
+                yield format_sse(event, data)
+        finally:
+            # Клиент отключился — не тратим токены на оставшихся кандидатов
+            for task in tasks:
+                task.cancel()
+        
+        elapsed = time.perf_counter() - started
+        print(f"📦 Batch screening: {counts['candidate']} ok, {counts['candidate_error']} failed in {elapsed:.1f}s")
+        yield format_sse("done", {
+            "total": len(request.candidates),
+            "triaged": len(rejected),
+            "succeeded": counts["candidate"],
+            "failed": counts["candidate_error"],
+            "elapsed_seconds": round(elapsed, 2)
+        })
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def submit_offline_screening(vacancy_text: str, queue: List[tuple], rejected: List[tuple]) -> Dict[str, Any]:
+    """
+    Ставит пакет в OpenAI Batch API. custom_id каждой строки содержит candidate_id,
+    session_id и callback, а тело запроса — вакансию и резюме, поэтому результаты
+    разбираются без локального состояния (переживают перезапуск сервиса).
+    Отклоненные triage кандидаты в пакет не попадают — их сессии создаются сразу (triaged).
+    """
+    if queue and not client:
+        raise HTTPException(status_code=503, detail="OpenAI is not configured")
+    
+    triaged = [await screen_candidate(vacancy_text, "", candidate, decision) for candidate, decision in rejected]
+    sessions = {item["candidate_id"]: item["session_id"] for item in triaged}
+    total = len(queue) + len(rejected)
+    if not queue:
+        return {"batch_id": None, "status": "completed", "total": total, "sessions": sessions, "triaged": triaged}
+    
+    lines = []
+    for candidate, _ in queue:
+        session_id = candidate.session_id or f"screening_{uuid.uuid4().hex}"
+        sessions[candidate.candidate_id] = session_id
+        lines.append(json.dumps({
+            "custom_id": json.dumps([candidate.candidate_id, session_id, candidate.analysis_callback_url]),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "messages": build_initial_messages(vacancy_text, candidate.cv_text),
+                **model_router.route("first_question")
+            }
+        }, ensure_ascii=False))
+    
+    try:
+        input_file = await client.files.create(
+            file=("screening.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+    except Exception as e:
+        print(f"OpenAI Batch API error: {e}")
+        raise HTTPException(status_code=502, detail=f"OpenAI Batch API error: {str(e)}")
+    
+    print(f"📦 Offline screening batch {batch.id}: {len(queue)} candidates, {len(rejected)} triaged")
+    return {"batch_id": batch.id, "status": batch.status, "total": total, "sessions": sessions, "triaged": triaged}
+
+@app.get("/screening/batch/{batch_id}")
+async def get_offline_screening(batch_id: str):
+    """
+    Статус offline-пакета; когда пакет завершен — создает сессии кандидатов и возвращает результаты.
+    Повторный запрос не пересоздает уже созданные сессии (created=false).
+    """
+    if not client:
+        raise HTTPException(status_code=503, detail="OpenAI is not configured")
+    try:
+        batch = await client.batches.retrieve(batch_id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Batch not found: {str(e)}")
+    
+    counts = batch.request_counts
+    response = {
+        "batch_id": batch_id,
+        "status": batch.status,
+        "request_counts": {"total": counts.total, "completed": counts.completed, "failed": counts.failed} if counts else None,
+        "results": [],
+        "errors": []
+    }
+    if batch.status != "completed":
+        return response
+    
+    input_lines = (await client.files.content(batch.input_file_id)).text.splitlines()
+    requests_by_id = {item["custom_id"]: item["body"] for item in map(json.loads, filter(None, input_lines))}
+    output_lines = (await client.files.content(batch.output_file_id)).text.splitlines() if batch.output_file_id else []
+    
+    for line in filter(None, output_lines):
+        item = json.loads(line)
+        candidate_id, session_id, callback_url = json.loads(item["custom_id"])
+        body = (item.get("response") or {}).get("body") or {}
+        if item.get("error") or not body.get("choices"):
+            response["errors"].append({"candidate_id": candidate_id, "detail": item.get("error") or body})
+            continue
+        
+        existing = await session_store.load_meta(session_id)
+        if existing:
+            response["results"].append({
+                "candidate_id": candidate_id,
+                "session_id": session_id,
+                "created": False,
+                "result": completed_response(session_id, existing).model_dump() if existing.get("is_completed") else None
+            })
+            continue
+        
+        usage = body.get("usage") or {}
+        llm_usage = empty_usage()
+        if usage:
+            cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+            record_prompt_cache(usage.get("prompt_tokens", 0), cached_tokens)
+            model_router.record_batch(
+                "first_question", usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), cached_tokens, llm_usage
+            )
+        vacancy_text, cv_text = parse_initial_message(requests_by_id[item["custom_id"]]["messages"][1]["content"])
+        ai_response = body["choices"][0]["message"]["content"]
+        result = await open_session(session_id, vacancy_text, cv_text, ai_response, callback_url, llm_usage=llm_usage)
+        response["results"].append({
+            "candidate_id": candidate_id,
+            "session_id": session_id,
+            "created": True,
+            "result": result.model_dump()
+        })
+    
+    if batch.error_file_id:
+        for line in filter(None, (await client.files.content(batch.error_file_id)).text.splitlines()):
+            item = json.loads(line)
+            response["errors"].append({"candidate_id": json.loads(item["custom_id"])[0], "detail": item.get("error")})
+    return response
+
+@app.post("/sessions/import")
+async def import_sessions(request: SessionImportRequest):
+    """
+    Восстанавливает сессии по переданной истории диалога (например, после истечения TTL).
+    Диалог продолжается с того же места: прошлые ходы не повторяются, LLM не вызывается.
+    Живые сессии не перезаписываются, если не задан overwrite.
+    """
+    imported, skipped = [], []
+    for item in request.sessions:
+        if not request.overwrite and await session_store.load_meta(item.session_id):
+            skipped.append(item.session_id)
+            continue
+        
+        messages = [message.model_dump() for message in item.messages]
+        is_completed = item.is_completed and item.relevance_percent is not None
+        now = datetime.utcnow().isoformat()
+        session_data = {
+            "session_id": item.session_id,
+            "vacancy_text": vacancy_prompt_text(item.vacancy_text, item.vacancy_digest),
+            "cv_text": item.cv_text,
+            "messages": messages,
+            "question_count": sum(1 for message in messages if message["role"] == "user"),
+            "is_completed": is_completed,
+            "relevance_percent": item.relevance_percent if item.relevance_percent is not None else 50,
+            "summary": item.summary or "Идет уточнение деталей",
+            "reasons": item.reasons or ["Требуется дополнительная информация"],
+            "rejection_tags": item.rejection_tags,
+            "detailed_analysis": item.detailed_analysis,
+            "analysis_callback_url": item.analysis_callback_url,
+            "analysis_status": "ready" if item.detailed_analysis else None,
+            "imported_at": now,
+            "created_at": now,
+            "updated_at": now
+        }
+        await session_store.create(item.session_id, session_data)
+        imported.append(item.session_id)
+    
+    print(f"♻️ Imported {len(imported)} sessions ({len(skipped)} already present)")
+    return {"imported": imported, "skipped": skipped}
+
+@app.post("/sessions/{session_id}/rename")
+async def rename_session(session_id: str, request: SessionRenameRequest):
+    """
+    Переносит сессию под другой ID без вызова LLM. Backend готовит упреждающий скрининг
+    под временным ID и переносит его под ID заявки, только если результат пригодился.
+    """
+    session = await session_store.load(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if not request.overwrite and await session_store.load_meta(request.target_session_id):
+        raise HTTPException(status_code=409, detail="Target session already exists")
+    
+    target_session_id = request.target_session_id
+    session["session_id"] = target_session_id
+    if request.analysis_callback_url:
+        session["analysis_callback_url"] = request.analysis_callback_url
+    await session_store.create(target_session_id, session)
+    await session_store.delete(session_id)
+    
+    # Детальный анализ, начатый под старым ID, должен попасть в перенесенную сессию
+    status = session.get("analysis_status")
+    if status == "pending" and not rekey_detailed_analysis(session_id, target_session_id):
+        schedule_detailed_analysis(target_session_id, session)
+    elif status == "ready" and session.get("analysis_callback_url"):
+        asyncio.create_task(push_detailed_analysis(
+            session["analysis_callback_url"], target_session_id, session.get("detailed_analysis", "")
+        ))
+    return {"session_id": target_session_id}
+
 @app.get("/sessions/{session_id}")
 async def get_session_info(session_id: str):
     """Получить информацию о сессии"""
-    session = load_session_from_redis(session_id)
+    session = await session_store.load_meta(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     return {
@@ -595,40 +1587,60 @@ async def get_session_info(session_id: str):
         "reasons": session.get("reasons", []),
         "created_at": session.get("created_at"),
         "updated_at": session.get("updated_at"),
-        "message_count": len(session.get("messages", []))
+        # + системный промпт и исходный запрос, которые собираются на лету
+        "message_count": session.get("message_count", 0) + 2,
+        "compacted_messages": session.get("compacted_messages", 0),
+        "prompt_tokens": session.get("prompt_tokens", 0),
+        "tokens_saved": session.get("tokens_saved", 0),
+        # Токены, стоимость и задержки LLM-вызовов сессии (в том числе детального анализа)
+        "llm_usage": session.get("llm_usage") or empty_usage()
     }
 
-@app.get("/sessions")
-async def list_sessions():
-    """Получить список всех сессий из Redis"""
-    session_ids = get_all_session_ids()
-    sessions_list = []
-    
-    for sid in session_ids:
-        session = load_session_from_redis(sid)
-        if session:
-            sessions_list.append({
-                "session_id": sid,
-                "is_completed": session.get("is_completed", False),
-                "relevance_percent": session.get("relevance_percent", 0),
-                "question_count": session.get("question_count", 0),
-                "created_at": session.get("created_at"),
-                "updated_at": session.get("updated_at")
-            })
-    
+@app.get("/sessions/{session_id}/analysis")
+async def get_session_analysis(session_id: str):
+    """
+    Статус и текст детального анализа. Если анализ завис в pending
+    (например, сервис перезапускался), генерация запускается заново.
+    """
+    session = await session_store.load_meta(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    status = session.get("analysis_status")
+    if status == "pending" and session_id not in analysis_tasks:
+        full_session = await session_store.load(session_id)
+        if full_session:
+            schedule_detailed_analysis(session_id, full_session)
     return {
-        "sessions": sessions_list,
-        "total": len(sessions_list)
+        "session_id": session_id,
+        "analysis_status": status,
+        "detailed_analysis": session.get("detailed_analysis") if status == "ready" else None
     }
 
+@app.get("/sessions")
+async def list_sessions(
+    limit: int = Query(50, ge=1, le=500, description="Размер страницы"),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    completed: Optional[bool] = Query(None, description="Фильтр по завершенности диалога"),
+    min_relevance: Optional[int] = Query(None, ge=0, le=100, description="Минимальная релевантность"),
+    max_relevance: Optional[int] = Query(None, ge=0, le=100, description="Максимальная релевантность")
+):
+    """Получить список сессий (новые сверху) с курсорной пагинацией"""
+    return await session_store.list_summaries(
+        limit=limit,
+        cursor=cursor,
+        completed=completed,
+        min_relevance=min_relevance,
+        max_relevance=max_relevance
+    )
+
 @app.delete("/sessions/{session_id}")
 async def delete_session_endpoint(session_id: str):
     """Удалить сессию из Redis"""
-    session = load_session_from_redis(session_id)
+    session = await session_store.load_meta(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    delete_session_from_redis(session_id)
+    await session_store.delete(session_id)
     
     return {"message": "Session deleted successfully"}
 
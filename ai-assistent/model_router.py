@@ -0,0 +1,251 @@
+"""
+Маршрутизация вызовов LLM по стадиям диалога: модель, max_tokens и temperature
+для каждой стадии задаются конфигурацией, по стадиям собираются задержки, токены
+и стоимость (метрики в формате Prometheus и сводка по сессии)
+"""
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Mapping, Optional
+
+# Первый вопрос, уточняющие вопросы, принудительная финальная оценка, детальный анализ
+STAGES = ("first_question", "follow_up", "forced_completion", "detailed_analysis")
+
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_MAX_TOKENS = {"detailed_analysis": 1500}
+DEFAULT_TEMPERATURE = 0.7
+
+# Цены за 1M токенов, USD: вход, вход из кеша провайдера, выход. LLM_PRICES — JSON с дополнениями
+DEFAULT_PRICES = {
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+}
+# OpenAI Batch API тарифицируется вдвое дешевле
+BATCH_PRICE_FACTOR = 0.5
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+
+def price_for(prices: Dict[str, Dict[str, float]], model: str) -> Optional[Dict[str, float]]:
+    """Цена модели; версии вида gpt-4o-mini-2024-07-18 берут цену по самому длинному префиксу"""
+    if model in prices:
+        return prices[model]
+    matches = [name for name in prices if model.startswith(name)]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def call_cost(price: Optional[Dict[str, float]], prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    if not price:
+        return 0.0
+    return (
+        (prompt_tokens - cached_tokens) * price["input"]
+        + cached_tokens * price["cached_input"]
+        + completion_tokens * price["output"]
+    ) / 1_000_000
+
+
+def empty_usage() -> Dict[str, Any]:
+    """Сводка LLM-вызовов одной сессии (хранится в поле сессии llm_usage)"""
+    return {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "latency_ms": 0, "by_stage": {}}
+
+
+def add_usage(usage: Dict[str, Any], stage: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int, cost: float, latency: float):
+    stage_usage = usage["by_stage"].setdefault(stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+    for target in (usage, stage_usage):
+        target["calls"] += 1
+        target["prompt_tokens"] += prompt_tokens
+        target["completion_tokens"] += completion_tokens
+        target["cost_usd"] = round(target["cost_usd"] + cost, 6)
+    usage["cached_tokens"] += cached_tokens
+    usage["latency_ms"] += int(latency * 1000)
+
+
+def merge_usage(usage: Optional[Dict[str, Any]], other: Dict[str, Any]) -> Dict[str, Any]:
+    """Сумма двух сводок (например, диалог + фоновый детальный анализ)"""
+    merged = json.loads(json.dumps(usage)) if usage else empty_usage()
+    for field in ("calls", "prompt_tokens", "cached_tokens", "completion_tokens", "latency_ms"):
+        merged[field] += other[field]
+    merged["cost_usd"] = round(merged["cost_usd"] + other["cost_usd"], 6)
+    for stage, stage_usage in other["by_stage"].items():
+        target = merged["by_stage"].setdefault(stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+        for field in ("calls", "prompt_tokens", "completion_tokens"):
+            target[field] += stage_usage[field]
+        target["cost_usd"] = round(target["cost_usd"] + stage_usage["cost_usd"], 6)
+    return merged
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class StageMetrics:
+    """Счетчики одной стадии: вызовы, ошибки, токены и задержки последних вызовов"""
+
+    def __init__(self, window: int = 500):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self.latencies = deque(maxlen=window)
+        self.first_token_latencies = deque(maxlen=window)
+        # Гистограмма задержек за все время (для Prometheus): счетчики по LATENCY_BUCKETS
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+    def observe(self, latency: float):
+        self.latencies.append(latency)
+        self.latency_sum += latency
+        self.latency_count += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.latency_buckets[i] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 4),
+            "avg_completion_tokens": round(self.completion_tokens / self.calls, 1) if self.calls else 0.0,
+            "latency_p50_ms": round(percentile(self.latencies, 0.5) * 1000, 1),
+            "latency_p95_ms": round(percentile(self.latencies, 0.95) * 1000, 1),
+            "first_token_p50_ms": round(percentile(self.first_token_latencies, 0.5) * 1000, 1),
+        }
+
+
+class CallTrace:
+    """Замер одного вызова: фактический usage, стоимость и момент первого токена (для стриминга)"""
+
+    def __init__(self, metrics: StageMetrics, price: Optional[Dict[str, float]] = None):
+        self._metrics = metrics
+        self._price = price
+        self.started = time.perf_counter()
+        self._first_token_seen = False
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def first_token(self):
+        if not self._first_token_seen:
+            self._first_token_seen = True
+            self._metrics.first_token_latencies.append(time.perf_counter() - self.started)
+
+    def usage(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0, price_factor: float = 1.0):
+        self.prompt_tokens = prompt_tokens or 0
+        self.completion_tokens = completion_tokens or 0
+        self.cached_tokens = cached_tokens or 0
+        self.cost = call_cost(self._price, self.prompt_tokens, self.cached_tokens, self.completion_tokens) * price_factor
+        self._metrics.prompt_tokens += self.prompt_tokens
+        self._metrics.cached_tokens += self.cached_tokens
+        self._metrics.completion_tokens += self.completion_tokens
+        self._metrics.cost_usd += self.cost
+
+
+class ModelRouter:
+    """
+    Параметры вызова для стадии: LLM_<STAGE>_MODEL, LLM_<STAGE>_MAX_TOKENS,
+    LLM_<STAGE>_TEMPERATURE; без них — общие OPENAI_MODEL, MAX_TOKENS, TEMPERATURE
+    """
+
+    def __init__(self, routes: Dict[str, Dict[str, Any]], prices: Optional[Dict[str, Dict[str, float]]] = None):
+        self.routes = routes
+        self.prices = prices or DEFAULT_PRICES
+        self.metrics = {stage: StageMetrics() for stage in routes}
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "ModelRouter":
+        env = os.environ if env is None else env
+        model = env.get("OPENAI_MODEL", DEFAULT_MODEL)
+        temperature = float(env.get("TEMPERATURE", DEFAULT_TEMPERATURE))
+        routes = {}
+        for stage in STAGES:
+            prefix = f"LLM_{stage.upper()}_"
+            max_tokens = DEFAULT_MAX_TOKENS.get(stage) or int(env.get("MAX_TOKENS", "800"))
+            routes[stage] = {
+                "model": env.get(prefix + "MODEL", model),
+                "max_tokens": int(env.get(prefix + "MAX_TOKENS", max_tokens)),
+                "temperature": float(env.get(prefix + "TEMPERATURE", temperature)),
+            }
+        prices = {**DEFAULT_PRICES, **json.loads(env.get("LLM_PRICES") or "{}")}
+        return cls(routes, prices)
+
+    def route(self, stage: str) -> Dict[str, Any]:
+        """Параметры Chat Completions для стадии (model, max_tokens, temperature)"""
+        return dict(self.routes[stage])
+
+    @contextmanager
+    def trace(self, stage: str, session_usage: Optional[Dict[str, Any]] = None):
+        """
+        Контекст одного вызова: считает вызов, ошибку, задержку и стоимость стадии.
+        session_usage (empty_usage()) дополняется этим вызовом — сводка по сессии.
+        """
+        metrics = self.metrics[stage]
+        call = CallTrace(metrics, price_for(self.prices, self.routes[stage]["model"]))
+        metrics.calls += 1
+        try:
+            yield call
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            latency = time.perf_counter() - call.started
+            metrics.observe(latency)
+            if session_usage is not None:
+                add_usage(session_usage, stage, call.prompt_tokens, call.cached_tokens, call.completion_tokens, call.cost, latency)
+
+    def record_batch(self, stage: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int, session_usage: Optional[Dict[str, Any]] = None):
+        """Учитывает ответ OpenAI Batch API (без задержки вызова, по тарифу Batch API)"""
+        metrics = self.metrics[stage]
+        call = CallTrace(metrics, price_for(self.prices, self.routes[stage]["model"]))
+        metrics.calls += 1
+        call.usage(prompt_tokens, completion_tokens, cached_tokens, price_factor=BATCH_PRICE_FACTOR)
+        if session_usage is not None:
+            add_usage(session_usage, stage, call.prompt_tokens, call.cached_tokens, call.completion_tokens, call.cost, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            stage: {**self.routes[stage], **self.metrics[stage].snapshot()}
+            for stage in self.routes
+        }
+
+    def render_prometheus(self, prefix: str = "smartbot_llm") -> str:
+        """Метрики всех стадий в текстовом формате Prometheus (метки stage и model)"""
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        labeled = [(f'stage="{stage}",model="{self.routes[stage]["model"]}"', self.metrics[stage]) for stage in self.routes]
+
+        family("calls_total", "counter", "LLM calls")
+        lines += [f"{prefix}_calls_total{{{labels}}} {m.calls}" for labels, m in labeled]
+        family("errors_total", "counter", "Failed LLM calls")
+        lines += [f"{prefix}_errors_total{{{labels}}} {m.errors}" for labels, m in labeled]
+        family("tokens_total", "counter", "LLM tokens by type (cached is a part of prompt)")
+        for labels, m in labeled:
+            lines.append(f'{prefix}_tokens_total{{{labels},type="prompt"}} {m.prompt_tokens}')
+            lines.append(f'{prefix}_tokens_total{{{labels},type="cached"}} {m.cached_tokens}')
+            lines.append(f'{prefix}_tokens_total{{{labels},type="completion"}} {m.completion_tokens}')
+        family("cost_usd_total", "counter", "Estimated LLM cost in USD")
+        lines += [f"{prefix}_cost_usd_total{{{labels}}} {m.cost_usd:.6f}" for labels, m in labeled]
+        family("latency_seconds", "histogram", "LLM call latency")
+        for labels, m in labeled:
+            for bound, count in zip(LATENCY_BUCKETS, m.latency_buckets):
+                lines.append(f'{prefix}_latency_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{prefix}_latency_seconds_bucket{{{labels},le="+Inf"}} {m.latency_count}')
+            lines.append(f"{prefix}_latency_seconds_sum{{{labels}}} {m.latency_sum:.3f}")
+            lines.append(f"{prefix}_latency_seconds_count{{{labels}}} {m.latency_count}")
+        return "\n".join(lines) + "\n"
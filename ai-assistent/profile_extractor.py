@@ -0,0 +1,417 @@
+"""
+Быстрое извлечение структурированных данных из резюме и вакансий без LLM
+
+Навыки, опыт, город, зарплата, языки и грейд ищутся по словарям и регулярным
+выражениям; результаты кешируются по хешу текста. Оценка соответствия — векторное
+пересечение навыков (numpy) с поправками на опыт и город.
+"""
+import hashlib
+import re
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Канонное название навыка -> варианты написания (в нижнем регистре)
+SKILLS: Dict[str, List[str]] = {
+    "Python": ["python", "питон"],
+    "Java": ["java"],
+    "JavaScript": ["javascript", "js", "es6"],
+    "TypeScript": ["typescript", "ts"],
+    "Go": ["golang", "go"],
+    "C++": ["c++", "cpp"],
+    "C#": ["c#", "csharp"],
+    "PHP": ["php"],
+    "Ruby": ["ruby"],
+    "Kotlin": ["kotlin"],
+    "Swift": ["swift"],
+    "Rust": ["rust"],
+    "SQL": ["sql"],
+    "PostgreSQL": ["postgresql", "postgres", "постгрес"],
+    "MySQL": ["mysql"],
+    "MongoDB": ["mongodb", "mongo"],
+    "Redis": ["redis"],
+    "ClickHouse": ["clickhouse"],
+    "Elasticsearch": ["elasticsearch", "elastic"],
+    "Kafka": ["kafka", "кафка"],
+    "RabbitMQ": ["rabbitmq", "rabbit"],
+    "Celery": ["celery"],
+    "Docker": ["docker", "докер"],
+    "Kubernetes": ["kubernetes", "k8s"],
+    "Terraform": ["terraform"],
+    "CI/CD": ["ci/cd", "gitlab ci", "github actions", "jenkins"],
+    "Linux": ["linux", "линукс"],
+    "Git": ["git"],
+    "AWS": ["aws"],
+    "GCP": ["gcp", "google cloud"],
+    "Azure": ["azure"],
+    "FastAPI": ["fastapi"],
+    "Django": ["django"],
+    "Flask": ["flask"],
+    "Spring": ["spring", "spring boot"],
+    ".NET": [".net", "dotnet", "asp.net"],
+    "Node.js": ["node.js", "nodejs"],
+    "React": ["react", "react.js", "reactjs"],
+    "Vue": ["vue", "vue.js", "vuejs"],
+    "Angular": ["angular"],
+    "Next.js": ["next.js", "nextjs"],
+    "HTML/CSS": ["html", "css"],
+    "GraphQL": ["graphql"],
+    "REST API": ["rest api", "restful"],
+    "Pandas": ["pandas"],
+    "NumPy": ["numpy"],
+    "scikit-learn": ["scikit-learn", "sklearn"],
+    "PyTorch": ["pytorch", "torch"],
+    "TensorFlow": ["tensorflow"],
+    "Machine Learning": ["machine learning", "ml", "машинное обучение"],
+    "Airflow": ["airflow"],
+    "Spark": ["spark", "pyspark"],
+    "Excel": ["excel"],
+    "1C": ["1с", "1c"],
+    "Figma": ["figma"],
+}
+
+# Города: канонное название -> основы слова (покрывают падежи: "в Москве", "из Казани")
+CITIES: Dict[str, List[str]] = {
+    "Москва": ["москв", "moscow"],
+    "Санкт-Петербург": ["санкт-петербург", "петербург", "спб", "питер", "saint petersburg"],
+    "Новосибирск": ["новосибирск"],
+    "Екатеринбург": ["екатеринбург"],
+    "Казань": ["казан"],
+    "Нижний Новгород": ["нижн\\w* новгород"],
+    "Челябинск": ["челябинск"],
+    "Самара": ["самар"],
+    "Омск": ["омск"],
+    "Ростов-на-Дону": ["ростов"],
+    "Уфа": ["уф[аеуы]\\b"],
+    "Красноярск": ["красноярск"],
+    "Воронеж": ["воронеж"],
+    "Пермь": ["перм[ьи]"],
+    "Краснодар": ["краснодар"],
+    "Минск": ["минск"],
+    "Алматы": ["алматы"],
+    "Астана": ["астан"],
+    "Ташкент": ["ташкент"],
+    "Тбилиси": ["тбилиси"],
+    "Ереван": ["ереван"],
+}
+REMOTE_PATTERN = re.compile(r"удален|удалён|remote|дистанцион")
+
+# Языки: канонное название -> основы слова
+LANGUAGES: Dict[str, List[str]] = {
+    "Английский": ["английск", "english"],
+    "Немецкий": ["немецк", "german", "deutsch"],
+    "Французский": ["французск", "french"],
+    "Испанский": ["испанск", "spanish"],
+    "Китайский": ["китайск", "chinese"],
+    "Русский": ["русск", "russian"],
+}
+LANGUAGE_LEVELS = [
+    ("C2", ["c2", "native", "родной", "носитель"]),
+    ("C1", ["c1", "advanced", "fluent", "свободн"]),
+    ("B2", ["b2", "upper"]),
+    ("B1", ["b1", "intermediate", "средн"]),
+    ("A2", ["a2", "pre-intermediate", "elementary"]),
+    ("A1", ["a1", "beginner", "базов", "начальн"]),
+]
+
+# Грейды по возрастанию
+SENIORITY_LEVELS = ["intern", "junior", "middle", "senior", "lead"]
+SENIORITY_WORDS: Dict[str, List[str]] = {
+    "intern": ["intern", "стажер", "стажёр", "стажировк"],
+    "junior": ["junior", "джуниор", "младш"],
+    "middle": ["middle", "мидл"],
+    "senior": ["senior", "сеньор", "синьор", "старш", "ведущ"],
+    "lead": ["team lead", "teamlead", "tech lead", "techlead", "тимлид", "техлид", "руководител"],
+}
+
+WORD_CHARS = r"\w+#."
+AFTER_WORD_CHARS = r"\w#."  # "middle+", "python+django" — плюс после слова не мешает
+
+
+def _alternation(variants: Dict[str, List[str]], escape: bool) -> Tuple[re.Pattern, Dict[str, str]]:
+    """Одно регулярное выражение на весь словарь: длинные варианты раньше коротких"""
+    lookup = {}
+    for canonical, aliases in variants.items():
+        for alias in aliases:
+            lookup[alias] = canonical
+    ordered = sorted(lookup, key=len, reverse=True)
+    groups = [re.escape(a) if escape else a for a in ordered]
+    return re.compile("|".join(f"({g})" for g in groups)), {i + 1: lookup[a] for i, a in enumerate(ordered)}
+
+
+_SKILL_RE, _SKILL_GROUPS = _alternation(SKILLS, escape=True)
+_CITY_RE, _CITY_GROUPS = _alternation(CITIES, escape=False)
+_LANGUAGE_RE, _LANGUAGE_GROUPS = _alternation(LANGUAGES, escape=False)
+_SENIORITY_RE, _SENIORITY_GROUPS = _alternation(SENIORITY_WORDS, escape=True)
+
+SKILL_NAMES = list(SKILLS)
+SKILL_INDEX = {name: i for i, name in enumerate(SKILL_NAMES)}
+
+# Число не должно быть частью года ("с 2019 года"), второе число диапазона — только после разделителя
+_YEARS_RE = re.compile(
+    r"(?<![\d.,])(\d{1,2}(?:[.,]5)?)(?!\d)\s*\+?\s*(?:(?:-|–|—|до)\s*\d{1,2}(?!\d)\s*)?(?:год|года|лет|years?|yrs?)\b"
+)
+_EXPERIENCE_CONTEXT_RE = re.compile(r"опыт|стаж|experience")
+_DATE_RANGE_RE = re.compile(
+    r"\b((?:19|20)\d{2})\s*(?:г\.|года?)?\s*(?:-|–|—|по)\s*((?:19|20)\d{2}|настоящ\w*|н\.\s?в\.|present|now|сейчас|текущ\w*)"
+)
+
+_NUMBER = r"\d{1,3}(?:[   ]?\d{3})*|\d+"
+_CURRENCY = r"руб\w*|₽|rub|р\.|\$|usd|долл\w*|€|eur\w*"
+_SALARY_RE = re.compile(
+    rf"(?:от\s*)?(?P<low>{_NUMBER})\s*(?P<low_mult>тыс\.?|k|к)?"
+    rf"(?:\s*(?:-|–|—|до)\s*(?P<high>{_NUMBER})\s*(?P<high_mult>тыс\.?|k|к)?)?"
+    rf"\s*(?P<currency>{_CURRENCY})"
+    rf"|(?P<prefix_currency>\$|€)\s*(?P<prefix_amount>{_NUMBER})\s*(?P<prefix_mult>k|к)?"
+)
+CURRENCIES = {"$": "USD", "usd": "USD", "долл": "USD", "€": "EUR", "eur": "EUR"}
+
+
+def _bounded(text: str, start: int, end: int) -> bool:
+    """Совпадение не является частью другого слова ('go' в 'google', 'ts' в 'tests')"""
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    if after == "." and (end + 1 >= len(text) or not text[end + 1].isalnum()):
+        after = " "  # точка в конце предложения
+    return not re.match(rf"[{WORD_CHARS}]", before) and not re.match(rf"[{AFTER_WORD_CHARS}]", after)
+
+
+def _find_all(pattern: re.Pattern, groups: Dict[int, str], text: str, bounded: bool = True) -> List[Tuple[str, int]]:
+    found = []
+    for match in pattern.finditer(text):
+        if bounded and not _bounded(text, match.start(), match.end()):
+            continue
+        found.append((groups[match.lastindex], match.start()))
+    return found
+
+
+def extract_skills(text: str) -> List[str]:
+    seen = OrderedDict()
+    for name, _ in _find_all(_SKILL_RE, _SKILL_GROUPS, text):
+        seen.setdefault(name, None)
+    return list(seen)
+
+
+def extract_experience_years(text: str, kind: str) -> Optional[float]:
+    """
+    Опыт в годах. Сначала явные формулировки рядом со словами "опыт/стаж/experience"
+    (в вакансии — минимальное требование, в резюме — максимум), затем для резюме —
+    сумма периодов работы "2019 — 2023".
+    """
+    explicit = []
+    for match in _YEARS_RE.finditer(text):
+        context = text[max(0, match.start() - 40):match.end() + 40]
+        if _EXPERIENCE_CONTEXT_RE.search(context):
+            explicit.append(float(match.group(1).replace(",", ".")))
+    if explicit:
+        return min(explicit) if kind == "vacancy" else max(explicit)
+    if kind == "vacancy":
+        return None
+
+    current_year = date.today().year
+    total = 0
+    for start, end in _DATE_RANGE_RE.findall(text):
+        end_year = int(end) if end.isdigit() else current_year
+        if int(start) <= end_year <= current_year:
+            total += end_year - int(start)
+    return float(total) if total else None
+
+
+def extract_city(text: str) -> Dict[str, Any]:
+    found = _find_all(_CITY_RE, _CITY_GROUPS, text, bounded=False)
+    return {
+        "city": found[0][0] if found else None,
+        "remote": bool(REMOTE_PATTERN.search(text)),
+    }
+
+
+def _amount(number: str, multiplier: Optional[str]) -> int:
+    value = int(re.sub(r"\D", "", number))
+    return value * 1000 if multiplier else value
+
+
+def extract_salary(text: str) -> Optional[Dict[str, Any]]:
+    for match in _SALARY_RE.finditer(text):
+        if match.group("prefix_currency"):
+            amount = _amount(match.group("prefix_amount"), match.group("prefix_mult"))
+            low, high, currency = amount, None, match.group("prefix_currency")
+        else:
+            # Множитель "тыс" у верхней границы относится и к нижней: "150-200 тыс. руб"
+            high_mult = match.group("high_mult")
+            low = _amount(match.group("low"), match.group("low_mult") or high_mult)
+            high = _amount(match.group("high"), high_mult) if match.group("high") else None
+            currency = match.group("currency")
+        currency = next((code for prefix, code in CURRENCIES.items() if currency.startswith(prefix)), "RUB")
+        # Отсекаем годы, проценты и прочие небольшие числа
+        if low < (300 if currency != "RUB" else 10000):
+            continue
+        return {"min": low, "max": high, "currency": currency}
+    return None
+
+
+def extract_languages(text: str) -> List[Dict[str, Optional[str]]]:
+    languages = OrderedDict()
+    for name, position in _find_all(_LANGUAGE_RE, _LANGUAGE_GROUPS, text, bounded=False):
+        if name in languages:
+            continue
+        window = text[position:position + 60]
+        languages[name] = next(
+            (level for level, words in LANGUAGE_LEVELS if any(w in window for w in words)), None
+        )
+    return [{"language": name, "level": level} for name, level in languages.items()]
+
+
+def extract_seniority(text: str, experience_years: Optional[float]) -> Dict[str, Optional[str]]:
+    """Грейд: явное упоминание (наивысшее), иначе оценка по годам опыта"""
+    found = [name for name, _ in _find_all(_SENIORITY_RE, _SENIORITY_GROUPS, text)]
+    if found:
+        return {"seniority": max(found, key=SENIORITY_LEVELS.index), "seniority_source": "text"}
+    if experience_years is None:
+        return {"seniority": None, "seniority_source": None}
+    if experience_years < 1:
+        level = "intern"
+    elif experience_years < 3:
+        level = "junior"
+    elif experience_years < 5:
+        level = "middle"
+    else:
+        level = "senior"
+    return {"seniority": level, "seniority_source": "experience"}
+
+
+def extract_profile(text: str, kind: str) -> Dict[str, Any]:
+    """Структурированные данные резюме (kind="cv") или вакансии (kind="vacancy")"""
+    lowered = text.lower()
+    experience_years = extract_experience_years(lowered, kind)
+    return {
+        "kind": kind,
+        "skills": extract_skills(lowered),
+        "experience_years": experience_years,
+        **extract_city(lowered),
+        "salary": extract_salary(lowered),
+        "languages": extract_languages(lowered),
+        **extract_seniority(lowered, experience_years),
+    }
+
+
+def render_vacancy_digest(digest: Dict[str, Any]) -> str:
+    """Компактный текст вакансии для промпта из дайджеста (пустые поля пропускаются)"""
+    lines = [" — ".join(filter(None, [digest.get("title"), digest.get("company")]))]
+    if digest.get("must_have_skills"):
+        lines.append(f"Обязательные навыки: {', '.join(digest['must_have_skills'])}")
+    if digest.get("experience_years"):
+        lines.append(f"Опыт: от {digest['experience_years']:g} лет")
+    if digest.get("seniority"):
+        lines.append(f"Грейд: {digest['seniority']}")
+    location = [digest.get("location"), "возможна удаленная работа" if digest.get("remote") else None]
+    if any(location):
+        lines.append(f"Локация: {', '.join(filter(None, location))}")
+    if digest.get("employment_type"):
+        lines.append(f"Формат: {digest['employment_type']}")
+    if digest.get("languages"):
+        languages = [" ".join(filter(None, [l["language"], l.get("level")])) for l in digest["languages"]]
+        lines.append(f"Языки: {', '.join(languages)}")
+    salary = digest.get("salary") or {}
+    if salary.get("min") or salary.get("max"):
+        amount = "–".join(str(int(v)) for v in (salary.get("min"), salary.get("max")) if v)
+        lines.append(f"Зарплата: {amount} {salary.get('currency') or ''}".rstrip())
+    if digest.get("summary"):
+        lines.append(f"Описание: {digest['summary']}")
+    return "\n".join(line for line in lines if line)
+
+
+def skill_vector(skills: List[str]) -> np.ndarray:
+    vector = np.zeros(len(SKILL_NAMES), dtype=np.float32)
+    vector[[SKILL_INDEX[s] for s in skills]] = 1.0
+    return vector
+
+
+# Веса компонент оценки: навыки, опыт, город
+MATCH_WEIGHTS = np.array([0.7, 0.2, 0.1])
+
+
+def match_scores(cv_profiles: List[Dict[str, Any]], vacancy: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Оценка соответствия сразу для пачки резюме одной вакансии: матрица навыков
+    резюме (n x навыки) умножается на вектор навыков вакансии — доля найденных
+    обязательных навыков; опыт и город добавляются с весами MATCH_WEIGHTS
+    """
+    required = skill_vector(vacancy["skills"])
+    cv_matrix = np.stack([skill_vector(p["skills"]) for p in cv_profiles])
+    required_count = float(required.sum())
+    # Навыки в вакансии не найдены — навыки на оценку не влияют (нейтральные 0.5)
+    skill_score = cv_matrix @ required / required_count if required_count else np.full(len(cv_profiles), 0.5)
+
+    required_years = vacancy["experience_years"] or 0.0
+    years = np.array([np.nan if p["experience_years"] is None else p["experience_years"] for p in cv_profiles])
+    if required_years:
+        # Опыт в резюме не указан — не штрафуем
+        experience_score = np.where(np.isnan(years), 1.0, np.minimum(1.0, years / required_years))
+        gaps = np.where(np.isnan(years), 0.0, required_years - years)
+    else:
+        experience_score = np.ones(len(cv_profiles))
+        gaps = np.zeros(len(cv_profiles))
+
+    location_mismatch = np.array([
+        bool(vacancy["city"] and p["city"] and vacancy["city"] != p["city"] and not vacancy["remote"])
+        for p in cv_profiles
+    ])
+    location_score = (~location_mismatch).astype(float)
+
+    scores = np.column_stack([skill_score, experience_score, location_score])
+    return {
+        "relevance_percent": np.rint(scores @ MATCH_WEIGHTS * 100).astype(int),
+        "skill_score": skill_score,
+        "matched": cv_matrix * required,
+        "missing": required * (1 - cv_matrix),
+        "experience_gap": [round(float(g), 1) if g > 0 else None for g in gaps],
+        "location_mismatch": location_mismatch,
+    }
+
+
+def match_skill_names(mask: np.ndarray) -> List[str]:
+    return [SKILL_NAMES[i] for i in np.flatnonzero(mask)]
+
+
+class ProfileExtractor:
+    """Извлечение профилей с LRU-кешем по sha256 текста"""
+
+    def __init__(self, cache_size: int = 2048):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, text: str, kind: str) -> Dict[str, Any]:
+        key = f"{kind}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+        self.misses += 1
+        profile = extract_profile(text, kind)
+        self._cache[key] = profile
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return profile
+
+    def analyze(self, cv_text: str, vacancy_text: str) -> Dict[str, Any]:
+        """Оценка соответствия одного резюме вакансии (см. match_scores)"""
+        cv = self.parse(cv_text, "cv")
+        vacancy = self.parse(vacancy_text, "vacancy")
+        match = match_scores([cv], vacancy)
+        return {
+            "relevance_percent": int(match["relevance_percent"][0]),
+            "matched_skills": match_skill_names(match["matched"][0]),
+            "missing_skills": match_skill_names(match["missing"][0]),
+            "experience_gap": match["experience_gap"][0],
+            "location_mismatch": bool(match["location_mismatch"][0]),
+            "cv": cv,
+            "vacancy": vacancy,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._cache), "max_size": self.cache_size, "hits": self.hits, "misses": self.misses}
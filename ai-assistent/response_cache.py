@@ -0,0 +1,121 @@
+"""
+Кеш ответов LLM: ключ — хеш модели, параметров вызова и полного списка сообщений
+
+Два уровня: LRU в памяти процесса и необязательный общий Redis (для нескольких экземпляров).
+Кешируются только стадии из списка (по умолчанию детальный анализ: его повтор с теми
+же входными данными должен давать тот же ответ). Первый вопрос — часть диалога,
+сэмплированная с ненулевой температурой: его кеширование (LLM_CACHE_STAGES) — осознанный выбор.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import redis.asyncio as aioredis
+
+KEY_PREFIX = "llm_cache:"
+
+
+def response_cache_key(route: Dict[str, Any], messages: List[Dict[str, Any]]) -> str:
+    payload = json.dumps({"route": route, "messages": messages}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    get/set по ключу response_cache_key. Вместе с ответом хранятся длительность
+    и токены исходного вызова — из них считается сэкономленное попаданиями.
+    """
+
+    def __init__(
+        self,
+        stages: Iterable[str] = ("detailed_analysis",),
+        max_entries: int = 1024,
+        ttl: int = 3600,
+        redis_url: Optional[str] = None,
+        enabled: bool = True,
+    ):
+        self.stages = set(stages)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.redis = aioredis.from_url(redis_url) if enabled and redis_url else None
+        # ключ -> (срок, запись {"content", "latency", "tokens"})
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.counters = {"hits": 0, "redis_hits": 0, "misses": 0, "stores": 0, "redis_errors": 0}
+        self.latency_saved = 0.0
+        self.tokens_saved = 0
+
+    def enabled_for(self, stage: str) -> bool:
+        return self.enabled and stage in self.stages
+
+    async def get(self, stage: str, key: str) -> Optional[str]:
+        """Ответ из кеша (None — промах или стадия не кешируется)"""
+        if not self.enabled_for(stage):
+            return None
+        entry = self._get_local(key)
+        if entry is None and self.redis is not None:
+            entry = await self._get_redis(key)
+            if entry is not None:
+                self.counters["redis_hits"] += 1
+                self._set_local(key, entry)
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        self.latency_saved += entry["latency"]
+        self.tokens_saved += entry["tokens"]
+        return entry["content"]
+
+    async def set(self, stage: str, key: str, content: str, latency: float, tokens: int = 0):
+        if not self.enabled_for(stage) or not content:
+            return
+        entry = {"content": content, "latency": round(latency, 3), "tokens": tokens}
+        self._set_local(key, entry)
+        self.counters["stores"] += 1
+        if self.redis is not None:
+            try:
+                await self.redis.set(KEY_PREFIX + key, json.dumps(entry, ensure_ascii=False), ex=self.ttl)
+            except Exception as e:
+                self.counters["redis_errors"] += 1
+                print(f"⚠️ LLM cache: Redis write failed: {e}")
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return item[1]
+
+    def _set_local(self, key: str, entry: Dict[str, Any]):
+        self.entries[key] = (time.time() + self.ttl, entry)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def _get_redis(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self.redis.get(KEY_PREFIX + key)
+        except Exception as e:
+            self.counters["redis_errors"] += 1
+            print(f"⚠️ LLM cache: Redis read failed: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "stages": sorted(self.stages),
+            "redis": self.redis is not None,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            "latency_saved_s": round(self.latency_saved, 1),
+            "tokens_saved": self.tokens_saved,
+        }
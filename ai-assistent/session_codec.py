@@ -0,0 +1,102 @@
+"""
+Кодеки сериализации данных сессий (поля, сообщения, тексты вакансий/резюме)
+
+Формат значения: первый байт — тег формата, дальше полезная нагрузка.
+Значения без тега (первый байт — печатный символ) — JSON старого формата,
+поэтому decode_value читает все, что когда-либо записывалось в Redis,
+независимо от того, каким кодеком сейчас пишет сервис.
+"""
+import json
+import zlib
+from typing import Any, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack не установлен — остается только JSON
+    msgpack = None
+
+TAG_JSON_ZLIB = 0x02
+TAG_MSGPACK = 0x03
+TAG_MSGPACK_ZLIB = 0x04
+DEFAULT_COMPRESS_THRESHOLD = 1024  # байт
+
+
+class SessionCodec:
+    """Базовый кодек: сериализация + zlib-сжатие значений больше порога"""
+
+    name = ""
+    tag = 0
+    compressed_tag = 0
+
+    def __init__(self, compress_threshold: int = DEFAULT_COMPRESS_THRESHOLD, compress_level: int = 6):
+        # compress_threshold <= 0 — не сжимать никогда
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def serialize(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def frame(self, payload: bytes) -> bytes:
+        return bytes([self.tag]) + payload
+
+    def encode(self, value: Any) -> bytes:
+        payload = self.serialize(value)
+        if 0 < self.compress_threshold <= len(payload):
+            compressed = zlib.compress(payload, self.compress_level)
+            # Короткие и уже сжатые данные zlib может только увеличить
+            if len(compressed) < len(payload):
+                return bytes([self.compressed_tag]) + compressed
+        return self.frame(payload)
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        return decode_value(data)
+
+
+class JsonCodec(SessionCodec):
+    """JSON (UTF-8); несжатые значения пишутся без тега — как в старом формате"""
+
+    name = "json"
+    compressed_tag = TAG_JSON_ZLIB
+
+    def serialize(self, value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+    def frame(self, payload: bytes) -> bytes:
+        return payload
+
+
+class MsgpackCodec(SessionCodec):
+    """MessagePack: компактнее JSON и быстрее кодируется"""
+
+    name = "msgpack"
+    tag = TAG_MSGPACK
+    compressed_tag = TAG_MSGPACK_ZLIB
+
+    def serialize(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+
+def decode_value(data: Union[bytes, str]) -> Any:
+    """Декодирует значение любого поддерживаемого формата (по тегу в первом байте)"""
+    if isinstance(data, str):
+        return json.loads(data)
+    tag = data[0] if data else None
+    if tag == TAG_MSGPACK:
+        return msgpack.unpackb(data[1:], raw=False)
+    if tag == TAG_MSGPACK_ZLIB:
+        return msgpack.unpackb(zlib.decompress(data[1:]), raw=False)
+    if tag == TAG_JSON_ZLIB:
+        return json.loads(zlib.decompress(data[1:]))
+    return json.loads(data)
+
+
+def create_codec(name: str = "msgpack", compress_threshold: int = DEFAULT_COMPRESS_THRESHOLD) -> SessionCodec:
+    """Кодек по имени из конфигурации; без msgpack откатывается на JSON"""
+    if name == "msgpack":
+        if msgpack is not None:
+            return MsgpackCodec(compress_threshold)
+        print("⚠️ msgpack is not installed, falling back to JSON session codec")
+        return JsonCodec(compress_threshold)
+    if name == "json":
+        return JsonCodec(compress_threshold)
+    raise ValueError(f"Unknown session codec: {name}")
@@ -0,0 +1,889 @@
+"""
+Хранилище сессий SmartBot в Redis (асинхронный клиент с пулом соединений)
+
+Раскладка ключей:
+    session_meta:{id}      - HASH с полями сессии (значения через кодек), без сообщений
+    session_messages:{id}  - LIST сообщений диалога (через кодек), только дописывается
+    session_summary:{id}   - HASH с краткими полями для списка сессий
+    sessions:by_updated    - ZSET индекс сессий по времени последнего обновления
+    blob:{sha256}          - общий текст вакансии/резюме (один экземпляр на все сессии)
+    blob_refs:{sha256}     - счетчик сессий, ссылающихся на blob
+    session_turn_lock:{id} - владелец текущего хода диалога (SET NX PX, истекает сам)
+    session_turn:{id}:{message_id} - готовый ответ на сообщение кандидата (для повторов)
+    session:{id}           - устаревший формат (весь JSON одной строкой), мигрируется при чтении
+
+В сессии хранятся только хеши текстов вакансии и резюме и сам диалог: системный промпт
+и исходный запрос с вакансией и резюме собираются заново при каждом вызове LLM.
+Значения сериализуются кодеком из session_codec (msgpack/JSON + сжатие), старый JSON читается как есть.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+
+from session_codec import SessionCodec, create_codec, decode_value
+
+LEGACY_PREFIX = "session:"
+META_PREFIX = "session_meta:"
+MESSAGES_PREFIX = "session_messages:"
+SUMMARY_PREFIX = "session_summary:"
+INDEX_KEY = "sessions:by_updated"
+SUMMARY_FIELDS = ("is_completed", "relevance_percent", "question_count", "created_at", "updated_at")
+BLOB_PREFIX = "blob:"
+BLOB_REFS_PREFIX = "blob_refs:"
+TURN_LOCK_PREFIX = "session_turn_lock:"
+TURN_RESULT_PREFIX = "session_turn:"
+# Текстовое поле сессии -> поле с хешем его blob
+BLOB_FIELDS = {"vacancy_text": "vacancy_hash", "cv_text": "cv_hash"}
+
+# Уменьшение счетчика и удаление blob одной атомарной операцией: между ними параллельная
+# запись сессии может снова сослаться на тот же blob (KEYS — пары blob, blob_refs)
+RELEASE_BLOBS_SCRIPT = """
+local released = 0
+for i = 1, #KEYS, 2 do
+    if redis.call('DECR', KEYS[i + 1]) <= 0 then
+        redis.call('DEL', KEYS[i], KEYS[i + 1])
+        released = released + 1
+    end
+end
+return released
+"""
+DEFAULT_TTL = 86400  # 24 часа
+
+
+def decode_fields(raw: Dict[bytes, bytes]) -> Dict[str, Any]:
+    return {name.decode(): decode_value(value) for name, value in raw.items()}
+
+
+def encode_cursor(score: float, session_id: str) -> str:
+    """Курсор списка сессий: score и ID последней выданной записи (score у нескольких сессий может совпадать)"""
+    return f"{score}|{session_id}"
+
+
+def parse_cursor(cursor: Optional[str]) -> tuple:
+    """(score, session_id) из курсора; курсор старого формата — только score"""
+    if not cursor:
+        return None, None
+    score, _, session_id = cursor.partition("|")
+    return float(score), (session_id or None)
+
+
+def after_cursor(score: float, session_id: str, bound_score: Optional[float], bound_id: Optional[str]) -> bool:
+    """
+    Запись идет после курсора в порядке индекса: score по убыванию, при равном score —
+    ID по убыванию (как у ZREVRANGEBYSCORE)
+    """
+    if bound_score is None or score < bound_score:
+        return True
+    return score == bound_score and bound_id is not None and session_id < bound_id
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def strip_initial_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Убирает системный промпт и исходный запрос с вакансией/резюме из сессий старого формата"""
+    if messages and messages[0].get("role") == "system":
+        messages = messages[1:]
+        if messages and messages[0].get("role") == "user" and "<JOB_DESCRIPTION>" in messages[0].get("content", ""):
+            messages = messages[1:]
+    return messages
+
+
+class RedisSessionStore:
+    """
+    Сессии в Redis через redis.asyncio:
+    - явный пул соединений с таймаутами, чтобы медленный Redis не подвешивал все сессии
+    - метаданные отдельно от сообщений: ход диалога — это O(1) RPUSH + HSET в одной транзакции
+    - read-modify-write полей через WATCH/MULTI с повтором при конфликте
+    - ход диалога под коротким замком сессии (SET NX PX), общим для всех воркеров
+    """
+
+    backend = "redis"
+
+    def __init__(
+        self,
+        url: str,
+        ttl: int = DEFAULT_TTL,
+        max_connections: int = 50,
+        socket_timeout: float = 2.0,
+        connect_timeout: float = 2.0,
+        client: Optional[aioredis.Redis] = None,
+        blob_ttl: Optional[int] = None,
+        codec: Optional[SessionCodec] = None,
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.codec = codec or create_codec()
+        # Blob живет дольше сессии: TTL продлевается каждой сессией, которая на него ссылается
+        self.blob_ttl = blob_ttl or ttl * 2
+        if client is None:
+            pool = aioredis.ConnectionPool.from_url(
+                url,
+                max_connections=max_connections,
+                socket_timeout=socket_timeout,
+                socket_connect_timeout=connect_timeout,
+                health_check_interval=30,
+            )
+            client = aioredis.Redis(connection_pool=pool)
+        # Значения бинарные (кодек), поэтому клиент должен работать с bytes (decode_responses=False)
+        self.redis = client
+        self._release_blobs_script = client.register_script(RELEASE_BLOBS_SCRIPT)
+        self.available = False
+
+    def encode_fields(self, fields: Dict[str, Any]) -> Dict[str, bytes]:
+        return {name: self.codec.encode(value) for name, value in fields.items()}
+
+    @staticmethod
+    def meta_key(session_id: str) -> str:
+        return f"{META_PREFIX}{session_id}"
+
+    @staticmethod
+    def messages_key(session_id: str) -> str:
+        return f"{MESSAGES_PREFIX}{session_id}"
+
+    @staticmethod
+    def legacy_key(session_id: str) -> str:
+        return f"{LEGACY_PREFIX}{session_id}"
+
+    @staticmethod
+    def summary_key(session_id: str) -> str:
+        return f"{SUMMARY_PREFIX}{session_id}"
+
+    @staticmethod
+    def blob_key(blob_hash: str) -> str:
+        return f"{BLOB_PREFIX}{blob_hash}"
+
+    @staticmethod
+    def blob_refs_key(blob_hash: str) -> str:
+        return f"{BLOB_REFS_PREFIX}{blob_hash}"
+
+    @staticmethod
+    def turn_lock_key(session_id: str) -> str:
+        return f"{TURN_LOCK_PREFIX}{session_id}"
+
+    @staticmethod
+    def turn_result_key(session_id: str, message_id: str) -> str:
+        return f"{TURN_RESULT_PREFIX}{session_id}:{message_id}"
+
+    async def connect(self) -> bool:
+        """Проверяет соединение (вызывается при старте приложения)"""
+        try:
+            await self.redis.ping()
+            self.available = True
+            print(f"✅ Connected to Redis at {self.url}")
+        except Exception as e:
+            self.available = False
+            print(f"❌ Failed to connect to Redis: {e}")
+        return self.available
+
+    async def close(self):
+        await self.redis.aclose()
+
+    def _index(self, pipe, session_id: str, fields: Dict[str, Any], expire_seconds: int):
+        """Команды обновления краткой записи и индекса по времени обновления"""
+        summary = {name: fields[name] for name in SUMMARY_FIELDS if name in fields}
+        summary_key = self.summary_key(session_id)
+        now = time.time()
+        if summary:
+            pipe.hset(summary_key, mapping=self.encode_fields(summary))
+        pipe.expire(summary_key, expire_seconds)
+        pipe.zadd(INDEX_KEY, {session_id: now})
+        # Попутно вычищаем из индекса сессии, которые уже точно истекли
+        pipe.zremrangebyscore(INDEX_KEY, "-inf", now - self.ttl)
+
+    def _touch_blobs(self, pipe, blob_hashes: Iterable[Optional[str]]):
+        """Продлевает TTL blob, на которые ссылается активная сессия"""
+        for blob_hash in blob_hashes:
+            if blob_hash:
+                pipe.expire(self.blob_key(blob_hash), self.blob_ttl)
+                pipe.expire(self.blob_refs_key(blob_hash), self.blob_ttl)
+
+    async def _release_blobs(self, blob_hashes: Iterable[Optional[str]]):
+        """Уменьшает счетчики ссылок; blob без ссылок удаляется"""
+        blob_hashes = [h for h in blob_hashes if h]
+        if not blob_hashes:
+            return
+        keys = []
+        for blob_hash in blob_hashes:
+            keys += [self.blob_key(blob_hash), self.blob_refs_key(blob_hash)]
+        await self._release_blobs_script(keys=keys)
+
+    def _write_session(self, pipe, session_id: str, session: Dict[str, Any], expire_seconds: int):
+        """Команды полной записи сессии (добавляются в переданный pipeline)"""
+        fields = {name: value for name, value in session.items() if name != "messages" and name not in BLOB_FIELDS}
+        for text_field, hash_field in BLOB_FIELDS.items():
+            text = session.get(text_field)
+            fields[hash_field] = content_hash(text) if text is not None else None
+            if text is not None:
+                pipe.set(self.blob_key(fields[hash_field]), self.codec.encode(text), ex=self.blob_ttl)
+                pipe.incr(self.blob_refs_key(fields[hash_field]))
+                pipe.expire(self.blob_refs_key(fields[hash_field]), self.blob_ttl)
+        meta_key = self.meta_key(session_id)
+        messages_key = self.messages_key(session_id)
+        pipe.delete(meta_key, messages_key, self.summary_key(session_id), self.legacy_key(session_id))
+        pipe.hset(meta_key, mapping=self.encode_fields(fields))
+        self._index(pipe, session_id, fields, expire_seconds)
+        messages = session.get("messages", [])
+        if messages:
+            pipe.rpush(messages_key, *[self.codec.encode(m) for m in messages])
+        pipe.expire(meta_key, expire_seconds)
+        pipe.expire(messages_key, expire_seconds)
+
+    async def create(self, session_id: str, session: Dict[str, Any], expire_seconds: Optional[int] = None):
+        """
+        Записать сессию целиком (новая сессия или перезапуск существующей).
+        vacancy_text/cv_text сохраняются как общие blob, в сессии остаются только хеши.
+        """
+        if not self.available:
+            return
+        try:
+            # Ссылки перезаписываемой сессии освобождаем после записи новых
+            previous = await self.redis.hmget(self.meta_key(session_id), *BLOB_FIELDS.values())
+            async with self.redis.pipeline(transaction=True) as pipe:
+                self._write_session(pipe, session_id, session, expire_seconds or self.ttl)
+                await pipe.execute()
+            await self._release_blobs(decode_value(h) for h in previous if h)
+        except Exception as e:
+            print(f"Error saving session {session_id}: {e}")
+
+    async def append(
+        self,
+        session_id: str,
+        messages: List[Dict[str, Any]],
+        fields: Dict[str, Any],
+        blob_hashes: Iterable[Optional[str]] = (),
+    ):
+        """
+        Дописать сообщения хода и обновить поля одной транзакцией (без перезаписи истории).
+        blob_hashes — хеши текстов сессии, чтобы продлить их TTL вместе с сессией.
+        """
+        if not self.available:
+            return
+        meta_key = self.meta_key(session_id)
+        messages_key = self.messages_key(session_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                if messages:
+                    pipe.rpush(messages_key, *[self.codec.encode(m) for m in messages])
+                if fields:
+                    pipe.hset(meta_key, mapping=self.encode_fields(fields))
+                self._index(pipe, session_id, fields, self.ttl)
+                self._touch_blobs(pipe, blob_hashes)
+                pipe.expire(meta_key, self.ttl)
+                pipe.expire(messages_key, self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Error saving session {session_id}: {e}")
+
+    async def _migrate_legacy(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Переносит сессию из устаревшего JSON-блоба в новую раскладку"""
+        legacy_key = self.legacy_key(session_id)
+        raw = await self.redis.get(legacy_key)
+        if not raw:
+            return None
+        session = json.loads(raw)
+        session["messages"] = strip_initial_messages(session.get("messages", []))
+        ttl = await self.redis.ttl(legacy_key)
+        await self.create(session_id, session, expire_seconds=ttl if ttl and ttl > 0 else self.ttl)
+        print(f"🔄 Migrated legacy session {session_id}")
+        return session
+
+    async def _externalize_texts(self, session_id: str, session: Dict[str, Any]):
+        """Переносит тексты, хранившиеся прямо в полях сессии, в общие blob"""
+        session["messages"] = strip_initial_messages(session.get("messages", []))
+        ttl = await self.redis.ttl(self.meta_key(session_id))
+        await self.create(session_id, session, expire_seconds=ttl if ttl and ttl > 0 else self.ttl)
+        print(f"🔄 Moved texts of session {session_id} to shared blobs")
+
+    async def _resolve_texts(self, session: Dict[str, Any]):
+        """Подставляет тексты вакансии и резюме из blob по хешам"""
+        hash_fields = list(BLOB_FIELDS.values())
+        keys = [self.blob_key(session[h]) for h in hash_fields if session.get(h)]
+        texts = iter(await self.redis.mget(keys)) if keys else iter(())
+        for text_field, hash_field in BLOB_FIELDS.items():
+            if session.get(hash_field):
+                text = next(texts)
+                session[text_field] = decode_value(text) if text is not None else None
+            else:
+                session[text_field] = None
+
+    async def _read(self, session_id: str, with_messages: bool) -> Optional[Dict[str, Any]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self.meta_key(session_id))
+            if with_messages:
+                pipe.lrange(self.messages_key(session_id), 0, -1)
+            else:
+                pipe.llen(self.messages_key(session_id))
+            meta, messages = await pipe.execute()
+
+        if not meta:
+            if not await self._migrate_legacy(session_id):
+                return None
+            return await self._read(session_id, with_messages)
+
+        session = decode_fields(meta)
+        if with_messages or "vacancy_hash" not in session:
+            raw_messages = messages if with_messages else await self.redis.lrange(self.messages_key(session_id), 0, -1)
+            session["messages"] = [decode_value(m) for m in raw_messages]
+        if "vacancy_hash" not in session:
+            # Сессия записана до появления общих blob
+            await self._externalize_texts(session_id, session)
+            return await self._read(session_id, with_messages)
+
+        await self._resolve_texts(session)
+        if not with_messages:
+            session.pop("messages", None)
+            session["message_count"] = messages
+        return session
+
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Получить сессию вместе с сообщениями диалога и текстами вакансии/резюме"""
+        if not self.available:
+            return None
+        try:
+            return await self._read(session_id, with_messages=True)
+        except Exception as e:
+            print(f"Error getting session {session_id}: {e}")
+            return None
+
+    async def load_meta(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Получить поля сессии без сообщений (плюс message_count)"""
+        if not self.available:
+            return None
+        try:
+            return await self._read(session_id, with_messages=False)
+        except Exception as e:
+            print(f"Error getting session {session_id}: {e}")
+            return None
+
+    async def update(
+        self,
+        session_id: str,
+        mutate: Callable[[Dict[str, Any]], Awaitable[None]],
+        retries: int = 5,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Атомарный read-modify-write полей сессии: WATCH, изменение, MULTI/EXEC.
+        При конкурентной записи операция повторяется.
+        """
+        if not self.available:
+            return None
+        meta_key = self.meta_key(session_id)
+        for _ in range(retries):
+            try:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    await pipe.watch(meta_key)
+                    raw = await pipe.hgetall(meta_key)
+                    if not raw:
+                        return None
+                    session = decode_fields(raw)
+                    await mutate(session)
+                    pipe.multi()
+                    pipe.hset(meta_key, mapping=self.encode_fields(session))
+                    self._index(pipe, session_id, session, self.ttl)
+                    await pipe.execute()
+                    return session
+            except WatchError:
+                continue
+        print(f"Error updating session {session_id}: too many concurrent writes")
+        return None
+
+    async def try_lock_turn(self, session_id: str, token: str, ttl: float) -> bool:
+        """
+        Занять ход диалога: True, если замок взят. Замок истекает через ttl секунд,
+        поэтому упавший воркер не блокирует сессию навсегда.
+        """
+        if not self.available:
+            return True
+        try:
+            return bool(await self.redis.set(self.turn_lock_key(session_id), token, nx=True, px=int(ttl * 1000)))
+        except Exception as e:
+            # Без Redis сохранить ход все равно не получится — не блокируем диалог
+            print(f"Error locking session {session_id}: {e}")
+            return True
+
+    async def turn_lock_owner(self, session_id: str) -> Optional[str]:
+        """Токен текущего владельца хода (None — ход свободен)"""
+        if not self.available:
+            return None
+        try:
+            owner = await self.redis.get(self.turn_lock_key(session_id))
+            return owner.decode() if owner else None
+        except Exception as e:
+            print(f"Error reading lock of session {session_id}: {e}")
+            return None
+
+    async def unlock_turn(self, session_id: str, token: str):
+        """Освободить ход, только если замок все еще наш (WATCH: сравнение и удаление атомарны)"""
+        if not self.available:
+            return
+        lock_key = self.turn_lock_key(session_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(lock_key)
+                owner = await pipe.get(lock_key)
+                if owner is None or owner.decode() != token:
+                    await pipe.unwatch()
+                    print(f"⚠️ Turn lock of session {session_id} expired before the turn finished")
+                    return
+                pipe.multi()
+                pipe.delete(lock_key)
+                await pipe.execute()
+        except WatchError:
+            # Замок истек и его уже взял другой ход — он освободит его сам
+            pass
+        except Exception as e:
+            print(f"Error unlocking session {session_id}: {e}")
+
+    async def save_turn_result(self, session_id: str, message_id: str, result: Dict[str, Any], ttl: int):
+        """Запомнить ответ на сообщение кандидата, чтобы повтор получил его без вызова LLM"""
+        if not self.available:
+            return
+        try:
+            await self.redis.set(self.turn_result_key(session_id, message_id), self.codec.encode(result), ex=ttl)
+        except Exception as e:
+            print(f"Error saving turn result of session {session_id}: {e}")
+
+    async def load_turn_result(self, session_id: str, message_id: str) -> Optional[Dict[str, Any]]:
+        if not self.available:
+            return None
+        try:
+            raw = await self.redis.get(self.turn_result_key(session_id, message_id))
+            return decode_value(raw) if raw else None
+        except Exception as e:
+            print(f"Error reading turn result of session {session_id}: {e}")
+            return None
+
+    async def delete(self, session_id: str):
+        """Удалить сессию вместе с историей LangChain и записью в индексе"""
+        if not self.available:
+            return
+        try:
+            blob_hashes = await self.redis.hmget(self.meta_key(session_id), *BLOB_FIELDS.values())
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(
+                    self.meta_key(session_id),
+                    self.messages_key(session_id),
+                    self.summary_key(session_id),
+                    self.legacy_key(session_id),
+                    f"message_store:langchain:{session_id}",
+                )
+                pipe.zrem(INDEX_KEY, session_id)
+                await pipe.execute()
+            await self._release_blobs(decode_value(h) for h in blob_hashes if h)
+        except Exception as e:
+            print(f"Error deleting session {session_id}: {e}")
+
+    async def list_summaries(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        completed: Optional[bool] = None,
+        min_relevance: Optional[int] = None,
+        max_relevance: Optional[int] = None,
+        max_scan: int = 1000,
+    ) -> Dict[str, Any]:
+        """
+        Страница кратких записей сессий (новые сверху) по индексу sessions:by_updated.
+        Полные сессии не читаются. cursor — score и ID последней выданной записи: границу берем
+        включительно и отбрасываем уже выданное, чтобы не потерять сессии с тем же score;
+        за один вызов просматривается не более max_scan записей индекса.
+        """
+        result = {"sessions": [], "next_cursor": None, "total": 0}
+        if not self.available:
+            return result
+        try:
+            result["total"] = await self.redis.zcard(INDEX_KEY)
+            bound_score, bound_id = parse_cursor(cursor)
+            offset = 0
+            scanned = 0
+            batch_size = max(limit, 100)
+            while len(result["sessions"]) < limit and scanned < max_scan:
+                fetched = await self.redis.zrevrangebyscore(
+                    INDEX_KEY, "+inf" if bound_score is None else bound_score, "-inf",
+                    start=offset, num=batch_size, withscores=True
+                )
+                if not fetched:
+                    result["next_cursor"] = None
+                    return result
+                batch = [
+                    (sid.decode(), score) for sid, score in fetched
+                    if after_cursor(score, sid.decode(), bound_score, bound_id)
+                ]
+                if not batch:
+                    # Вся пачка — уже выданные записи с тем же score: смотрим дальше
+                    offset += len(fetched)
+                    continue
+                offset = 0
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for sid, _ in batch:
+                        pipe.hgetall(self.summary_key(sid))
+                    summaries = await pipe.execute()
+
+                expired = []
+                for (sid, score), raw in zip(batch, summaries):
+                    scanned += 1
+                    bound_score, bound_id = score, sid
+                    result["next_cursor"] = encode_cursor(score, sid)
+                    if not raw:
+                        expired.append(sid)
+                        continue
+                    summary = decode_fields(raw)
+                    if completed is not None and summary.get("is_completed", False) != completed:
+                        continue
+                    relevance = summary.get("relevance_percent", 0)
+                    if min_relevance is not None and relevance < min_relevance:
+                        continue
+                    if max_relevance is not None and relevance > max_relevance:
+                        continue
+                    result["sessions"].append({"session_id": sid, **summary})
+                    if len(result["sessions"]) >= limit:
+                        break
+                if expired:
+                    # Сессия истекла по TTL, а запись в индексе осталась
+                    await self.redis.zrem(INDEX_KEY, *expired)
+                if len(fetched) < batch_size and len(result["sessions"]) < limit:
+                    result["next_cursor"] = None
+                    return result
+            return result
+        except Exception as e:
+            print(f"Error listing sessions: {e}")
+            return result
+
+    async def rebuild_index(self):
+        """
+        Добавляет в индекс сессии, созданные до его появления (SCAN, без блокирующего KEYS).
+        Устаревшие JSON-сессии попутно мигрируются.
+        """
+        if not self.available:
+            return
+        try:
+            indexed = 0
+            async for key in self.redis.scan_iter(match=f"{META_PREFIX}*", count=500):
+                sid = key.decode()[len(META_PREFIX):]
+                if await self.redis.zscore(INDEX_KEY, sid) is None:
+                    meta = decode_fields(await self.redis.hgetall(key))
+                    async with self.redis.pipeline(transaction=False) as pipe:
+                        self._index(pipe, sid, meta, self.ttl)
+                        await pipe.execute()
+                    indexed += 1
+            async for key in self.redis.scan_iter(match=f"{LEGACY_PREFIX}*", count=500):
+                if await self._migrate_legacy(key.decode()[len(LEGACY_PREFIX):]):
+                    indexed += 1
+            if indexed:
+                print(f"✅ Indexed {indexed} existing sessions")
+        except Exception as e:
+            print(f"Error rebuilding session index: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "available": self.available}
+
+
+class MemorySessionStore:
+    """
+    Сессии в памяти процесса: LRU с ограничением числа сессий и TTL.
+    Тот же интерфейс, что у RedisSessionStore — для одного узла, тестов и работы без Redis.
+    """
+
+    backend = "memory"
+
+    def __init__(self, max_sessions: int = 10000, ttl: int = DEFAULT_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # session_id -> {"meta": поля, "messages": диалог, "updated": время для списка, "expires_at": срок}
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.evictions = 0
+        self.available = False
+        self._update_lock = asyncio.Lock()
+        # session_id -> (токен владельца хода, срок); (session_id, message_id) -> (ответ, срок)
+        self.turn_locks: Dict[str, tuple] = {}
+        self.turn_results: Dict[tuple, tuple] = {}
+
+    async def connect(self) -> bool:
+        self.available = True
+        return True
+
+    async def close(self):
+        pass
+
+    def _get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(session_id)
+        if entry is None:
+            return None
+        if entry["expires_at"] <= time.time():
+            del self.entries[session_id]
+            return None
+        self.entries.move_to_end(session_id)
+        return entry
+
+    def _touch(self, entry: Dict[str, Any], expire_seconds: Optional[int] = None):
+        now = time.time()
+        entry["updated"] = now
+        entry["expires_at"] = now + (expire_seconds or self.ttl)
+
+    def _evict(self):
+        """Сначала выбрасываем истекшие сессии, затем самые давно использованные"""
+        now = time.time()
+        for sid in [sid for sid, entry in self.entries.items() if entry["expires_at"] <= now]:
+            del self.entries[sid]
+        while len(self.entries) > self.max_sessions:
+            sid, _ = self.entries.popitem(last=False)
+            self.evictions += 1
+            print(f"⚠️ Session {sid} evicted from memory store (max_sessions={self.max_sessions})")
+
+    async def create(self, session_id: str, session: Dict[str, Any], expire_seconds: Optional[int] = None):
+        """Записать сессию целиком (новая сессия или перезапуск существующей)"""
+        # Глубокие копии: как и у Redis, сохраненная сессия не зависит от объектов вызывающего кода
+        entry = copy.deepcopy({
+            "meta": {name: value for name, value in session.items() if name != "messages"},
+            "messages": list(session.get("messages", [])),
+        })
+        self._touch(entry, expire_seconds)
+        self.entries[session_id] = entry
+        self.entries.move_to_end(session_id)
+        if len(self.entries) > self.max_sessions:
+            self._evict()
+
+    async def append(
+        self,
+        session_id: str,
+        messages: List[Dict[str, Any]],
+        fields: Dict[str, Any],
+        blob_hashes: Iterable[Optional[str]] = (),
+    ):
+        """Дописать сообщения хода и обновить поля"""
+        entry = self._get(session_id)
+        if entry is None:
+            print(f"Error saving session {session_id}: session expired or evicted")
+            return
+        entry["messages"].extend(copy.deepcopy(messages))
+        entry["meta"].update(copy.deepcopy(fields))
+        self._touch(entry)
+
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Копия сессии: вызывающий код дописывает в нее сообщения и меняет вложенные поля
+        (llm_usage, triage) до сохранения хода — глубокая, чтобы неудачный ход не менял хранилище
+        """
+        entry = self._get(session_id)
+        if entry is None:
+            return None
+        return copy.deepcopy({**entry["meta"], "messages": entry["messages"]})
+
+    async def load_meta(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._get(session_id)
+        if entry is None:
+            return None
+        return {**copy.deepcopy(entry["meta"]), "message_count": len(entry["messages"])}
+
+    async def update(
+        self,
+        session_id: str,
+        mutate: Callable[[Dict[str, Any]], Awaitable[None]],
+        retries: int = 5,
+    ) -> Optional[Dict[str, Any]]:
+        """Read-modify-write полей сессии (изменения сериализуются общей блокировкой)"""
+        async with self._update_lock:
+            entry = self._get(session_id)
+            if entry is None:
+                return None
+            session = copy.deepcopy(entry["meta"])
+            await mutate(session)
+            entry["meta"] = session
+            self._touch(entry)
+            return copy.deepcopy(session)
+
+    async def try_lock_turn(self, session_id: str, token: str, ttl: float) -> bool:
+        """Занять ход диалога (замок истекает через ttl секунд)"""
+        if await self.turn_lock_owner(session_id) is not None:
+            return False
+        self.turn_locks[session_id] = (token, time.time() + ttl)
+        return True
+
+    async def turn_lock_owner(self, session_id: str) -> Optional[str]:
+        lock = self.turn_locks.get(session_id)
+        if lock is None:
+            return None
+        if lock[1] <= time.time():
+            del self.turn_locks[session_id]
+            return None
+        return lock[0]
+
+    async def unlock_turn(self, session_id: str, token: str):
+        if await self.turn_lock_owner(session_id) == token:
+            del self.turn_locks[session_id]
+
+    async def save_turn_result(self, session_id: str, message_id: str, result: Dict[str, Any], ttl: int):
+        now = time.time()
+        if len(self.turn_results) >= self.max_sessions:
+            for key in [key for key, (_, expires_at) in self.turn_results.items() if expires_at <= now]:
+                del self.turn_results[key]
+            # Все еще много — выбрасываем самые старые ответы (dict хранит порядок вставки)
+            while len(self.turn_results) >= self.max_sessions:
+                del self.turn_results[next(iter(self.turn_results))]
+        self.turn_results[(session_id, message_id)] = (result, now + ttl)
+
+    async def load_turn_result(self, session_id: str, message_id: str) -> Optional[Dict[str, Any]]:
+        stored = self.turn_results.get((session_id, message_id))
+        if stored is None or stored[1] <= time.time():
+            return None
+        return stored[0]
+
+    async def delete(self, session_id: str):
+        self.entries.pop(session_id, None)
+
+    async def list_summaries(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        completed: Optional[bool] = None,
+        min_relevance: Optional[int] = None,
+        max_relevance: Optional[int] = None,
+        max_scan: int = 1000,
+    ) -> Dict[str, Any]:
+        """Страница кратких записей (новые сверху), курсор — как у RedisSessionStore"""
+        self._evict()
+        ordered = sorted(self.entries.items(), key=lambda item: (item[1]["updated"], item[0]), reverse=True)
+        bound_score, bound_id = parse_cursor(cursor)
+        ordered = [(sid, entry) for sid, entry in ordered if after_cursor(entry["updated"], sid, bound_score, bound_id)]
+        result = {"sessions": [], "next_cursor": None, "total": len(self.entries)}
+        for sid, entry in ordered[:max_scan]:
+            result["next_cursor"] = encode_cursor(entry["updated"], sid)
+            meta = entry["meta"]
+            if completed is not None and meta.get("is_completed", False) != completed:
+                continue
+            relevance = meta.get("relevance_percent", 0)
+            if min_relevance is not None and relevance < min_relevance:
+                continue
+            if max_relevance is not None and relevance > max_relevance:
+                continue
+            result["sessions"].append({"session_id": sid, **{name: meta[name] for name in SUMMARY_FIELDS if name in meta}})
+            if len(result["sessions"]) >= limit:
+                break
+        else:
+            if len(ordered) <= max_scan:
+                # Дошли до конца списка
+                result["next_cursor"] = None
+        return result
+
+    async def rebuild_index(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "available": self.available,
+            "sessions": len(self.entries),
+            "max_sessions": self.max_sessions,
+            "evictions": self.evictions,
+        }
+
+
+class FileSnapshotSessionStore(MemorySessionStore):
+    """
+    Сессии в памяти с периодическим снимком в JSON-файл: переживают перезапуск процесса.
+    Снимок пишется атомарно (временный файл + rename) только если были изменения.
+    """
+
+    backend = "file"
+
+    def __init__(self, path: str, interval: float = 30.0, max_sessions: int = 10000, ttl: int = DEFAULT_TTL):
+        super().__init__(max_sessions=max_sessions, ttl=ttl)
+        self.path = path
+        self.interval = interval
+        self.dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> bool:
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+                now = time.time()
+                for sid, entry in snapshot.get("sessions", {}).items():
+                    if entry["expires_at"] > now:
+                        self.entries[sid] = entry
+                self.entries = OrderedDict(sorted(self.entries.items(), key=lambda item: item[1]["updated"]))
+                print(f"✅ Loaded {len(self.entries)} sessions from {self.path}")
+            except Exception as e:
+                print(f"❌ Failed to load session snapshot {self.path}: {e}")
+        self._task = asyncio.create_task(self._snapshot_loop())
+        return await super().connect()
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.snapshot()
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.snapshot()
+
+    def _write(self, data: str):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    async def snapshot(self):
+        """Сохраняет все сессии в файл; сериализация — в цикле событий, запись — в потоке"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            data = json.dumps({"sessions": self.entries, "saved_at": time.time()}, ensure_ascii=False)
+            await asyncio.to_thread(self._write, data)
+        except Exception as e:
+            self.dirty = True
+            print(f"❌ Failed to write session snapshot {self.path}: {e}")
+
+    async def create(self, session_id: str, session: Dict[str, Any], expire_seconds: Optional[int] = None):
+        await super().create(session_id, session, expire_seconds)
+        self.dirty = True
+
+    async def append(self, session_id: str, messages: List[Dict[str, Any]], fields: Dict[str, Any], blob_hashes=()):
+        await super().append(session_id, messages, fields, blob_hashes)
+        self.dirty = True
+
+    async def update(self, session_id: str, mutate, retries: int = 5) -> Optional[Dict[str, Any]]:
+        session = await super().update(session_id, mutate, retries)
+        self.dirty = True
+        return session
+
+    async def delete(self, session_id: str):
+        await super().delete(session_id)
+        self.dirty = True
+
+
+def create_session_store(backend: str, redis_url: str, **options) -> Any:
+    """
+    Хранилище сессий по имени backend: redis | memory | file.
+    options: max_connections, socket_timeout, codec (redis); max_sessions, snapshot_path, snapshot_interval
+    """
+    if backend == "redis":
+        return RedisSessionStore(
+            redis_url,
+            max_connections=options.get("max_connections", 50),
+            socket_timeout=options.get("socket_timeout", 2.0),
+            codec=options.get("codec"),
+        )
+    if backend == "memory":
+        return MemorySessionStore(max_sessions=options.get("max_sessions", 10000))
+    if backend == "file":
+        return FileSnapshotSessionStore(
+            options.get("snapshot_path", "sessions_snapshot.json"),
+            interval=options.get("snapshot_interval", 30.0),
+            max_sessions=options.get("max_sessions", 10000),
+        )
+    raise ValueError(f"Unknown session backend: {backend}")
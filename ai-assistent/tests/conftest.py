@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Модули ассистента лежат плоско в ai-assistent/ и импортируются по имени (как в main.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,51 @@
+from datetime import date
+
+import pytest
+
+from profile_extractor import ProfileExtractor, extract_experience_years
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return ProfileExtractor()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("опыт 5 лет", 5.0),
+    ("стаж 1,5 года", 1.5),
+    ("опыт 10+ лет", 10.0),
+    ("опыт 3 - 5 лет", 3.0),
+    ("опыт 3-5 лет", 3.0),
+    ("experience 2 years", 2.0),
+])
+def test_explicit_years(text, expected):
+    assert extract_experience_years(text, "cv") == expected
+
+
+@pytest.mark.parametrize("text", [
+    "опыт: 2015 год — начал работать",
+    "опыт работы с 2019 года",
+    "опыт работы, 2020 года выпуска",
+    "опыт: выпуск 2021 года",
+])
+def test_calendar_year_is_not_experience(text):
+    assert extract_experience_years(text, "cv") is None
+
+
+def test_year_range_with_word_year_counts_as_period():
+    text = "опыт работы с 2019 года по настоящее время, python"
+    assert extract_experience_years(text, "cv") == float(date.today().year - 2019)
+
+
+def test_year_range_sums_periods():
+    assert extract_experience_years("2015 - 2018 java, 2018 — 2021 python", "cv") == 6.0
+
+
+def test_vacancy_takes_minimum_requirement():
+    assert extract_experience_years("требуется опыт от 3 лет, проект стартовал в 2024 году", "vacancy") == 3.0
+
+
+def test_calendar_year_does_not_inflate_seniority(extractor):
+    profile = extractor.parse("Опыт работы с 2024 года по настоящее время. Python, Django", "cv")
+    assert profile["experience_years"] == float(date.today().year - 2024)
+    assert profile["experience_years"] < 20
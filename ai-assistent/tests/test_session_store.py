@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from session_store import MemorySessionStore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_session(session_id: str) -> dict:
+    return {
+        "session_id": session_id,
+        "vacancy_text": "Python Developer",
+        "is_completed": False,
+        "llm_usage": {"calls": 1, "prompt_tokens": 100},
+        "messages": [{"role": "assistant", "content": "Здравствуйте!"}],
+    }
+
+
+def test_memory_load_does_not_share_nested_fields():
+    store = MemorySessionStore()
+
+    async def scenario():
+        await store.connect()
+        await store.create("s1", make_session("s1"))
+        # Ход меняет вложенные поля загруженной копии и падает, не сохранив ее
+        session = await store.load("s1")
+        session["llm_usage"]["calls"] += 1
+        session["messages"][0]["content"] = "изменено"
+        return await store.load("s1")
+
+    stored = run(scenario())
+    assert stored["llm_usage"]["calls"] == 1
+    assert stored["messages"][0]["content"] == "Здравствуйте!"
+
+
+def test_memory_create_copies_caller_objects():
+    store = MemorySessionStore()
+    session = make_session("s1")
+
+    async def scenario():
+        await store.connect()
+        await store.create("s1", session)
+        session["llm_usage"]["calls"] = 99
+        return await store.load_meta("s1")
+
+    assert run(scenario())["llm_usage"]["calls"] == 1
+
+
+def test_memory_update_saves_nested_changes():
+    store = MemorySessionStore()
+
+    async def scenario():
+        await store.connect()
+        await store.create("s1", make_session("s1"))
+
+        async def mutate(session):
+            session["llm_usage"]["calls"] += 1
+
+        await store.update("s1", mutate)
+        return await store.load_meta("s1")
+
+    assert run(scenario())["llm_usage"]["calls"] == 2
+
+
+def collect_pages(store, limit: int) -> list:
+    async def scenario():
+        seen, cursor = [], None
+        while True:
+            page = await store.list_summaries(limit=limit, cursor=cursor)
+            seen.extend(item["session_id"] for item in page["sessions"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    return run(scenario())
+
+
+def test_memory_pages_keep_sessions_with_equal_updated_time():
+    store = MemorySessionStore()
+
+    async def scenario():
+        await store.connect()
+        for index in range(7):
+            await store.create(f"s{index}", make_session(f"s{index}"))
+        for entry in store.entries.values():
+            entry["updated"] = 1000.0
+
+    run(scenario())
+    assert sorted(collect_pages(store, limit=2)) == [f"s{index}" for index in range(7)]
+
+
+def test_redis_pages_keep_sessions_with_equal_score():
+    fakeredis = pytest.importorskip("fakeredis")
+    from session_store import INDEX_KEY, RedisSessionStore
+
+    client = fakeredis.FakeAsyncRedis()
+    store = RedisSessionStore("redis://fake", client=client)
+
+    async def scenario():
+        await store.connect()
+        for index in range(7):
+            await store.create(f"s{index}", make_session(f"s{index}"))
+        # Несколько сессий, обновленных в одну и ту же миллисекунду
+        await client.zadd(INDEX_KEY, {f"s{index}": 1000.0 for index in range(5)})
+
+    run(scenario())
+    pages = collect_pages(store, limit=2)
+    assert sorted(pages) == [f"s{index}" for index in range(7)]
+    assert len(pages) == len(set(pages))
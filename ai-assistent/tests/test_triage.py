@@ -0,0 +1,80 @@
+import pytest
+
+from profile_extractor import ProfileExtractor
+from triage import Triage
+
+VACANCY = "Senior Python разработчик. Требования: опыт от 5 лет, Python, Django, PostgreSQL, Docker, Redis. Москва."
+
+CVS = {
+    "strong": "Python разработчик, Москва. Опыт работы 7 лет. Стек: Python, Django, PostgreSQL, Docker, Redis, Celery. "
+              "Разрабатывал высоконагруженные сервисы.",
+    "strong_by_dates": "Python разработчик, Москва. Опыт работы с 2017 года по 2024 год. "
+                       "Стек: Python, Django, PostgreSQL, Docker, Redis.",
+    "junior_by_dates": "Начинающий разработчик, Москва. Опыт работы с 2025 года по настоящее время. Python, Django. "
+                       "Учебные проекты на Flask и SQLite.",
+    "partial": "Разработчик, Москва. Опыт работы 4 года. Python, Flask, MySQL. "
+               "Писал REST API и интеграции с внешними сервисами, немного Docker.",
+    "mismatch": "Бухгалтер, Казань. Опыт работы 10 лет. 1С, Excel, налоговая отчетность, "
+                "первичная документация, сверка с контрагентами.",
+    "placeholder": "[Текст не удалось извлечь из файла resume.pdf]",
+    "short": "Python, Django",
+}
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return ProfileExtractor()
+
+
+@pytest.fixture
+def decisions(extractor):
+    triage = Triage(extractor)
+    return dict(zip(CVS, triage.assess_many(list(CVS.values()), VACANCY)))
+
+
+def test_verdicts_with_default_thresholds(decisions):
+    assert {name: d["verdict"] for name, d in decisions.items()} == {
+        "strong": "priority",
+        "strong_by_dates": "priority",
+        "junior_by_dates": "dialog",
+        "partial": "dialog",
+        "mismatch": "reject",
+        "placeholder": "reject",
+        "short": "dialog",
+    }
+
+
+def test_calendar_years_do_not_hide_experience_gap(decisions):
+    # Раньше "с 2025 года" читалось как 20 лет опыта, и младший кандидат проходил без exp_gap
+    assert "exp_gap" in decisions["junior_by_dates"]["rejection_tags"]
+    assert "exp_gap" not in decisions["strong_by_dates"]["rejection_tags"]
+
+
+def test_mismatch_reasons_and_tags(decisions):
+    mismatch = decisions["mismatch"]
+    assert mismatch["score"] < 25
+    assert set(mismatch["rejection_tags"]) >= {"skill_mismatch", "relocation"}
+    assert set(mismatch["missing_skills"]) >= {"Python", "Django"}
+
+
+def test_placeholder_and_short_cv_skip_scoring(decisions):
+    assert decisions["placeholder"]["score"] == 0
+    assert decisions["short"]["score"] is None
+
+
+def test_thresholds_are_configurable(extractor):
+    strict = Triage(extractor, reject_below=50, priority_above=101)
+    verdicts = [d["verdict"] for d in strict.assess_many([CVS["strong"], CVS["junior_by_dates"], CVS["partial"]], VACANCY)]
+    assert verdicts == ["dialog", "reject", "dialog"]
+    assert strict.stats()["reject"] == 1
+
+
+def test_disabled_triage_sends_everyone_to_dialog(extractor):
+    triage = Triage(extractor, enabled=False)
+    assert {d["verdict"] for d in triage.assess_many(list(CVS.values()), VACANCY)} == {"dialog"}
+
+
+def test_vacancy_without_skills_is_left_to_llm(extractor):
+    triage = Triage(extractor)
+    decision = triage.assess(CVS["mismatch"], "Ищем ответственного сотрудника в дружную команду")
+    assert decision["verdict"] == "dialog"
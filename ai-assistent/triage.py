@@ -0,0 +1,141 @@
+"""
+Локальный предварительный отбор (triage) перед LLM-диалогом
+
+Резюме оцениваются векторно (profile_extractor.match_scores) по навыкам, опыту и городу:
+- reject   — явное несоответствие или заглушка вместо резюме (текст не извлечен из
+             файла): предварительная оценка и теги отказа без вызова LLM
+- priority — явное совпадение: LLM-диалог, но в пакетном скрининге раньше остальных
+- dialog   — неоднозначные случаи и короткие/пустые резюме (о кандидате слишком мало
+             данных для локальной оценки): обычный LLM-диалог
+"""
+from typing import Any, Dict, List, Optional
+
+from profile_extractor import ProfileExtractor, match_scores, match_skill_names
+
+# Заглушка backend для резюме, из которого не удалось извлечь текст (upload_resume)
+RESUME_PLACEHOLDER_MARKER = "Текст не удалось извлечь"
+
+# Языки, которые не считаем барьером для русскоязычного скрининга
+NATIVE_LANGUAGES = {"Русский"}
+
+
+def is_resume_placeholder(cv_text: Optional[str]) -> bool:
+    return RESUME_PLACEHOLDER_MARKER in (cv_text or "")
+
+
+class Triage:
+    """Пороговая классификация резюме по локальной оценке соответствия (0-100)"""
+
+    def __init__(
+        self,
+        extractor: ProfileExtractor,
+        reject_below: int = 25,
+        priority_above: int = 75,
+        min_cv_chars: int = 80,
+        enabled: bool = True,
+    ):
+        self.extractor = extractor
+        self.reject_below = reject_below
+        self.priority_above = priority_above
+        self.min_cv_chars = min_cv_chars
+        self.enabled = enabled
+        self.counts = {"reject": 0, "priority": 0, "dialog": 0}
+        self.tokens_saved = 0
+
+    def assess_many(self, cv_texts: List[Optional[str]], vacancy_text: str) -> List[Dict[str, Any]]:
+        """Решение по каждому резюме одной вакансии (одна матричная оценка на всю пачку)"""
+        if not self.enabled:
+            return [self._decision("dialog", None) for _ in cv_texts]
+
+        vacancy = self.extractor.parse(vacancy_text, "vacancy")
+        decisions: List[Dict[str, Any]] = []
+        usable = []
+        for i, text in enumerate(cv_texts):
+            if is_resume_placeholder(text):
+                decisions.append(self._decision("reject", 0, reasons=["Текст резюме не удалось извлечь из файла"]))
+                continue
+            decisions.append(self._decision("dialog", None))
+            if len((text or "").strip()) >= self.min_cv_chars:
+                usable.append(i)
+        if not vacancy["skills"]:
+            # Без навыков вакансии оценка ненадежна — решает LLM
+            usable = []
+
+        if usable:
+            profiles = [self.extractor.parse(cv_texts[i], "cv") for i in usable]
+            match = match_scores(profiles, vacancy)
+            for row, i in enumerate(usable):
+                decisions[i] = self._classify(match, row, profiles[row], vacancy)
+
+        for decision in decisions:
+            self.counts[decision["verdict"]] += 1
+        return decisions
+
+    def assess(self, cv_text: Optional[str], vacancy_text: str) -> Dict[str, Any]:
+        return self.assess_many([cv_text], vacancy_text)[0]
+
+    def _classify(self, match: Dict[str, Any], row: int, cv: Dict[str, Any], vacancy: Dict[str, Any]) -> Dict[str, Any]:
+        score = int(match["relevance_percent"][row])
+        matched = match_skill_names(match["matched"][row])
+        missing = match_skill_names(match["missing"][row])
+
+        reasons, tags = [], []
+        if matched:
+            reasons.append(f"Совпадают навыки: {', '.join(matched)}")
+        if missing:
+            reasons.append(f"Нет в резюме: {', '.join(missing)}")
+        if match["skill_score"][row] < 0.5:
+            tags.append("skill_mismatch")
+        if match["experience_gap"][row]:
+            reasons.append(f"Опыта меньше требуемого на {match['experience_gap'][row]:g} г.")
+            tags.append("exp_gap")
+        if match["location_mismatch"][row]:
+            reasons.append(f"Город кандидата ({cv['city']}) не совпадает с городом вакансии ({vacancy['city']})")
+            tags.append("relocation")
+        cv_languages = {l["language"] for l in cv["languages"]}
+        missing_languages = [
+            l["language"] for l in vacancy["languages"]
+            if l["language"] not in cv_languages and l["language"] not in NATIVE_LANGUAGES
+        ]
+        if missing_languages:
+            reasons.append(f"В резюме не указаны языки: {', '.join(missing_languages)}")
+            tags.append("language_barrier")
+
+        if score < self.reject_below:
+            verdict = "reject"
+        elif score >= self.priority_above:
+            verdict = "priority"
+        else:
+            verdict = "dialog"
+        return self._decision(verdict, score, reasons, tags, matched, missing)
+
+    @staticmethod
+    def _decision(
+        verdict: str,
+        score: Optional[int],
+        reasons: Optional[List[str]] = None,
+        rejection_tags: Optional[List[str]] = None,
+        matched_skills: Optional[List[str]] = None,
+        missing_skills: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        return {
+            "verdict": verdict,
+            "score": score,
+            "reasons": reasons or [],
+            "rejection_tags": rejection_tags or [],
+            "matched_skills": matched_skills or [],
+            "missing_skills": missing_skills or [],
+        }
+
+    def record_saved(self, tokens: int):
+        """Оценка токенов, не потраченных на LLM-диалог отклоненного кандидата"""
+        self.tokens_saved += tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "reject_below": self.reject_below,
+            "priority_above": self.priority_above,
+            **self.counts,
+            "tokens_saved_estimate": self.tokens_saved,
+        }
@@ -0,0 +1,201 @@
+"""
+Контроль допуска запросов к AI-ассистенту: классы трафика с лимитами параллельности
+и общая очередь с приоритетами
+
+Живой чат кандидата важнее фонового анализа: освободившийся слот получает ожидающий
+запрос с наивысшим приоритетом, а лимиты классов оставляют чату запас емкости.
+Лишние запросы не ждут таймаута httpx, а сразу получают 429 (очередь класса полна)
+или 503 (не дождались слота) с Retry-After.
+"""
+import asyncio
+import itertools
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Mapping, Optional
+
+from fastapi import HTTPException
+
+
+def _percentile(values, percent: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(percent / 100.0 * (len(ordered) - 1))))], 3)
+
+
+# Классы по умолчанию: приоритет (меньше — важнее), слоты, длина очереди, ожидание (с; 0 — без ограничения)
+DEFAULT_CLASSES = {
+    "chat": {"priority": 0, "max_concurrency": 16, "max_queue": 64, "max_wait": 5.0},
+    "analysis": {"priority": 1, "max_concurrency": 8, "max_queue": 32, "max_wait": 10.0},
+    "jobs": {"priority": 2, "max_concurrency": 4, "max_queue": 0, "max_wait": 0.0},
+    "bulk": {"priority": 3, "max_concurrency": 2, "max_queue": 4, "max_wait": 2.0},
+}
+
+
+class TrafficClass:
+    """Лимиты и счетчики одного класса запросов"""
+
+    def __init__(self, name: str, priority: int, max_concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue  # 0 — без ограничения
+        self.max_wait = max_wait  # 0 — ждать сколько угодно
+        self.active = 0
+        self.queued = 0
+        self.counters = {"admitted": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+        self.wait_seconds = deque(maxlen=1000)
+        self.hold_seconds = deque(maxlen=1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "priority": self.priority,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queued": self.queued,
+            **self.counters,
+            "wait_seconds_p50": _percentile(self.wait_seconds, 50),
+            "wait_seconds_p95": _percentile(self.wait_seconds, 95),
+            "hold_seconds_p50": _percentile(self.hold_seconds, 50),
+        }
+
+
+class AdmissionController:
+    """
+    capacity — общее число одновременных запросов к AI-ассистенту,
+    у каждого класса свой лимит внутри нее
+    """
+
+    def __init__(self, capacity: int, classes: Dict[str, Dict[str, Any]]):
+        self.capacity = capacity
+        self.classes = {name: TrafficClass(name, **options) for name, options in classes.items()}
+        self.active = 0
+        # Ожидающие: (приоритет, порядковый номер, класс, future)
+        self._waiters: List[tuple] = []
+        self._sequence = itertools.count()
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "AdmissionController":
+        """AI_ADMISSION_CAPACITY и AI_<CLASS>_CONCURRENCY / _QUEUE / _MAX_WAIT для каждого класса"""
+        env = os.environ if env is None else env
+        classes = {}
+        for name, options in DEFAULT_CLASSES.items():
+            prefix = f"AI_{name.upper()}_"
+            classes[name] = {
+                "priority": options["priority"],
+                "max_concurrency": int(env.get(prefix + "CONCURRENCY", options["max_concurrency"])),
+                "max_queue": int(env.get(prefix + "QUEUE", options["max_queue"])),
+                "max_wait": float(env.get(prefix + "MAX_WAIT", options["max_wait"])),
+            }
+        return cls(int(env.get("AI_ADMISSION_CAPACITY", "16")), classes)
+
+    def _can_run(self, traffic: TrafficClass) -> bool:
+        return self.active < self.capacity and traffic.active < traffic.max_concurrency
+
+    def _retry_after(self, traffic: TrafficClass) -> str:
+        """Оценка, когда освободится место: типичное время запроса класса × очередь на слот"""
+        hold = _percentile(traffic.hold_seconds, 50) or 1.0
+        return str(min(60, max(1, math.ceil(hold * (traffic.queued + 1) / traffic.max_concurrency))))
+
+    def _reject(self, traffic: TrafficClass, status_code: int, counter: str, detail: str):
+        traffic.counters[counter] += 1
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": self._retry_after(traffic)})
+
+    def _start(self, traffic: TrafficClass):
+        self.active += 1
+        traffic.active += 1
+        traffic.counters["admitted"] += 1
+
+    def _dispatch(self):
+        """Отдает свободные слоты ожидающим в порядке приоритета (класс на своем лимите пропускается)"""
+        self._waiters.sort(key=lambda waiter: waiter[:2])
+        for waiter in list(self._waiters):
+            if self.active >= self.capacity:
+                break
+            _, _, traffic, future = waiter
+            if future.done() or not self._can_run(traffic):
+                continue
+            self._waiters.remove(waiter)
+            traffic.queued -= 1
+            self._start(traffic)
+            future.set_result(True)
+
+    async def acquire(self, name: str) -> TrafficClass:
+        """Занимает слот класса (ждет в очереди) или отклоняет запрос с 429/503 и Retry-After"""
+        traffic = self.classes[name]
+        started = time.monotonic()
+        # Не обгоняем ожидающих того же или более высокого приоритета, которым уже хватает места
+        ahead = any(w[0] <= traffic.priority and self._can_run(w[2]) for w in self._waiters)
+        if self._can_run(traffic) and not ahead:
+            self._start(traffic)
+            traffic.wait_seconds.append(0.0)
+            return traffic
+        self._check_queue(traffic)
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (traffic.priority, next(self._sequence), traffic, future)
+        self._waiters.append(waiter)
+        traffic.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=traffic.max_wait or None)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._forget(waiter)
+                self._reject(traffic, 503, "rejected_timeout", "AI-ассистент занят, повторите запрос позже")
+            # Слот выдан одновременно с таймаутом — пользуемся им
+        except asyncio.CancelledError:
+            # Клиент ушел, пока запрос ждал в очереди
+            if future.done():
+                self.release(traffic)
+            else:
+                self._forget(waiter)
+            raise
+        traffic.wait_seconds.append(time.monotonic() - started)
+        return traffic
+
+    def _check_queue(self, traffic: TrafficClass):
+        if traffic.max_queue and traffic.queued >= traffic.max_queue:
+            self._reject(traffic, 429, "rejected_queue_full", "AI-ассистент перегружен, повторите запрос позже")
+
+    def check(self, name: str):
+        """
+        Быстрый отказ 429 до начала потокового ответа, если слота нет и очередь класса полна.
+        Сам слот поток занимает внутри генератора (slot), иначе он не освободится,
+        если ответ так и не начнут читать.
+        """
+        traffic = self.classes[name]
+        if not self._can_run(traffic):
+            self._check_queue(traffic)
+
+    def _forget(self, waiter: tuple):
+        waiter[3].cancel()
+        self._waiters.remove(waiter)
+        waiter[2].queued -= 1
+
+    def release(self, traffic: TrafficClass, held_seconds: Optional[float] = None):
+        self.active -= 1
+        traffic.active -= 1
+        if held_seconds is not None:
+            traffic.hold_seconds.append(held_seconds)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, name: str):
+        """Контекст запроса класса name к AI-ассистенту"""
+        traffic = await self.acquire(name)
+        started = time.monotonic()
+        try:
+            yield traffic
+        finally:
+            self.release(traffic, time.monotonic() - started)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "classes": {name: traffic.snapshot() for name, traffic in self.classes.items()},
+        }
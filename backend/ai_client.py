@@ -1,6 +1,7 @@
 import httpx
+import json
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
 from fastapi import HTTPException
 
 class AIAssistantClient:
@@ -59,7 +60,14 @@ class AIAssistantClient:
         except httpx.HTTPStatusError as e:
             raise HTTPException(status_code=e.response.status_code, detail=f"Ошибка AI Assistant: {e.response.text}")
     
-    async def start_chat(self, vacancy_text: str, cv_text: Optional[str] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
+    async def start_chat(
+        self,
+        vacancy_text: str,
+        cv_text: Optional[str] = None,
+        session_id: Optional[str] = None,
+        analysis_callback_url: Optional[str] = None,
+        vacancy_digest: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """Начинает новый диалог с кандидатом"""
         try:
             async with httpx.AsyncClient(timeout=self.timeout) as client:
@@ -67,8 +75,10 @@ class AIAssistantClient:
                     f"{self.base_url}/chat/start",
                     json={
                         "vacancy_text": vacancy_text,
+                        "vacancy_digest": vacancy_digest,
                         "cv_text": cv_text,
-                        "session_id": session_id
+                        "session_id": session_id,
+                        "analysis_callback_url": analysis_callback_url
                     }
                 )
                 response.raise_for_status()
@@ -78,7 +88,7 @@ class AIAssistantClient:
         except httpx.HTTPStatusError as e:
             raise HTTPException(status_code=e.response.status_code, detail=f"Ошибка AI Assistant: {e.response.text}")
     
-    async def chat_turn(self, session_id: str, message: str) -> Dict[str, Any]:
+    async def chat_turn(self, session_id: str, message: str, client_message_id: Optional[str] = None) -> Dict[str, Any]:
         """Отправка сообщения в чат с кандидатом"""
         try:
             async with httpx.AsyncClient(timeout=self.timeout) as client:
@@ -86,7 +96,107 @@ class AIAssistantClient:
                     f"{self.base_url}/chat/turn",
                     json={
                         "session_id": session_id,
-                        "message_from_candidate": message
+                        "message_from_candidate": message,
+                        "client_message_id": client_message_id
+                    }
+                )
+                response.raise_for_status()
+                return response.json()
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=503, detail=f"AI Assistant недоступен: {str(e)}")
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=f"Ошибка AI Assistant: {e.response.text}")
+    
+    async def chat_turn_stream(
+        self, session_id: str, message: str, client_message_id: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Потоковая отправка сообщения в чат: отдает SSE-события (event, data) от AI-ассистента.
+        Событие error со status_code (ход не начат: 409, 404) поднимается как HTTPException.
+        """
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                async with client.stream(
+                    "POST",
+                    f"{self.base_url}/chat/turn/stream",
+                    json={
+                        "session_id": session_id,
+                        "message_from_candidate": message,
+                        "client_message_id": client_message_id
+                    }
+                ) as response:
+                    async for event, data in self._iter_sse(response):
+                        if event == "error" and data.get("status_code"):
+                            raise HTTPException(status_code=data["status_code"], detail=f"Ошибка AI Assistant: {data['detail']}")
+                        yield event, data
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=503, detail=f"AI Assistant недоступен: {str(e)}")
+    
+    @staticmethod
+    async def _iter_sse(response: httpx.Response) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Разбирает поток Server-Sent Events в пары (event, data)"""
+        if response.is_error:
+            await response.aread()
+            raise HTTPException(status_code=response.status_code, detail=f"Ошибка AI Assistant: {response.text}")
+        
+        event = "message"
+        data_lines = []
+        async for line in response.aiter_lines():
+            if not line:
+                # Пустая строка завершает событие
+                if data_lines:
+                    yield event, json.loads("\n".join(data_lines))
+                event = "message"
+                data_lines = []
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[len("data:"):].strip())
+    
+    async def screen_batch_stream(
+        self,
+        vacancy_text: str,
+        candidates: List[Dict[str, Any]],
+        concurrency: int = 8,
+        vacancy_digest: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Пакетный скрининг (online): SSE-события candidate / candidate_error / done"""
+        # Между событиями может пройти несколько LLM-вызовов — таймаут чтения больше обычного
+        timeout = httpx.Timeout(self.timeout, read=300.0)
+        try:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                async with client.stream(
+                    "POST",
+                    f"{self.base_url}/screening/batch",
+                    json={
+                        "vacancy_text": vacancy_text,
+                        "vacancy_digest": vacancy_digest,
+                        "candidates": candidates,
+                        "concurrency": concurrency,
+                        "mode": "online"
+                    }
+                ) as response:
+                    async for item in self._iter_sse(response):
+                        yield item
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=503, detail=f"AI Assistant недоступен: {str(e)}")
+    
+    async def submit_offline_screening(
+        self,
+        vacancy_text: str,
+        candidates: List[Dict[str, Any]],
+        vacancy_digest: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Пакетный скрининг (offline, OpenAI Batch API): возвращает batch_id"""
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.post(
+                    f"{self.base_url}/screening/batch",
+                    json={
+                        "vacancy_text": vacancy_text,
+                        "vacancy_digest": vacancy_digest,
+                        "candidates": candidates,
+                        "mode": "offline"
                     }
                 )
                 response.raise_for_status()
@@ -96,6 +206,18 @@ class AIAssistantClient:
         except httpx.HTTPStatusError as e:
             raise HTTPException(status_code=e.response.status_code, detail=f"Ошибка AI Assistant: {e.response.text}")
     
+    async def get_offline_screening(self, batch_id: str) -> Dict[str, Any]:
+        """Статус и результаты offline-пакета скрининга"""
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.get(f"{self.base_url}/screening/batch/{batch_id}")
+                response.raise_for_status()
+                return response.json()
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=503, detail=f"AI Assistant недоступен: {str(e)}")
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=f"Ошибка AI Assistant: {e.response.text}")
+    
     async def get_session(self, session_id: str) -> Dict[str, Any]:
         """Получение информации о сессии"""
         try:
@@ -108,5 +230,62 @@ class AIAssistantClient:
         except httpx.HTTPStatusError as e:
             raise HTTPException(status_code=e.response.status_code, detail=f"Ошибка AI Assistant: {e.response.text}")
 
+    async def import_sessions(self, sessions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Восстановление сессий по истории диалога (пакетом): {"imported": [...], "skipped": [...]}"""
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.post(f"{self.base_url}/sessions/import", json={"sessions": sessions})
+                response.raise_for_status()
+                return response.json()
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=503, detail=f"AI Assistant недоступен: {str(e)}")
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=f"Ошибка AI Assistant: {e.response.text}")
+
+    async def rename_session(
+        self,
+        session_id: str,
+        target_session_id: str,
+        overwrite: bool = False,
+        analysis_callback_url: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Перенос сессии под другой ID (без вызова LLM); analysis_callback_url — callback перенесенной сессии"""
+        payload = {"target_session_id": target_session_id, "overwrite": overwrite}
+        if analysis_callback_url:
+            payload["analysis_callback_url"] = analysis_callback_url
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.post(f"{self.base_url}/sessions/{session_id}/rename", json=payload)
+                response.raise_for_status()
+                return response.json()
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=503, detail=f"AI Assistant недоступен: {str(e)}")
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=f"Ошибка AI Assistant: {e.response.text}")
+
+    async def delete_session(self, session_id: str):
+        """Удаление сессии; уже удаленная сессия не считается ошибкой"""
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.delete(f"{self.base_url}/sessions/{session_id}")
+                if response.status_code != 404:
+                    response.raise_for_status()
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=503, detail=f"AI Assistant недоступен: {str(e)}")
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=f"Ошибка AI Assistant: {e.response.text}")
+
+    async def get_session_analysis(self, session_id: str) -> Dict[str, Any]:
+        """Статус и текст детального анализа сессии"""
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.get(f"{self.base_url}/sessions/{session_id}/analysis")
+                response.raise_for_status()
+                return response.json()
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=503, detail=f"AI Assistant недоступен: {str(e)}")
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=f"Ошибка AI Assistant: {e.response.text}")
+
 # Глобальный экземпляр клиента
 ai_client = AIAssistantClient()
@@ -0,0 +1,134 @@
+"""
+Push-события чата работодатель-кандидат: новые сообщения и отметки о прочтении
+
+Подписчики (SSE-соединения) живут в процессе backend и получают события своей заявки
+через локальные очереди. С одним процессом события публикуются прямо в эти очереди;
+с несколькими воркерами — через Redis pub/sub, и каждый процесс раздает их своим подписчикам.
+"""
+import asyncio
+import json
+import os
+from collections import defaultdict
+from typing import Any, Dict, Optional, Set
+
+# Канал Redis заявки: employer_chat:<application_id>
+CHANNEL_PREFIX = "employer_chat:"
+
+
+class InMemoryChatEvents:
+    """Pub/sub в памяти процесса (по умолчанию, один воркер backend)"""
+
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self.subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._counters = {"published": 0, "delivered": 0, "dropped_subscribers": 0}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, application_id: int) -> asyncio.Queue:
+        """
+        Очередь событий заявки: (event, data); None — подписчик не успевал читать
+        и отключен (клиент переподключается и догоняет пропущенное по Last-Event-ID)
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending + 1)
+        self.subscribers[application_id].add(queue)
+        return queue
+
+    def unsubscribe(self, application_id: int, queue: asyncio.Queue):
+        queues = self.subscribers.get(application_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[application_id]
+
+    async def publish(self, application_id: int, event: str, data: Dict[str, Any]):
+        self._counters["published"] += 1
+        self._deliver(application_id, event, data)
+
+    def _deliver(self, application_id: int, event: str, data: Dict[str, Any]):
+        for queue in list(self.subscribers.get(application_id, ())):
+            if queue.qsize() >= self.max_pending:
+                # Место под None зарезервировано (maxsize = max_pending + 1)
+                queue.put_nowait(None)
+                self.unsubscribe(application_id, queue)
+                self._counters["dropped_subscribers"] += 1
+                continue
+            queue.put_nowait((event, data))
+            self._counters["delivered"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "applications": len(self.subscribers),
+            "subscribers": sum(len(queues) for queues in self.subscribers.values()),
+            **self._counters,
+        }
+
+
+class RedisChatEvents(InMemoryChatEvents):
+    """Pub/sub через Redis: событие, опубликованное любым воркером, получают подписчики всех воркеров"""
+
+    def __init__(self, url: str, max_pending: int = 100):
+        import redis.asyncio as aioredis
+
+        super().__init__(max_pending)
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+        await self.redis.close()
+
+    async def publish(self, application_id: int, event: str, data: Dict[str, Any]):
+        self._counters["published"] += 1
+        payload = json.dumps({"event": event, "data": data}, ensure_ascii=False, default=str)
+        try:
+            await self.redis.publish(f"{CHANNEL_PREFIX}{application_id}", payload)
+        except Exception as e:
+            # Сообщение уже сохранено в БД: подписчики этого воркера получат его напрямую,
+            # остальные — при переподключении
+            print(f"⚠️ Employer chat pub/sub: Redis publish failed: {e}")
+            self._deliver(application_id, event, data)
+
+    async def _listen(self):
+        """Один pattern-подписчик Redis на процесс раздает события локальным очередям"""
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                async for item in pubsub.listen():
+                    if item["type"] != "pmessage":
+                        continue
+                    application_id = int(item["channel"][len(CHANNEL_PREFIX):])
+                    if application_id in self.subscribers:
+                        payload = json.loads(item["data"])
+                        self._deliver(application_id, payload["event"], payload["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Employer chat pub/sub: Redis listener failed: {e}, reconnecting")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+
+def create_chat_events():
+    """Redis pub/sub, если задан CHAT_PUBSUB_URL, иначе pub/sub в памяти процесса"""
+    pubsub_url = os.getenv("CHAT_PUBSUB_URL")
+    max_pending = int(os.getenv("CHAT_PUBSUB_MAX_PENDING", "100"))
+    if pubsub_url:
+        try:
+            return RedisChatEvents(pubsub_url, max_pending)
+        except Exception as e:
+            print(f"❌ Failed to init Redis chat pub/sub at {pubsub_url}: {e}, using in-memory pub/sub")
+    return InMemoryChatEvents(max_pending)
@@ -1,7 +1,9 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
-from models import Vacancy, JobApplication
+import json
+from models import Vacancy, VacancyDigest, JobApplication, Message
 from schemas import VacancyCreate, VacancyUpdate
 
 def get_vacancy(db: Session, vacancy_id: int) -> Optional[Vacancy]:
@@ -75,6 +77,8 @@ def update_vacancy(db: Session, vacancy_id: int, vacancy: VacancyUpdate) -> Opti
     for field, value in update_data.items():
         setattr(db_vacancy, field, value)
     
+    # Дайджест строился по старому тексту — пересоберется при следующем скрининге
+    db_vacancy.digest = None
     db.commit()
     db.refresh(db_vacancy)
     return db_vacancy
@@ -88,6 +92,19 @@ def delete_vacancy(db: Session, vacancy_id: int) -> bool:
     db.commit()
     return True
 
+def get_vacancy_digest(db: Session, vacancy_id: int) -> Optional[dict]:
+    """Сохраненный дайджест вакансии для AI-скрининга"""
+    row = db.query(VacancyDigest).filter(VacancyDigest.vacancy_id == vacancy_id).first()
+    return json.loads(row.digest) if row else None
+
+def save_vacancy_digest(db: Session, vacancy_id: int, digest: dict):
+    """Сохранить дайджест вакансии (параллельно собранный дайджест просто не перезаписываем)"""
+    db.add(VacancyDigest(vacancy_id=vacancy_id, digest=json.dumps(digest, ensure_ascii=False)))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
 def get_companies(db: Session) -> List[str]:
     """Получить список всех компаний"""
     companies = db.query(Vacancy.company).distinct().all()
@@ -134,6 +151,34 @@ def get_job_applications(
     
     return applications, total
 
+def get_unscreened_applications(
+    db: Session,
+    vacancy_id: int,
+    application_ids: Optional[List[int]] = None
+) -> List[JobApplication]:
+    """Заявки на вакансию, по которым AI-анализ еще не запускался (нет сообщений бота)"""
+    screened = db.query(Message.application_id).filter(Message.sender_type == "bot")
+    query = db.query(JobApplication).filter(
+        JobApplication.vacancy_id == vacancy_id,
+        ~JobApplication.id.in_(screened)
+    )
+    if application_ids:
+        query = query.filter(JobApplication.id.in_(application_ids))
+    
+    applications = query.order_by(JobApplication.id).all()
+    # Без резюме и сопроводительного письма анализировать нечего
+    return [app for app in applications if (app.resume_content or app.cover_letter or "").strip()]
+
+def get_dialog_messages(db: Session, application_id: int, before_id: Optional[int] = None) -> List[Message]:
+    """Диалог кандидата с ботом по заявке (без системных сообщений и переписки с работодателем)"""
+    query = db.query(Message).filter(
+        Message.application_id == application_id,
+        Message.sender_type.in_(["bot", "job_seeker"])
+    )
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    return query.order_by(Message.id).all()
+
 def get_job_application(db: Session, application_id: int) -> Optional[JobApplication]:
     """Получить заявку по ID"""
     return db.query(JobApplication).filter(JobApplication.id == application_id).first()
@@ -150,3 +195,72 @@ def update_job_application(db: Session, application_id: int, application_data: d
     db.commit()
     db.refresh(db_application)
     return db_application
+
+def save_chat_result(db: Session, application_id: int, chat_result: dict) -> Optional[JobApplication]:
+    """Сохранить ответ бота и, если диалог завершен, итоговую оценку заявки"""
+    bot_message = Message(
+        content=chat_result.get("bot_reply", ""),
+        sender_type="bot",
+        application_id=application_id
+    )
+    db.add(bot_message)
+    db.commit()
+    
+    # Если диалог завершен, сохраняем relevance_score, ai_summary, detailed_analysis и rejection_tags
+    if not (chat_result.get("is_completed") and chat_result.get("relevance_percent") is not None):
+        return None
+    
+    relevance_score = chat_result["relevance_percent"] / 100.0
+    ai_summary = chat_result.get("summary_for_employer", "")
+    rejection_tags = ",".join(chat_result.get("rejection_tags", []))  # Конвертируем список в CSV
+    print(f"💾 Saving relevance_score: {relevance_score} ({chat_result['relevance_percent']}%) for application {application_id}")
+    print(f"💾 Saving ai_summary: {ai_summary}")
+    print(f"🏷️ Saving rejection_tags: {rejection_tags}")
+    update_data = {
+        "relevance_score": relevance_score,
+        "ai_summary": ai_summary,
+        "rejection_tags": rejection_tags,
+        "status": "reviewed"
+    }
+    # Детальный анализ обычно готовится в фоне и приходит отдельно (save_detailed_analysis)
+    if chat_result.get("detailed_analysis"):
+        update_data["ai_detailed_analysis"] = chat_result["detailed_analysis"]
+    updated_app = update_job_application(db, application_id, update_data)
+    if updated_app:
+        print(f"✅ Updated application: {updated_app.id}, relevance_score: {updated_app.relevance_score}")
+    return updated_app
+
+def discard_message(db: Session, message_id: int):
+    """Удалить сообщение, которое AI-ассистент не обработал (повтор или отказ из-за параллельного хода)"""
+    db.query(Message).filter(Message.id == message_id).delete()
+    db.commit()
+
+def save_repeated_turn(db: Session, application_id: int, message_id: int, chat_result: dict) -> Optional[JobApplication]:
+    """
+    Сохранить ответ на повтор уже обработанного ассистентом сообщения (duplicate).
+    Если первый запрос не дошел до save_chat_result (таймаут, обрыв клиента), ответ бота
+    и оценка сохраняются сейчас. В диалоге остается одна копия сообщения кандидата.
+    """
+    message = db.query(Message).filter(Message.id == message_id).first()
+    earlier = get_dialog_messages(db, application_id, before_id=message_id)
+    original = next(
+        (m for m in reversed(earlier) if m.sender_type == "job_seeker" and message and m.content == message.content),
+        None
+    )
+    if original is None:
+        # Первая копия не сохранилась — текущее сообщение остается единственным
+        return save_chat_result(db, application_id, chat_result)
+    
+    discard_message(db, message_id)
+    replied = any(
+        m.sender_type == "bot" and m.id > original.id and m.content == chat_result.get("bot_reply", "")
+        for m in earlier
+    )
+    if replied:
+        return None
+    return save_chat_result(db, application_id, chat_result)
+
+def save_detailed_analysis(db: Session, application_id: int, detailed_analysis: str) -> Optional[JobApplication]:
+    """Сохранить детальный анализ, сгенерированный AI-ассистентом после завершения диалога"""
+    print(f"💾 Saving ai_detailed_analysis: {len(detailed_analysis)} chars for application {application_id}")
+    return update_job_application(db, application_id, {"ai_detailed_analysis": detailed_analysis})
@@ -0,0 +1,244 @@
+"""
+Фоновые задачи AI-анализа заявок: очередь, пул воркеров, вебхуки и метрики
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+# Обработчик задачи: получает запись задачи, возвращает результат анализа
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def _percentile(values, percent: float) -> Optional[float]:
+    """Перцентиль по списку значений (None если данных нет)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100.0 * (len(ordered) - 1))))
+    return round(ordered[index], 3)
+
+
+class InMemoryJobBackend:
+    """Очередь и хранилище задач в памяти процесса (по умолчанию)"""
+
+    def __init__(self, max_jobs: int = 10000):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.max_jobs = max_jobs
+
+    async def push(self, job: Dict[str, Any]):
+        await self.save(job)
+        await self.queue.put(job["job_id"])
+
+    async def pop(self) -> Optional[str]:
+        return await self.queue.get()
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(job_id)
+
+    async def save(self, job: Dict[str, Any]):
+        self.jobs[job["job_id"]] = job
+        self.jobs.move_to_end(job["job_id"])
+        # Вытесняем самые старые записи, чтобы хранилище не росло бесконечно
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+
+    async def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def close(self):
+        pass
+
+
+class RedisJobBackend:
+    """Очередь и хранилище задач в Redis (общие для нескольких воркеров backend)"""
+
+    QUEUE_KEY = "analysis_jobs:queue"
+
+    def __init__(self, url: str, job_ttl: int = 86400):
+        import redis.asyncio as aioredis
+
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self.job_ttl = job_ttl
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"analysis_job:{job_id}"
+
+    async def push(self, job: Dict[str, Any]):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._job_key(job["job_id"]), json.dumps(job, ensure_ascii=False), ex=self.job_ttl)
+            pipe.lpush(self.QUEUE_KEY, job["job_id"])
+            await pipe.execute()
+
+    async def pop(self) -> Optional[str]:
+        item = await self.redis.brpop(self.QUEUE_KEY, timeout=5)
+        return item[1] if item else None
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        data = await self.redis.get(self._job_key(job_id))
+        return json.loads(data) if data else None
+
+    async def save(self, job: Dict[str, Any]):
+        await self.redis.set(self._job_key(job["job_id"]), json.dumps(job, ensure_ascii=False), ex=self.job_ttl)
+
+    async def depth(self) -> int:
+        return await self.redis.llen(self.QUEUE_KEY)
+
+    async def close(self):
+        await self.redis.close()
+
+
+class AnalysisJobQueue:
+    """Пул воркеров, выполняющих AI-анализ заявок в фоне"""
+
+    def __init__(
+        self, handler: JobHandler, workers: int = 4, backend=None, callback_timeout: float = 10.0, error_backoff: float = 1.0
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.backend = backend or InMemoryJobBackend()
+        self.callback_timeout = callback_timeout
+        self.error_backoff = error_backoff  # пауза воркера после ошибки хранилища задач
+        self._tasks = []
+        self._in_flight = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "callbacks_failed": 0}
+        self._wait_seconds = deque(maxlen=1000)
+        self._run_seconds = deque(maxlen=1000)
+
+    async def start(self):
+        """Запускает воркеры"""
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+        print(f"✅ Analysis job queue started: {self.workers} workers, backend={type(self.backend).__name__}")
+
+    async def stop(self):
+        """Останавливает воркеры"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.backend.close()
+
+    async def submit(self, application_id: int, payload: Dict[str, Any], callback_url: Optional[str] = None) -> Dict[str, Any]:
+        """Ставит задачу анализа в очередь"""
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "application_id": application_id,
+            "status": "queued",
+            "payload": payload,
+            "callback_url": callback_url,
+            "result": None,
+            "error": None,
+            "created_at": datetime.utcnow().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "enqueued_ts": time.time(),
+        }
+        await self.backend.push(job)
+        self._counters["submitted"] += 1
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.backend.get(job_id)
+
+    async def metrics(self) -> Dict[str, Any]:
+        """Глубина очереди, число задач в работе и задержки (в секундах)"""
+        return {
+            "queue_depth": await self.backend.depth(),
+            "in_flight": self._in_flight,
+            "workers": self.workers,
+            **self._counters,
+            "wait_seconds_p50": _percentile(self._wait_seconds, 50),
+            "wait_seconds_p95": _percentile(self._wait_seconds, 95),
+            "run_seconds_p50": _percentile(self._run_seconds, 50),
+            "run_seconds_p95": _percentile(self._run_seconds, 95),
+        }
+
+    async def _worker(self):
+        while True:
+            try:
+                job_id = await self.backend.pop()
+                if not job_id:
+                    continue
+                job = await self.backend.get(job_id)
+                if not job or job["status"] != "queued":
+                    continue
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Ошибка хранилища (например, Redis недоступен) не должна останавливать воркер
+                print(f"❌ Analysis job worker error: {e}, retrying in {self.error_backoff}s")
+                await asyncio.sleep(self.error_backoff)
+
+    async def _run(self, job: Dict[str, Any]):
+        started = time.time()
+        self._wait_seconds.append(started - job["enqueued_ts"])
+        job["status"] = "running"
+        job["started_at"] = datetime.utcnow().isoformat()
+        await self.backend.save(job)
+
+        self._in_flight += 1
+        try:
+            job["result"] = await self.handler(job)
+            job["status"] = "completed"
+            self._counters["completed"] += 1
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            print(f"❌ Analysis job {job['job_id']} failed: {detail}")
+            job["status"] = "failed"
+            job["error"] = detail
+            self._counters["failed"] += 1
+        finally:
+            self._in_flight -= 1
+            self._run_seconds.append(time.time() - started)
+
+        job["finished_at"] = datetime.utcnow().isoformat()
+        await self.backend.save(job)
+
+        if job.get("callback_url"):
+            await self._send_callback(job)
+
+    async def _send_callback(self, job: Dict[str, Any]):
+        """Отправляет результат задачи на зарегистрированный callback URL"""
+        try:
+            async with httpx.AsyncClient(timeout=self.callback_timeout) as client:
+                response = await client.post(job["callback_url"], json=public_job(job))
+                response.raise_for_status()
+        except Exception as e:
+            # Кроме ответов с ошибкой сюда попадают и некорректные URL (InvalidURL, UnsupportedProtocol)
+            self._counters["callbacks_failed"] += 1
+            print(f"⚠️ Callback for job {job['job_id']} failed: {e}")
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Представление задачи для API (без входных текстов)"""
+    return {
+        "job_id": job["job_id"],
+        "application_id": job["application_id"],
+        "status": job["status"],
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+    }
+
+
+def create_job_backend():
+    """Redis-очередь, если задан ANALYSIS_QUEUE_URL, иначе очередь в памяти"""
+    queue_url = os.getenv("ANALYSIS_QUEUE_URL")
+    if queue_url:
+        try:
+            return RedisJobBackend(queue_url)
+        except Exception as e:
+            print(f"❌ Failed to init Redis job queue at {queue_url}: {e}, using in-memory queue")
+    return InMemoryJobBackend()
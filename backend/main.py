@@ -1,26 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException, Query, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, Query, File, UploadFile, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Optional
 import uvicorn
+import asyncio
+import os
+import time
 from pathlib import Path
 from datetime import datetime
 
-from database import get_db, engine
+from database import get_db, engine, SessionLocal
 from file_utils import extract_text_from_file
+from sse import format_sse, SSE_HEADERS
+from jobs import AnalysisJobQueue, create_job_backend, public_job
+from speculative import SpeculativeScreening, speculative_fingerprint
+from admission import AdmissionController
+from chat_events import create_chat_events
 from models import Base, UserRole, Message, EmployerCandidateMessage, Vacancy
 from schemas import (
     VacancyCreate, VacancyUpdate, VacancyResponse, VacancyListResponse,
     UserCreate, UserUpdate, UserResponse, UserListResponse, UserLogin,
     JobApplicationCreate, JobApplicationUpdate, JobApplicationResponse,
-    AIAnalysisRequest, AIAnalysisResponse, ChatMessageRequest, ChatMessageResponse,
+    AIAnalysisRequest, AIAnalysisResponse, AnalysisJobResponse, ChatMessageRequest, ChatMessageResponse,
+    ScreeningRequest,
+    DetailedAnalysisCallback, DetailedAnalysisResponse,
     EmployerCandidateMessageCreate, EmployerCandidateMessageResponse, ApplicationActionRequest
 )
 from ai_client import ai_client
 from crud import (
     get_vacancy, get_vacancies, create_vacancy, 
     update_vacancy, delete_vacancy, get_companies, get_locations,
-    create_job_application, get_job_applications, get_job_application, update_job_application
+    create_job_application, get_job_applications, get_job_application, update_job_application,
+    save_chat_result, save_detailed_analysis, get_unscreened_applications,
+    get_vacancy_digest, save_vacancy_digest, discard_message, get_dialog_messages,
+    save_repeated_turn
 )
 from user_crud import (
     get_user, get_users, create_user,
@@ -343,6 +357,7 @@ async def upload_resume(
     # Извлекаем текст из файла
     extracted_text = extract_text_from_file(file_path)
     
+    text_extracted = bool(extracted_text)
     if not extracted_text:
         # Если не удалось извлечь текст, используем заглушку
         extracted_text = f"Резюме загружено: {file.filename}. Текст не удалось извлечь автоматически."
@@ -355,6 +370,8 @@ async def upload_resume(
     }
     
     update_job_application(db, application_id, update_data)
+    if text_extracted:
+        warm_up_screening(db, application_id, extracted_text)
     
     return {
         "message": "Резюме успешно загружено и обработано",
@@ -365,46 +382,235 @@ async def upload_resume(
 
 # ===== ЭНДПОИНТЫ ДЛЯ AI-АНАЛИЗА =====
 
-@app.post("/applications/{application_id}/analyze", response_model=AIAnalysisResponse)
-async def analyze_application_with_ai(
-    application_id: int,
-    request: AIAnalysisRequest,
-    db: Session = Depends(get_db)
-):
-    """Анализ заявки с помощью AI-ассистента"""
-    # Получаем заявку
+def build_vacancy_text(vacancy: Vacancy) -> str:
+    return f"{vacancy.title} - {vacancy.company}. {vacancy.description}"
+
+# Сколько символов описания вакансии оставлять в дайджесте
+VACANCY_DIGEST_SUMMARY_CHARS = int(os.getenv("VACANCY_DIGEST_SUMMARY_CHARS", "600"))
+
+def compile_vacancy_digest(vacancy: Vacancy, parsed: dict) -> dict:
+    """Дайджест вакансии: структурированные поля вакансии дополняются разбором текста (/parse)"""
+    description = " ".join((vacancy.description or "").split())
+    if len(description) > VACANCY_DIGEST_SUMMARY_CHARS:
+        description = description[:VACANCY_DIGEST_SUMMARY_CHARS].rstrip() + "…"
+    has_salary = vacancy.salary_min or vacancy.salary_max
+    return {
+        "title": vacancy.title,
+        "company": vacancy.company,
+        "must_have_skills": parsed.get("skills", []),
+        "experience_years": parsed.get("experience_years"),
+        "seniority": vacancy.experience_level or parsed.get("seniority"),
+        "location": vacancy.location or parsed.get("city"),
+        "remote": bool(vacancy.remote_work or parsed.get("remote")),
+        "employment_type": vacancy.employment_type,
+        "languages": parsed.get("languages", []),
+        "salary": {"min": vacancy.salary_min, "max": vacancy.salary_max, "currency": vacancy.currency}
+        if has_salary else parsed.get("salary"),
+        "summary": description
+    }
+
+async def ensure_vacancy_digest(db: Session, vacancy: Vacancy) -> Optional[dict]:
+    """Дайджест вакансии из БД; собирается один раз и сбрасывается при update_vacancy"""
+    digest = get_vacancy_digest(db, vacancy.id)
+    if digest:
+        return digest
+    
+    source_text = "\n".join(filter(None, [vacancy.title, vacancy.requirements, vacancy.description]))
+    try:
+        parsed = await ai_client.parse_vacancy(source_text)
+    except HTTPException as e:
+        # Без дайджеста ассистент получит полный текст вакансии — скрининг не блокируем
+        print(f"⚠️ Vacancy digest unavailable for vacancy {vacancy.id}: {e.detail}")
+        return None
+    
+    digest = compile_vacancy_digest(vacancy, parsed)
+    save_vacancy_digest(db, vacancy.id, digest)
+    print(f"🧾 Compiled digest for vacancy {vacancy.id}: {len(digest['must_have_skills'])} skills")
+    return digest
+
+def prepare_analysis_texts(db: Session, application_id: int, request: AIAnalysisRequest) -> tuple[str, str, Vacancy]:
+    """Подготовить тексты резюме и вакансии для AI-анализа заявки"""
     application = get_job_application(db, application_id)
     if not application:
         raise HTTPException(status_code=404, detail="Заявка не найдена")
     
-    # Получаем вакансию
     vacancy = get_vacancy(db, application.vacancy_id)
     if not vacancy:
         raise HTTPException(status_code=404, detail="Вакансия не найдена")
     
-    # Подготавливаем тексты для анализа
     cv_text = request.cv_text or application.resume_content or application.cover_letter or ""
-    vacancy_text = request.vacancy_text or f"{vacancy.title} - {vacancy.company}. {vacancy.description}"
+    vacancy_text = request.vacancy_text or build_vacancy_text(vacancy)
     
     if not cv_text.strip():
         raise HTTPException(status_code=400, detail="Недостаточно информации о кандидате для анализа")
     
+    return cv_text, vacancy_text, vacancy
+
+# Адрес backend, по которому AI-ассистент отправляет готовый детальный анализ
+BACKEND_PUBLIC_URL = os.getenv("BACKEND_PUBLIC_URL", "http://backend:8000")
+
+def analysis_session_id(application_id: int) -> str:
+    return f"app_{application_id}"
+
+def analysis_callback_url(application_id: int) -> str:
+    return f"{BACKEND_PUBLIC_URL}/applications/{application_id}/detailed-analysis"
+
+# Лимиты и приоритеты запросов к AI-ассистенту: чат кандидата > analyze > фоновые задачи > пакетный скрининг
+admission = AdmissionController.from_env()
+
+def speculative_session_id(application_id: int, fingerprint: str) -> str:
+    """Временный ID упреждающей сессии: до analyze она не должна занимать ID заявки"""
+    return f"{analysis_session_id(application_id)}-spec-{fingerprint[:12]}"
+
+async def delete_speculative_session(result: dict):
+    """Удаляет в ассистенте сессию упреждающего вызова, ответ которого не понадобился"""
     try:
-        # Вызываем AI-ассистента через новый API /chat/start
-        analysis_result = await ai_client.start_chat(
+        await ai_client.delete_session(result["session_id"])
+        print(f"🗑️ Deleted unused speculative session {result['session_id']}")
+    except HTTPException as e:
+        print(f"⚠️ Failed to delete speculative session {result['session_id']}: {e.detail}")
+
+# Упреждающий /chat/start сразу после загрузки резюме (SPECULATIVE_SCREENING=true)
+speculative_screening = SpeculativeScreening(
+    enabled=os.getenv("SPECULATIVE_SCREENING", "false").lower() == "true",
+    ttl=float(os.getenv("SPECULATIVE_TTL", "900")),
+    max_pending=int(os.getenv("SPECULATIVE_MAX_PENDING", "1000")),
+    cleanup=delete_speculative_session
+)
+
+def warm_up_screening(db: Session, application_id: int, cv_text: str):
+    """Запускает /chat/start в фоне, чтобы analyze отдал первый вопрос без ожидания LLM"""
+    if not speculative_screening.enabled or get_dialog_messages(db, application_id):
+        # Диалог по заявке уже идет — начинать его заново нельзя
+        return
+    application = get_job_application(db, application_id)
+    vacancy = get_vacancy(db, application.vacancy_id) if application else None
+    if not vacancy:
+        return
+    vacancy_id = vacancy.id
+    vacancy_text = build_vacancy_text(vacancy)
+    fingerprint = speculative_fingerprint(cv_text, vacancy_text)
+    
+    async def run() -> dict:
+        # Сессия запроса к этому моменту закрыта — дайджест читаем через свою
+        digest_db = SessionLocal()
+        try:
+            current_vacancy = get_vacancy(digest_db, vacancy_id)
+            if not current_vacancy:
+                raise HTTPException(status_code=404, detail="Вакансия удалена до упреждающего скрининга")
+            vacancy_digest = await ensure_vacancy_digest(digest_db, current_vacancy)
+        finally:
+            digest_db.close()
+        async with admission.slot("jobs"):
+            # Без callback: анализ упреждающей сессии backend примет только после переноса под ID заявки
+            return await ai_client.start_chat(
+                vacancy_text=vacancy_text,
+                cv_text=cv_text,
+                session_id=speculative_session_id(application_id, fingerprint),
+                vacancy_digest=vacancy_digest
+            )
+    
+    speculative_screening.start(application_id, fingerprint, run)
+    print(f"🔮 Speculative screening started for application {application_id}")
+
+async def start_application_chat(
+    application_id: int, cv_text: str, vacancy_text: str, vacancy_digest: Optional[dict], traffic_class: str
+) -> dict:
+    """
+    /chat/start по заявке; ответ, подготовленный при загрузке резюме, берется без нового вызова.
+    traffic_class — класс допуска для нового вызова (analysis — синхронный analyze, jobs — очередь)
+    """
+    prepared = await speculative_screening.claim(application_id, speculative_fingerprint(cv_text, vacancy_text))
+    if prepared is not None:
+        # Сессия подготовлена под временным ID — переносим ее под ID заявки
+        try:
+            await ai_client.rename_session(
+                prepared["session_id"],
+                analysis_session_id(application_id),
+                overwrite=True,
+                analysis_callback_url=analysis_callback_url(application_id)
+            )
+            print(f"🔮 Speculative screening hit for application {application_id}")
+            return {**prepared, "session_id": analysis_session_id(application_id)}
+        except HTTPException as e:
+            print(f"⚠️ Speculative session for application {application_id} not adopted: {e.detail}")
+            speculative_screening.discard_result(prepared)
+    async with admission.slot(traffic_class):
+        return await ai_client.start_chat(
             vacancy_text=vacancy_text,
             cv_text=cv_text,
-            session_id=f"app_{application_id}"
+            session_id=analysis_session_id(application_id),
+            analysis_callback_url=analysis_callback_url(application_id),
+            vacancy_digest=vacancy_digest
         )
-        
-        # Сохраняем первое сообщение бота
-        bot_message = Message(
-            content=analysis_result.get("bot_reply", ""),
-            sender_type="bot",
-            application_id=application_id
+
+async def run_analysis_job(job: dict) -> dict:
+    """Выполнить фоновую задачу анализа (без открытой сессии БД во время вызова LLM)"""
+    application_id = job["application_id"]
+    analysis_result = await start_application_chat(
+        application_id,
+        job["payload"]["cv_text"],
+        job["payload"]["vacancy_text"],
+        job["payload"].get("vacancy_digest"),
+        traffic_class="jobs"
+    )
+    
+    db = SessionLocal()
+    try:
+        # Первое сообщение бота; если triage или LLM завершили скрининг сразу — и итоговая оценка
+        save_chat_result(db, application_id, analysis_result)
+    finally:
+        db.close()
+    
+    return AIAnalysisResponse(**analysis_result).dict()
+
+analysis_jobs = AnalysisJobQueue(
+    handler=run_analysis_job,
+    workers=int(os.getenv("ANALYSIS_WORKERS", "4")),
+    backend=create_job_backend()
+)
+
+@app.on_event("startup")
+async def start_analysis_jobs():
+    await analysis_jobs.start()
+
+@app.on_event("shutdown")
+async def stop_analysis_jobs():
+    await analysis_jobs.stop()
+
+@app.post("/applications/{application_id}/analyze", response_model=AIAnalysisResponse)
+async def analyze_application_with_ai(
+    application_id: int,
+    request: AIAnalysisRequest,
+    mode: str = Query("sync", pattern="^(sync|async)$", description="sync - дождаться результата, async - поставить в очередь (202)"),
+    db: Session = Depends(get_db)
+):
+    """Анализ заявки с помощью AI-ассистента"""
+    cv_text, vacancy_text, vacancy = prepare_analysis_texts(db, application_id, request)
+    # Переданный вручную текст вакансии важнее сохраненного дайджеста
+    vacancy_digest = None if request.vacancy_text else await ensure_vacancy_digest(db, vacancy)
+    
+    if mode == "async":
+        # Ставим задачу в очередь и сразу отвечаем 202, не удерживая соединение с БД
+        job = await analysis_jobs.submit(
+            application_id,
+            {"cv_text": cv_text, "vacancy_text": vacancy_text, "vacancy_digest": vacancy_digest},
+            callback_url=str(request.callback_url) if request.callback_url else None
+        )
+        return JSONResponse(
+            status_code=202,
+            content=public_job(job),
+            headers={"Location": f"/analysis-jobs/{job['job_id']}"}
+        )
+    
+    try:
+        # Вызываем AI-ассистента через новый API /chat/start
+        analysis_result = await start_application_chat(
+            application_id, cv_text, vacancy_text, vacancy_digest, traffic_class="analysis"
         )
-        db.add(bot_message)
-        db.commit()
+        
+        # Сохраняем первое сообщение бота (и итоговую оценку, если скрининг завершен сразу)
+        save_chat_result(db, application_id, analysis_result)
         
         return AIAnalysisResponse(**analysis_result)
     
@@ -413,6 +619,168 @@ async def analyze_application_with_ai(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при анализе: {str(e)}")
 
+@app.get("/analysis-jobs/metrics")
+async def get_analysis_jobs_metrics():
+    """Метрики очереди фонового анализа: глубина очереди, задачи в работе, задержки"""
+    return {**await analysis_jobs.metrics(), "speculative": speculative_screening.stats()}
+
+@app.get("/admission/metrics")
+async def get_admission_metrics():
+    """Допуск запросов к AI-ассистенту по классам: занятые слоты, очереди, отказы, ожидание p50/p95"""
+    return admission.metrics()
+
+@app.get("/analysis-jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis_job(job_id: str):
+    """Получить статус и результат фоновой задачи анализа"""
+    job = await analysis_jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return public_job(job)
+
+@app.get("/vacancies/{vacancy_id}/digest")
+async def get_vacancy_digest_endpoint(vacancy_id: int, db: Session = Depends(get_db)):
+    """Дайджест вакансии, который AI-ассистент использует вместо полного текста"""
+    vacancy = get_vacancy(db, vacancy_id)
+    if not vacancy:
+        raise HTTPException(status_code=404, detail="Вакансия не найдена")
+    digest = await ensure_vacancy_digest(db, vacancy)
+    if not digest:
+        raise HTTPException(status_code=503, detail="Не удалось собрать дайджест вакансии")
+    return {"vacancy_id": vacancy_id, "digest": digest}
+
+def save_screening_result(application_id: int, result: dict):
+    """Сохранить первый ответ бота по заявке из пакетного скрининга"""
+    db = SessionLocal()
+    try:
+        save_chat_result(db, application_id, result)
+    finally:
+        db.close()
+
+@app.post("/vacancies/{vacancy_id}/screening")
+async def screen_vacancy_applications(
+    vacancy_id: int,
+    request: ScreeningRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Пакетный AI-скрининг заявок на вакансию (одна вакансия — много резюме).
+    
+    online — SSE-поток: событие candidate по каждой заявке (результат сохраняется в БД
+    перед отправкой), candidate_error и итоговое done.
+    offline — задача OpenAI Batch API; результаты забираются через
+    GET /vacancies/{vacancy_id}/screening/{batch_id}.
+    """
+    vacancy = get_vacancy(db, vacancy_id)
+    if not vacancy:
+        raise HTTPException(status_code=404, detail="Вакансия не найдена")
+    
+    applications = get_unscreened_applications(db, vacancy_id, request.application_ids)
+    if not applications:
+        raise HTTPException(status_code=400, detail="Нет заявок для скрининга")
+    
+    vacancy_text = build_vacancy_text(vacancy)
+    vacancy_digest = await ensure_vacancy_digest(db, vacancy)
+    candidates = [
+        {
+            "candidate_id": str(application.id),
+            "cv_text": application.resume_content or application.cover_letter,
+            "session_id": analysis_session_id(application.id),
+            "analysis_callback_url": analysis_callback_url(application.id)
+        }
+        for application in applications
+    ]
+    
+    if request.mode == "offline":
+        async with admission.slot("bulk"):
+            batch = await ai_client.submit_offline_screening(vacancy_text, candidates, vacancy_digest)
+        # Отклоненные локальным triage кандидаты оценены сразу, в пакет OpenAI они не попали
+        for item in batch.get("triaged", []):
+            save_screening_result(int(item["candidate_id"]), item["result"])
+        return batch
+    
+    # Полная очередь — обычный 429 до начала стрима; сам слот занимается внутри генератора,
+    # чтобы он освобождался, даже если клиент ушел до первого события
+    admission.check("bulk")
+    
+    async def event_stream():
+        try:
+            async with admission.slot("bulk"):
+                async for event, data in ai_client.screen_batch_stream(
+                    vacancy_text, candidates, request.concurrency, vacancy_digest
+                ):
+                    if event == "candidate":
+                        save_screening_result(int(data["candidate_id"]), data["result"])
+                        data = {
+                            "application_id": int(data["candidate_id"]),
+                            "session_id": data["session_id"],
+                            "result": AIAnalysisResponse(**data["result"]).dict()
+                        }
+                    elif event == "candidate_error":
+                        data = {"application_id": int(data["candidate_id"]), "detail": data["detail"]}
+                    yield format_sse(event, data)
+        except HTTPException as e:
+            yield format_sse("error", {"detail": e.detail})
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Ошибка при скрининге: {str(e)}"})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/vacancies/{vacancy_id}/screening/{batch_id}")
+async def get_vacancy_screening(vacancy_id: int, batch_id: str):
+    """Статус offline-скрининга; готовые результаты сохраняются в заявки (один раз)"""
+    batch = await ai_client.get_offline_screening(batch_id)
+    saved = 0
+    for item in batch.get("results", []):
+        # created=false — сессия уже создана и сохранена при предыдущем запросе
+        if item.get("created") and item.get("result"):
+            save_screening_result(int(item["candidate_id"]), item["result"])
+            saved += 1
+    return {
+        "vacancy_id": vacancy_id,
+        "batch_id": batch_id,
+        "status": batch.get("status"),
+        "request_counts": batch.get("request_counts"),
+        "saved": saved,
+        "errors": batch.get("errors", [])
+    }
+
+async def rehydrate_chat_session(db: Session, application_id: int, session_id: str, before_message_id: int) -> bool:
+    """
+    Восстанавливает в AI-ассистенте истекшую сессию по сообщениям заявки, резюме и вакансии:
+    диалог продолжается с того же места, прошлые ходы не повторяются.
+    before_message_id — текущее сообщение кандидата (его отправят отдельным ходом).
+    False — восстанавливать нечего (диалог по заявке не начинался).
+    """
+    application = get_job_application(db, application_id)
+    vacancy = get_vacancy(db, application.vacancy_id) if application else None
+    messages = get_dialog_messages(db, application_id, before_id=before_message_id)
+    # Диалог сессии начинается с первого ответа бота
+    while messages and messages[0].sender_type != "bot":
+        messages = messages[1:]
+    if not vacancy or not messages:
+        return False
+    
+    is_completed = application.relevance_score is not None
+    session = {
+        "session_id": session_id,
+        "vacancy_text": build_vacancy_text(vacancy),
+        "vacancy_digest": get_vacancy_digest(db, vacancy.id),
+        "cv_text": application.resume_content or application.cover_letter,
+        "messages": [
+            {"role": "assistant" if message.sender_type == "bot" else "user", "content": message.content}
+            for message in messages
+        ],
+        "is_completed": is_completed,
+        "relevance_percent": round(application.relevance_score * 100) if is_completed else None,
+        "summary": application.ai_summary,
+        "rejection_tags": [tag for tag in (application.rejection_tags or "").split(",") if tag],
+        "detailed_analysis": application.ai_detailed_analysis,
+        "analysis_callback_url": analysis_callback_url(application_id)
+    }
+    await ai_client.import_sessions([session])
+    print(f"♻️ Rehydrated session {session_id} for application {application_id} from {len(messages)} messages")
+    return True
+
 @app.post("/applications/{application_id}/chat", response_model=ChatMessageResponse)
 async def send_chat_message(
     application_id: int,
@@ -425,6 +793,9 @@ async def send_chat_message(
     if not application:
         raise HTTPException(status_code=404, detail="Заявка не найдена")
     
+    # Слот допуска — до сохранения сообщения: отклоненный ход не оставляет следов в диалоге
+    traffic = await admission.acquire("chat")
+    admitted = time.monotonic()
     try:
         # Сохраняем сообщение кандидата
         user_message = Message(
@@ -436,10 +807,29 @@ async def send_chat_message(
         db.commit()
         
         # Отправляем сообщение в AI-ассистента
-        chat_result = await ai_client.chat_turn(
-            session_id=request.session_id,
-            message=request.message
-        )
+        try:
+            try:
+                chat_result = await ai_client.chat_turn(
+                    session_id=request.session_id,
+                    message=request.message,
+                    client_message_id=request.client_message_id
+                )
+            except HTTPException as e:
+                # Сессия ассистента истекла — восстанавливаем ее из сообщений заявки и повторяем ход
+                if e.status_code != 404 or not await rehydrate_chat_session(
+                    db, application_id, request.session_id, user_message.id
+                ):
+                    raise
+                chat_result = await ai_client.chat_turn(
+                    session_id=request.session_id,
+                    message=request.message,
+                    client_message_id=request.client_message_id
+                )
+        except HTTPException as e:
+            if e.status_code == 409:
+                # Идет ход с другим сообщением — это сообщение не обработано, кандидат отправит его снова
+                discard_message(db, user_message.id)
+            raise
         
         # Логирование для отладки
         print(f"🔍 [DEBUG] Chat result keys: {chat_result.keys()}")
@@ -447,37 +837,13 @@ async def send_chat_message(
         print(f"🔍 [DEBUG] is_completed: {chat_result.get('is_completed', False)}")
         print(f"🔍 [DEBUG] relevance_percent: {chat_result.get('relevance_percent', None)}")
         
-        # Сохраняем ответ бота
-        bot_message = Message(
-            content=chat_result.get("bot_reply", ""),
-            sender_type="bot",
-            application_id=application_id
-        )
-        db.add(bot_message)
-        db.commit()
-        
-        # Если диалог завершен, сохраняем relevance_score, ai_summary, detailed_analysis и rejection_tags
-        if chat_result.get("is_completed") and chat_result.get("relevance_percent") is not None:
-            relevance_score = chat_result["relevance_percent"] / 100.0
-            ai_summary = chat_result.get("summary_for_employer", "")
-            ai_detailed_analysis = chat_result.get("detailed_analysis", "")
-            rejection_tags = ",".join(chat_result.get("rejection_tags", []))  # Конвертируем список в CSV
-            print(f"💾 Saving relevance_score: {relevance_score} ({chat_result['relevance_percent']}%) for application {application_id}")
-            print(f"💾 Saving ai_summary: {ai_summary}")
-            print(f"💾 Saving ai_detailed_analysis: {len(ai_detailed_analysis)} chars")
-            print(f"🏷️ Saving rejection_tags: {rejection_tags}")
-            updated_app = update_job_application(
-                db,
-                application_id,
-                {
-                    "relevance_score": relevance_score,
-                    "ai_summary": ai_summary,
-                    "ai_detailed_analysis": ai_detailed_analysis,
-                    "rejection_tags": rejection_tags,
-                    "status": "reviewed"
-                }
-            )
-            print(f"✅ Updated application: {updated_app.id}, relevance_score: {updated_app.relevance_score}")
+        if chat_result.get("duplicate"):
+            # Повтор уже обработанного сообщения: оставляем одну копию хода и дописываем
+            # ответ бота, если первый запрос не успел его сохранить
+            save_repeated_turn(db, application_id, user_message.id, chat_result)
+        else:
+            # Сохраняем ответ бота и итоговую оценку (если диалог завершен)
+            save_chat_result(db, application_id, chat_result)
         
         return ChatMessageResponse(**chat_result)
     
@@ -485,6 +851,151 @@ async def send_chat_message(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при отправке сообщения: {str(e)}")
+    finally:
+        admission.release(traffic, time.monotonic() - admitted)
+
+@app.post("/applications/{application_id}/chat/stream")
+async def stream_chat_message(
+    application_id: int,
+    request: ChatMessageRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Отправка сообщения в чат с потоковым ответом (Server-Sent Events)
+    
+    Ретранслирует события AI-ассистента: token (фрагменты ответа), result (итоговый
+    ChatMessageResponse, сохраняется в БД перед отправкой) и error.
+    """
+    application = get_job_application(db, application_id)
+    if not application:
+        raise HTTPException(status_code=404, detail="Заявка не найдена")
+    
+    # Полная очередь — 429 до начала потока; слот занимается внутри генератора
+    admission.check("chat")
+    
+    def save_user_message() -> int:
+        # Сообщение кандидата сохраняется, только когда поток читают: иначе оно осталось бы без ответа бота
+        stream_db = SessionLocal()
+        try:
+            user_message = Message(
+                content=request.message,
+                sender_type="job_seeker",
+                application_id=application_id
+            )
+            stream_db.add(user_message)
+            stream_db.commit()
+            return user_message.id
+        finally:
+            stream_db.close()
+    
+    def discard_user_message(user_message_id: int):
+        stream_db = SessionLocal()
+        try:
+            discard_message(stream_db, user_message_id)
+        finally:
+            stream_db.close()
+    
+    async def turn_events(user_message_id: int):
+        try:
+            async for item in ai_client.chat_turn_stream(
+                session_id=request.session_id,
+                message=request.message,
+                client_message_id=request.client_message_id
+            ):
+                yield item
+            return
+        except HTTPException as e:
+            # 404 приходит до первого события: сессия ассистента истекла
+            if e.status_code != 404:
+                raise
+        stream_db = SessionLocal()
+        try:
+            rehydrated = await rehydrate_chat_session(stream_db, application_id, request.session_id, user_message_id)
+        finally:
+            stream_db.close()
+        if not rehydrated:
+            raise HTTPException(status_code=404, detail="Сессия AI-ассистента не найдена")
+        async for item in ai_client.chat_turn_stream(
+            session_id=request.session_id,
+            message=request.message,
+            client_message_id=request.client_message_id
+        ):
+            yield item
+    
+    async def event_stream():
+        user_message_id = None
+        try:
+            async with admission.slot("chat"):
+                user_message_id = save_user_message()
+                async for event, data in turn_events(user_message_id):
+                    if event == "result":
+                        # Сессия из Depends может быть закрыта до окончания стрима — открываем свою
+                        stream_db = SessionLocal()
+                        try:
+                            if data.get("duplicate"):
+                                # Повтор уже обработанного сообщения: одна копия хода, ответ бота — если не сохранен
+                                save_repeated_turn(stream_db, application_id, user_message_id, data)
+                            else:
+                                save_chat_result(stream_db, application_id, data)
+                        finally:
+                            stream_db.close()
+                        data = ChatMessageResponse(**data).dict()
+                    yield format_sse(event, data)
+        except HTTPException as e:
+            if e.status_code in (409, 429, 503) and user_message_id is not None:
+                # Ход не выполнен (параллельный ход или нет слота) — кандидат отправит сообщение снова
+                discard_user_message(user_message_id)
+            yield format_sse("error", {"detail": e.detail})
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Ошибка при отправке сообщения: {str(e)}"})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/applications/{application_id}/detailed-analysis")
+async def receive_detailed_analysis(
+    application_id: int,
+    payload: DetailedAnalysisCallback,
+    db: Session = Depends(get_db)
+):
+    """Callback AI-ассистента: детальный анализ готов (генерируется в фоне после завершения диалога)"""
+    if payload.session_id != analysis_session_id(application_id):
+        raise HTTPException(status_code=400, detail="Сессия не относится к заявке")
+    if payload.analysis_status != "ready" or not payload.detailed_analysis:
+        return {"saved": False}
+    if not save_detailed_analysis(db, application_id, payload.detailed_analysis):
+        raise HTTPException(status_code=404, detail="Заявка не найдена")
+    return {"saved": True}
+
+@app.get("/applications/{application_id}/detailed-analysis", response_model=DetailedAnalysisResponse)
+async def get_detailed_analysis(application_id: int, db: Session = Depends(get_db)):
+    """
+    Детальный анализ заявки. Если callback еще не пришел, спрашивает AI-ассистента
+    и сохраняет готовый анализ.
+    """
+    application = get_job_application(db, application_id)
+    if not application:
+        raise HTTPException(status_code=404, detail="Заявка не найдена")
+    if application.ai_detailed_analysis:
+        return DetailedAnalysisResponse(
+            application_id=application_id,
+            analysis_status="ready",
+            detailed_analysis=application.ai_detailed_analysis
+        )
+    
+    try:
+        analysis = await ai_client.get_session_analysis(analysis_session_id(application_id))
+    except HTTPException as e:
+        if e.status_code == 404:
+            return DetailedAnalysisResponse(application_id=application_id)
+        raise
+    
+    if analysis.get("analysis_status") == "ready" and analysis.get("detailed_analysis"):
+        save_detailed_analysis(db, application_id, analysis["detailed_analysis"])
+    return DetailedAnalysisResponse(
+        application_id=application_id,
+        analysis_status=analysis.get("analysis_status"),
+        detailed_analysis=analysis.get("detailed_analysis")
+    )
 
 @app.get("/applications/{application_id}/session/{session_id}")
 async def get_ai_session(
@@ -601,6 +1112,8 @@ async def handle_application_action(
         )
         db.add(reject_message)
         db.commit()
+        db.refresh(reject_message)
+        await chat_events.publish(application_id, "message", employer_message_dict(reject_message))
         
         return {"status": "rejected", "message": "Заявка отклонена"}
     
@@ -620,6 +1133,8 @@ async def handle_application_action(
         )
         db.add(welcome_message)
         db.commit()
+        db.refresh(welcome_message)
+        await chat_events.publish(application_id, "message", employer_message_dict(welcome_message))
         
         return {"status": "accepted", "message": "Заявка принята"}
     
@@ -629,9 +1144,42 @@ async def handle_application_action(
 
 # ===== ЭНДПОИНТЫ ДЛЯ ЧАТА РАБОТОДАТЕЛЬ-КАНДИДАТ =====
 
+# Push-события чата работодатель-кандидат; CHAT_PUBSUB_URL — Redis pub/sub для нескольких воркеров
+chat_events = create_chat_events()
+
+# Интервал SSE-комментария, который не дает прокси закрыть простаивающее соединение
+CHAT_STREAM_HEARTBEAT = float(os.getenv("CHAT_STREAM_HEARTBEAT", "15"))
+
+@app.on_event("startup")
+async def start_chat_events():
+    await chat_events.start()
+
+@app.on_event("shutdown")
+async def stop_chat_events():
+    await chat_events.stop()
+
+def employer_message_dict(msg: EmployerCandidateMessage) -> dict:
+    return {
+        "id": msg.id,
+        "content": msg.content,
+        "sender_type": msg.sender_type,
+        "sender_id": msg.sender_id,
+        "sender_name": msg.sender.full_name if msg.sender else "Система",
+        "application_id": msg.application_id,
+        "created_at": msg.created_at.isoformat(),
+        "is_read": msg.is_read
+    }
+
+def get_employer_messages(db: Session, application_id: int, after_id: Optional[int] = None):
+    query = db.query(EmployerCandidateMessage).filter(EmployerCandidateMessage.application_id == application_id)
+    if after_id is not None:
+        query = query.filter(EmployerCandidateMessage.id > after_id)
+    return query.order_by(EmployerCandidateMessage.created_at, EmployerCandidateMessage.id).all()
+
 @app.get("/applications/{application_id}/employer-chat")
 async def get_employer_candidate_messages(
     application_id: int,
+    after_id: Optional[int] = Query(None, description="Только сообщения с id больше указанного"),
     db: Session = Depends(get_db)
 ):
     """Получить сообщения чата между работодателем и кандидатом"""
@@ -639,25 +1187,68 @@ async def get_employer_candidate_messages(
     if not application:
         raise HTTPException(status_code=404, detail="Заявка не найдена")
     
-    messages = db.query(EmployerCandidateMessage).filter(
-        EmployerCandidateMessage.application_id == application_id
-    ).order_by(EmployerCandidateMessage.created_at).all()
+    messages = get_employer_messages(db, application_id, after_id)
+    return {"messages": [employer_message_dict(msg) for msg in messages]}
+
+@app.get("/applications/{application_id}/employer-chat/stream")
+async def stream_employer_candidate_messages(
+    application_id: int,
+    after_id: Optional[int] = Query(None, description="Прислать сначала сообщения с id больше указанного"),
+    last_event_id: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Подписка на чат работодатель-кандидат (Server-Sent Events) вместо опроса GET employer-chat
     
-    return {
-        "messages": [
-            {
-                "id": msg.id,
-                "content": msg.content,
-                "sender_type": msg.sender_type,
-                "sender_id": msg.sender_id,
-                "sender_name": msg.sender.full_name if msg.sender else "Система",
-                "application_id": msg.application_id,
-                "created_at": msg.created_at.isoformat(),
-                "is_read": msg.is_read
-            }
-            for msg in messages
-        ]
-    }
+    События: message (новое сообщение, id события — id сообщения) и read (сообщение прочитано).
+    При переподключении браузер передает Last-Event-ID, и пропущенные сообщения приходят
+    первыми; без него — сообщения после after_id (весь чат, если after_id не задан).
+    """
+    if not get_job_application(db, application_id):
+        raise HTTPException(status_code=404, detail="Заявка не найдена")
+    if last_event_id and last_event_id.isdigit():
+        after_id = int(last_event_id)
+    
+    async def event_stream():
+        # Подписываемся до чтения истории, чтобы не потерять сообщения между ними
+        queue = chat_events.subscribe(application_id)
+        try:
+            stream_db = SessionLocal()
+            try:
+                backlog = [employer_message_dict(msg) for msg in get_employer_messages(stream_db, application_id, after_id)]
+            finally:
+                stream_db.close()
+            last_sent = after_id or 0
+            for message in backlog:
+                last_sent = max(last_sent, message["id"])
+                yield format_sse("message", message, event_id=message["id"])
+            
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=CHAT_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    # Клиент не успевал читать — закрываем поток, он переподключится с Last-Event-ID
+                    return
+                event, data = item
+                if event == "message":
+                    if data["id"] <= last_sent:
+                        continue  # уже отправлено из истории
+                    last_sent = data["id"]
+                    yield format_sse(event, data, event_id=data["id"])
+                else:
+                    yield format_sse(event, data)
+        finally:
+            chat_events.unsubscribe(application_id, queue)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/employer-chat/metrics")
+async def get_employer_chat_metrics():
+    """Подписчики push-канала чата работодатель-кандидат и счетчики доставки"""
+    return chat_events.stats()
 
 
 @app.post("/applications/{application_id}/employer-chat")
@@ -691,16 +1282,9 @@ async def send_employer_candidate_message(
     db.commit()
     db.refresh(new_message)
     
-    return {
-        "id": new_message.id,
-        "content": new_message.content,
-        "sender_type": new_message.sender_type,
-        "sender_id": new_message.sender_id,
-        "sender_name": new_message.sender.full_name if new_message.sender else "Неизвестно",
-        "application_id": new_message.application_id,
-        "created_at": new_message.created_at.isoformat(),
-        "is_read": new_message.is_read
-    }
+    message = employer_message_dict(new_message)
+    await chat_events.publish(application_id, "message", message)
+    return message
 
 
 @app.patch("/applications/{application_id}/employer-chat/{message_id}/read")
@@ -718,8 +1302,10 @@ async def mark_message_as_read(
     if not message:
         raise HTTPException(status_code=404, detail="Сообщение не найдено")
     
-    message.is_read = True
-    db.commit()
+    if not message.is_read:
+        message.is_read = True
+        db.commit()
+        await chat_events.publish(application_id, "read", {"message_id": message_id, "application_id": application_id})
     
     return {"status": "ok", "message_id": message_id}
 
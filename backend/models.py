@@ -54,10 +54,24 @@ class Vacancy(Base):
     
     # Связи с заявками
     applications = relationship("JobApplication", back_populates="vacancy")
+    
+    # Дайджест для AI-скрининга (сбрасывается при изменении вакансии)
+    digest = relationship("VacancyDigest", uselist=False, cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Vacancy(id={self.id}, title='{self.title}', company='{self.company}')>"
 
+class VacancyDigest(Base):
+    """Компактная выжимка требований вакансии, которую AI-ассистент использует вместо полного текста"""
+    __tablename__ = "vacancy_digests"
+
+    vacancy_id = Column(Integer, ForeignKey("vacancies.id"), primary_key=True)
+    digest = Column(Text, nullable=False)  # JSON: навыки, опыт, локация, формат, языки, зарплата
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<VacancyDigest(vacancy_id={self.vacancy_id})>"
+
 class JobApplication(Base):
     __tablename__ = "job_applications"
 
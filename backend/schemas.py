@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, HttpUrl
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from models import UserRole
@@ -125,6 +125,7 @@ class JobApplicationResponse(JobApplicationBase):
 class AIAnalysisRequest(BaseModel):
     cv_text: Optional[str] = None
     vacancy_text: Optional[str] = None
+    callback_url: Optional[HttpUrl] = None  # Вебхук для результата (только mode=async)
 
 class AIAnalysisResponse(BaseModel):
     session_id: str
@@ -134,13 +135,33 @@ class AIAnalysisResponse(BaseModel):
     bot_reply: Optional[str] = None  # Новый API - один вопрос
     dialog_stage: Optional[str] = None
     is_completed: Optional[bool] = False
+    rejection_tags: List[str] = []
+    triage: Optional[Dict[str, Any]] = None  # Локальная предварительная оценка AI-ассистента
     # Старые поля для обратной совместимости
     mismatches: Optional[Dict[str, Any]] = None
     followup_questions: Optional[List[str]] = None
 
+class AnalysisJobResponse(BaseModel):
+    """Фоновая задача AI-анализа заявки"""
+    job_id: str
+    application_id: int
+    status: str  # queued, running, completed, failed
+    result: Optional[AIAnalysisResponse] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ScreeningRequest(BaseModel):
+    """Пакетный скрининг заявок на вакансию"""
+    application_ids: Optional[List[int]] = None  # По умолчанию — все еще не проанализированные заявки
+    mode: str = Field("online", pattern="^(online|offline)$")  # offline — OpenAI Batch API, результат позже
+    concurrency: int = Field(8, ge=1, le=32)
+
 class ChatMessageRequest(BaseModel):
     session_id: str
     message: str
+    client_message_id: Optional[str] = Field(None, max_length=128)  # повтор с тем же ID не вызывает LLM повторно
 
 class ChatMessageResponse(BaseModel):
     session_id: str
@@ -153,9 +174,22 @@ class ChatMessageResponse(BaseModel):
     is_completed: Optional[bool] = False
     suggest_alternative_vacancy: Optional[bool] = False  # Предложить альтернативную вакансию
     alternative_vacancy_reason: Optional[str] = None  # Причина предложения
+    analysis_status: Optional[str] = None  # pending, ready — детальный анализ готовится в фоне
+    duplicate: bool = False  # Ответ на повтор уже обработанного сообщения
     # Старое поле для обратной совместимости
     bot_replies: Optional[List[str]] = None
 
+class DetailedAnalysisCallback(BaseModel):
+    """Готовый детальный анализ от AI-ассистента"""
+    session_id: str
+    analysis_status: str
+    detailed_analysis: Optional[str] = None
+
+class DetailedAnalysisResponse(BaseModel):
+    application_id: int
+    analysis_status: Optional[str] = None  # pending, ready или None (диалог не завершен)
+    detailed_analysis: Optional[str] = None
+
 
 # ===== СХЕМЫ ДЛЯ ЧАТА РАБОТОДАТЕЛЬ-КАНДИДАТ =====
 
@@ -0,0 +1,147 @@
+"""
+Упреждающий запуск AI-скрининга при загрузке резюме
+
+Первый вопрос бота генерируется только по POST /applications/{id}/analyze, и кандидат
+ждет холодный вызов LLM. В упреждающем режиме /chat/start запускается в фоне сразу после
+извлечения текста резюме, а analyze забирает готовый ответ или присоединяется к идущему вызову.
+Упреждающая сессия создается в ассистенте под временным ID и переносится под ID заявки,
+только если пригодилась; ненужная удаляется, когда вызов завершится (отмена ожидания
+в backend не останавливает уже начатый вызов в ассистенте).
+Подготовленные ответы живут в памяти процесса: analyze в другом воркере просто не найдет
+их и выполнит обычный вызов.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+def speculative_fingerprint(cv_text: str, vacancy_text: str) -> str:
+    """Подготовленный ответ годится, только если analyze пришел с теми же текстами"""
+    return hashlib.sha256(f"{vacancy_text}\0{cv_text}".encode("utf-8")).hexdigest()
+
+
+class SpeculativeScreening:
+    """
+    Фоновые вызовы /chat/start по заявкам: application_id -> (отпечаток текстов, задача, время запуска).
+    cleanup(result) удаляет в ассистенте сессию упреждающего вызова, результат которого не понадобился.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        ttl: float = 900.0,
+        max_pending: int = 1000,
+        cleanup: Optional[Callable[[Dict[str, Any]], Awaitable[Any]]] = None,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.cleanup = cleanup
+        self.pending: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._cleanups = set()
+        self._counters = {
+            "started": 0,
+            "hits_ready": 0,  # ответ уже был готов
+            "hits_in_flight": 0,  # analyze дождался идущего вызова
+            "misses": 0,
+            "failed": 0,
+            "expired": 0,  # подготовленный ответ так и не понадобился
+            "superseded": 0,  # резюме загружено заново до analyze
+            "wasted": 0,  # оплаченные упреждающие вызовы, результат которых выброшен
+        }
+
+    def start(self, application_id: int, fingerprint: str, run: Callable[[], Awaitable[Dict[str, Any]]]):
+        """Запускает упреждающий вызов для заявки (предыдущий, если был, выбрасывается)"""
+        if not self.enabled:
+            return
+        self._purge()
+        previous = self.pending.pop(application_id, None)
+        if previous:
+            self._counters["superseded"] += 1
+            self._discard(previous)
+
+        task = asyncio.create_task(run())
+        task.add_done_callback(self._log_failure)
+        self.pending[application_id] = {"fingerprint": fingerprint, "task": task, "started": time.monotonic()}
+        self._counters["started"] += 1
+        while len(self.pending) > self.max_pending:
+            _, entry = self.pending.popitem(last=False)
+            self._counters["expired"] += 1
+            self._discard(entry)
+
+    async def claim(self, application_id: int, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Результат /chat/start, подготовленный при загрузке резюме (ждет идущий вызов).
+        None — подготовленного ответа нет или он не подходит: нужен обычный вызов.
+        """
+        if not self.enabled:
+            return None
+        entry = self.pending.pop(application_id, None)
+        if entry is None or entry["fingerprint"] != fingerprint or self._expired(entry):
+            if entry is not None:
+                self._discard(entry)
+            self._counters["misses"] += 1
+            return None
+
+        task = entry["task"]
+        counter = "hits_ready" if task.done() else "hits_in_flight"
+        try:
+            result = await asyncio.shield(task)
+        except Exception:
+            self._counters["failed"] += 1
+            self._counters["misses"] += 1
+            return None
+        self._counters[counter] += 1
+        return result
+
+    def discard_result(self, result: Dict[str, Any]):
+        """Полученный через claim результат все же не пригодился (например, не удалось перенести сессию)"""
+        self._counters["wasted"] += 1
+        self._schedule_cleanup(result)
+
+    def _discard(self, entry: Dict[str, Any]):
+        """
+        Ответ не понадобился. Вызов в ассистенте уже идет и будет оплачен при любом исходе,
+        поэтому задачу не отменяем, а созданную ею сессию удаляем после завершения
+        """
+        self._counters["wasted"] += 1
+        entry["task"].add_done_callback(self._cleanup_when_done)
+
+    def _cleanup_when_done(self, task: asyncio.Task):
+        if task.cancelled() or task.exception():
+            return
+        self._schedule_cleanup(task.result())
+
+    def _schedule_cleanup(self, result: Dict[str, Any]):
+        if self.cleanup is None:
+            return
+        cleanup = asyncio.create_task(self.cleanup(result))
+        # Держим ссылку, пока удаление не завершится
+        self._cleanups.add(cleanup)
+        cleanup.add_done_callback(self._cleanups.discard)
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["started"] > self.ttl
+
+    def _purge(self):
+        for application_id in [a for a, entry in self.pending.items() if self._expired(entry)]:
+            self._counters["expired"] += 1
+            self._discard(self.pending.pop(application_id))
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            error = task.exception()
+            print(f"⚠️ Speculative screening failed: {getattr(error, 'detail', None) or error}")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._counters["hits_ready"] + self._counters["hits_in_flight"]
+        claims = hits + self._counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "pending": len(self.pending),
+            **self._counters,
+            "hit_rate": round(hits / claims, 3) if claims else None,
+        }
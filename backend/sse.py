@@ -0,0 +1,14 @@
+"""
+Утилиты для Server-Sent Events
+"""
+import json
+from typing import Any, Dict, Optional
+
+# Отключаем кеширование и буферизацию прокси для потоковых ответов
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def format_sse(event: str, data: Dict[str, Any], event_id: Optional[Any] = None) -> str:
+    """Форматирует событие Server-Sent Events (event_id браузер вернет в Last-Event-ID при переподключении)"""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
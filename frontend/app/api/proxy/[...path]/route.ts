@@ -62,6 +62,12 @@ async function proxyRequest(
       headers['Authorization'] = authorization
     }
 
+    // EventSource при переподключении передает id последнего полученного события
+    const lastEventId = request.headers.get('last-event-id')
+    if (lastEventId) {
+      headers['Last-Event-ID'] = lastEventId
+    }
+
     // Получаем тело запроса для POST/PUT
     let body: any = undefined
     if (method === 'POST' || method === 'PUT') {
@@ -75,12 +81,35 @@ async function proxyRequest(
       }
     }
 
+    // GET .../stream — подписка (EventSource), она открыта, пока открыта страница:
+    // таймаут только на получение заголовков ответа, дальше поток живет до отключения клиента
+    const isSubscription = method === 'GET' && path.endsWith('/stream')
+    const controller = new AbortController()
+    request.signal.addEventListener('abort', () => controller.abort())
+    const timeoutMs = path.endsWith('/stream') && !isSubscription ? 120000 : 30000 // 30 секунд таймаут (2 минуты для ответов бота)
+    const timeout = setTimeout(() => controller.abort(), timeoutMs)
+
     const response = await fetch(fullUrl, {
       method,
       headers,
       body,
-      signal: AbortSignal.timeout(30000), // 30 секунд таймаут
+      signal: controller.signal,
     })
+    if (isSubscription) {
+      clearTimeout(timeout)
+    }
+
+    // Потоковые ответы (SSE) передаем как есть, без буферизации
+    if (response.headers.get('content-type')?.includes('text/event-stream')) {
+      return new Response(response.body, {
+        status: response.status,
+        headers: {
+          'Content-Type': 'text/event-stream',
+          'Cache-Control': 'no-cache',
+          'X-Accel-Buffering': 'no',
+        },
+      })
+    }
 
     const data = await response.json()
     
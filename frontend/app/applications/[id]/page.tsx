@@ -8,7 +8,7 @@ import { Badge } from "@/components/ui/badge"
 import { Button } from "@/components/ui/button"
 import { Skeleton } from "@/components/ui/skeleton"
 import { Separator } from "@/components/ui/separator"
-import { api, type Application, type Vacancy, type EmployerCandidateMessage } from "@/lib/api"
+import { api, appendEmployerMessage, type Application, type Vacancy, type EmployerCandidateMessage } from "@/lib/api"
 import { useAuth } from "@/lib/auth-context"
 import { ArrowLeft, Briefcase, MapPin, Clock, MessageSquare, Send } from "lucide-react"
 import { Input } from "@/components/ui/input"
@@ -42,12 +42,16 @@ export default function ApplicationDetailPage() {
     }
   }, [user, authLoading, params.id])
 
-  // Автоматически загружаем сообщения когда статус меняется на accepted или rejected
+  // Когда статус меняется на accepted или rejected, подписываемся на сообщения работодателя
   useEffect(() => {
-    if (application && (application.status === "accepted" || application.status === "rejected")) {
-      loadEmployerMessages()
-    }
-  }, [application?.status])
+    if (!application || (application.status !== "accepted" && application.status !== "rejected")) return
+    setEmployerMessages([])
+    return api.subscribeEmployerChat(
+      application.id,
+      (message) => setEmployerMessages((prev) => appendEmployerMessage(prev, message)),
+      (messageId) => setEmployerMessages((prev) => prev.map((m) => (m.id === messageId ? { ...m, is_read: true } : m))),
+    )
+  }, [application?.id, application?.status])
 
   const loadApplication = async () => {
     setIsLoading(true)
@@ -91,24 +95,13 @@ export default function ApplicationDetailPage() {
     loadApplication()
   }
 
-  const loadEmployerMessages = async () => {
-    if (!application) return
-    try {
-      const messages = await api.getEmployerCandidateMessages(application.id)
-      setEmployerMessages(messages)
-    } catch (error) {
-      console.error("Failed to load employer messages:", error)
-      setEmployerMessages([])
-    }
-  }
-
   const handleSendMessage = async () => {
     if (!newMessage.trim() || !application || isSendingMessage || !user) return
 
     setIsSendingMessage(true)
     try {
       const message = await api.sendEmployerCandidateMessage(application.id, newMessage, user.id)
-      setEmployerMessages((prev) => [...prev, message])
+      setEmployerMessages((prev) => appendEmployerMessage(prev, message))
       setNewMessage("")
     } catch (error) {
       console.error("Failed to send message:", error)
@@ -118,7 +111,6 @@ export default function ApplicationDetailPage() {
   }
 
   const openMessagesDialog = () => {
-    loadEmployerMessages()
     setIsMessagesDialogOpen(true)
   }
 
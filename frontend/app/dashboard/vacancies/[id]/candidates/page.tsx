@@ -11,7 +11,7 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@
 import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle } from "@/components/ui/dialog"
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs"
 import { useAuth } from "@/lib/auth-context"
-import { api, type Vacancy, type Application, type Message, type EmployerCandidateMessage } from "@/lib/api"
+import { api, appendEmployerMessage, type Vacancy, type Application, type Message, type EmployerCandidateMessage } from "@/lib/api"
 import { ArrowLeft, AlertCircle, MessageSquare, Bot, Check, X, Send, FileText } from "lucide-react"
 import { Input } from "@/components/ui/input"
 import { toast } from "@/components/ui/use-toast"
@@ -60,6 +60,18 @@ export default function CandidatesPage() {
     filterApplications()
   }, [applications, statusFilter, relevanceFilter, tagFilter, activeTab])
 
+  // Пока открыт чат с кандидатом, сообщения приходят push-событиями
+  useEffect(() => {
+    if (!isEmployerChatOpen || !selectedApplication) return
+    setEmployerChatMessages([])
+    return api.subscribeEmployerChat(
+      selectedApplication.id,
+      (message) => setEmployerChatMessages((prev) => appendEmployerMessage(prev, message)),
+      (messageId) =>
+        setEmployerChatMessages((prev) => prev.map((m) => (m.id === messageId ? { ...m, is_read: true } : m))),
+    )
+  }, [isEmployerChatOpen, selectedApplication?.id])
+
   const loadData = async () => {
     setIsLoading(true)
     try {
@@ -142,7 +154,6 @@ export default function CandidatesPage() {
       })
       // Открываем чат работодателя с кандидатом
       setSelectedApplication(application)
-      loadEmployerChat(application.id)
       setIsEmployerChatOpen(true)
       // Обновляем список заявок
       loadData()
@@ -175,23 +186,13 @@ export default function CandidatesPage() {
     }
   }
 
-  const loadEmployerChat = async (applicationId: number) => {
-    try {
-      const messages = await api.getEmployerCandidateMessages(applicationId)
-      setEmployerChatMessages(messages)
-    } catch (error) {
-      console.error("Failed to load employer chat:", error)
-      setEmployerChatMessages([])
-    }
-  }
-
   const handleSendMessage = async () => {
     if (!newMessage.trim() || !selectedApplication || isSendingMessage || !user) return
 
     setIsSendingMessage(true)
     try {
       const message = await api.sendEmployerCandidateMessage(selectedApplication.id, newMessage, user.id)
-      setEmployerChatMessages((prev) => [...prev, message])
+      setEmployerChatMessages((prev) => appendEmployerMessage(prev, message))
       setNewMessage("")
     } catch (error) {
       console.error("Failed to send message:", error)
@@ -205,9 +206,32 @@ export default function CandidatesPage() {
     }
   }
 
-  const handleViewDetailedAnalysis = (application: Application) => {
-    setDetailedAnalysisContent(application.ai_detailed_analysis || "Детальный анализ не доступен")
+  const handleViewDetailedAnalysis = async (application: Application) => {
     setIsDetailedAnalysisOpen(true)
+    if (application.ai_detailed_analysis) {
+      setDetailedAnalysisContent(application.ai_detailed_analysis)
+      return
+    }
+    // Анализ готовится в фоне после завершения диалога — запрашиваем его по требованию
+    setDetailedAnalysisContent("Загрузка детального анализа...")
+    try {
+      const analysis = await api.getDetailedAnalysis(application.id)
+      if (analysis.detailed_analysis) {
+        setDetailedAnalysisContent(analysis.detailed_analysis)
+        setApplications((prev) =>
+          prev.map((app) =>
+            app.id === application.id ? { ...app, ai_detailed_analysis: analysis.detailed_analysis ?? undefined } : app,
+          ),
+        )
+      } else if (analysis.analysis_status === "pending") {
+        setDetailedAnalysisContent("Детальный анализ готовится, попробуйте через несколько секунд")
+      } else {
+        setDetailedAnalysisContent("Детальный анализ не доступен")
+      }
+    } catch (error) {
+      console.error("Failed to load detailed analysis:", error)
+      setDetailedAnalysisContent("Детальный анализ не доступен")
+    }
   }
 
   const getRelevanceBadge = (score?: number) => {
@@ -443,7 +467,7 @@ export default function CandidatesPage() {
                                   <Bot className="h-4 w-4" />
                                   Анализ AI
                                 </h4>
-                                {application.ai_detailed_analysis && (
+                                {(application.ai_detailed_analysis || application.ai_summary) && (
                                   <Button 
                                     size="sm" 
                                     variant="outline"
@@ -509,7 +533,6 @@ export default function CandidatesPage() {
                                 variant="outline" 
                                 onClick={() => {
                                   setSelectedApplication(application)
-                                  loadEmployerChat(application.id)
                                   setIsEmployerChatOpen(true)
                                 }}
                               >
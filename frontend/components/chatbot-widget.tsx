@@ -119,18 +119,43 @@ export function ChatbotWidget({ applicationId, vacancyId, onAnalysisComplete, em
       console.log('handleSubmit - sessionId:', sessionId, 'userInput:', userInput)
       if (sessionId) {
         console.log('Sending message to AI assistant...')
-        // Отправляем сообщение в AI-ассистента
-        const chatResult = await api.sendChatMessage(Number(applicationId), sessionId, userInput)
+        // Отправляем сообщение в AI-ассистента и показываем ответ по мере генерации
+        const botMessageId = `bot-${Date.now()}`
+        // Один ID на отправку: повтор с ним ассистент узнает и вернет тот же ответ без нового хода
+        const clientMessageId = `${sessionId}-${Date.now()}-${Math.random().toString(36).slice(2, 10)}`
+        let streamedText = ''
+        const sendTurn = () => api.streamChatMessage(Number(applicationId), sessionId, userInput, (token) => {
+          if (!streamedText) {
+            setLocalMessages(prev => [...prev, { id: botMessageId, role: 'assistant', text: '' }])
+          }
+          streamedText += token
+          setLocalMessages(prev => prev.map(m => m.id === botMessageId ? { ...m, text: streamedText } : m))
+        }, clientMessageId)
+        let chatResult
+        try {
+          chatResult = await sendTurn()
+        } catch (error) {
+          // Обрыв соединения (fetch бросает TypeError) — повторяем один раз с тем же clientMessageId
+          if (!(error instanceof TypeError)) throw error
+          console.warn('Chat request failed, retrying with the same message id:', error)
+          // Частичный текст первой попытки не продолжаем: повтор присылает ответ заново
+          streamedText = ''
+          setLocalMessages(prev => prev.filter(m => m.id !== botMessageId))
+          chatResult = await sendTurn()
+        }
         console.log('AI response:', chatResult)
         
         // Новый API возвращает один ответ (bot_reply) вместо массива
         if (chatResult.bot_reply) {
+          // Итоговый ответ заменяет потоковый текст (без блока [RESULT])
           const botMessage = {
-            id: `bot-${Date.now()}`,
+            id: botMessageId,
             role: 'assistant',
             text: chatResult.bot_reply
           }
-          setLocalMessages(prev => [...prev, botMessage])
+          setLocalMessages(prev => streamedText
+            ? prev.map(m => m.id === botMessageId ? botMessage : m)
+            : [...prev, botMessage])
         } else if (chatResult.bot_replies && chatResult.bot_replies.length > 0) {
           // Обратная совместимость со старым API
           chatResult.bot_replies.forEach((reply, index) => {
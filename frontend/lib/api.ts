@@ -88,6 +88,35 @@ export interface EmployerCandidateMessage {
   is_read: boolean
 }
 
+// Добавляет сообщение в список чата, если его там еще нет (ответ POST и push-событие приходят оба)
+export function appendEmployerMessage(
+  messages: EmployerCandidateMessage[],
+  message: EmployerCandidateMessage,
+): EmployerCandidateMessage[] {
+  return messages.some((m) => m.id === message.id) ? messages : [...messages, message]
+}
+
+export interface DetailedAnalysis {
+  application_id: number
+  analysis_status?: "pending" | "ready" | null
+  detailed_analysis?: string | null
+}
+
+export interface ChatTurnResult {
+  session_id: string
+  bot_reply: string
+  relevance_percent: number
+  reasons: string[]
+  summary_for_employer: string
+  dialog_stage?: string
+  is_completed?: boolean
+  suggest_alternative_vacancy?: boolean
+  alternative_vacancy_reason?: string
+  duplicate?: boolean  // ответ на повтор уже обработанного сообщения
+  // Старое поле для обратной совместимости
+  bot_replies?: string[]
+}
+
 class ApiClient {
   private getHeaders(includeAuth = false): HeadersInit {
     const headers: HeadersInit = {
@@ -433,25 +462,20 @@ class ApiClient {
     return response.json()
   }
 
-  async sendChatMessage(applicationId: number, sessionId: string, message: string): Promise<{
-    session_id: string
-    bot_reply: string
-    relevance_percent: number
-    reasons: string[]
-    summary_for_employer: string
-    dialog_stage?: string
-    is_completed?: boolean
-    suggest_alternative_vacancy?: boolean
-    alternative_vacancy_reason?: string
-    // Старое поле для обратной совместимости
-    bot_replies?: string[]
-  }> {
+  // clientMessageId: повторная отправка с тем же ID получит уже готовый ответ (без второго хода диалога)
+  async sendChatMessage(
+    applicationId: number,
+    sessionId: string,
+    message: string,
+    clientMessageId?: string,
+  ): Promise<ChatTurnResult> {
     const response = await fetch(`${API_BASE_URL}/applications/${applicationId}/chat`, {
       method: "POST",
       headers: this.getHeaders(true),
       body: JSON.stringify({
         session_id: sessionId,
         message,
+        client_message_id: clientMessageId,
       }),
     })
 
@@ -463,6 +487,78 @@ class ApiClient {
     return response.json()
   }
 
+  async streamChatMessage(
+    applicationId: number,
+    sessionId: string,
+    message: string,
+    onToken: (text: string) => void,
+    clientMessageId?: string,
+  ): Promise<ChatTurnResult> {
+    const response = await fetch(`${API_BASE_URL}/applications/${applicationId}/chat/stream`, {
+      method: "POST",
+      headers: this.getHeaders(true),
+      body: JSON.stringify({
+        session_id: sessionId,
+        message,
+        client_message_id: clientMessageId,
+      }),
+    })
+
+    if (!response.ok || !response.body) {
+      const error = await response.json().catch(() => ({}))
+      throw new Error(error.detail || "Failed to send chat message")
+    }
+
+    // Разбираем Server-Sent Events: token -> onToken, result -> итог, error -> исключение
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ""
+    let result: ChatTurnResult | null = null
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+
+      let boundary = buffer.indexOf("\n\n")
+      while (boundary !== -1) {
+        const rawEvent = buffer.slice(0, boundary)
+        buffer = buffer.slice(boundary + 2)
+        boundary = buffer.indexOf("\n\n")
+
+        let event = "message"
+        const dataLines: string[] = []
+        for (const line of rawEvent.split("\n")) {
+          if (line.startsWith("event:")) event = line.slice(6).trim()
+          else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim())
+        }
+        if (dataLines.length === 0) continue
+        const data = JSON.parse(dataLines.join("\n"))
+
+        if (event === "token") onToken(data.text)
+        else if (event === "result") result = data
+        else if (event === "error") throw new Error(data.detail || "Failed to send chat message")
+      }
+    }
+
+    if (!result) {
+      throw new Error("Stream ended without result")
+    }
+    return result
+  }
+
+  async getDetailedAnalysis(applicationId: number): Promise<DetailedAnalysis> {
+    const response = await fetch(`${API_BASE_URL}/applications/${applicationId}/detailed-analysis`, {
+      headers: this.getHeaders(true),
+    })
+
+    if (!response.ok) {
+      throw new Error("Failed to fetch detailed analysis")
+    }
+
+    return response.json()
+  }
+
   async getAISession(applicationId: number, sessionId: string): Promise<any> {
     const response = await fetch(`${API_BASE_URL}/applications/${applicationId}/session/${sessionId}`, {
       headers: this.getHeaders(true),
@@ -551,6 +647,48 @@ class ApiClient {
     }
   }
 
+  // Подписка на чат работодатель-кандидат (SSE) вместо повторной загрузки сообщений:
+  // сначала приходит история чата, затем новые сообщения и отметки о прочтении.
+  // После обрыва EventSource переподключается сам и получает пропущенное по Last-Event-ID.
+  // Если он сдался (ответ не SSE, например ошибка прокси), подписка открывается заново
+  // с after_id последнего полученного сообщения, чтобы не загружать историю повторно.
+  // Возвращает функцию отписки.
+  subscribeEmployerChat(
+    applicationId: number,
+    onMessage: (message: EmployerCandidateMessage) => void,
+    onRead?: (messageId: number) => void,
+  ): () => void {
+    let lastId: number | null = null
+    let source: EventSource | null = null
+    let retry: ReturnType<typeof setTimeout> | null = null
+    let closed = false
+
+    const connect = () => {
+      const query = lastId !== null ? `?after_id=${lastId}` : ""
+      source = new EventSource(`${API_BASE_URL}/applications/${applicationId}/employer-chat/stream${query}`)
+      source.addEventListener("message", (event) => {
+        const message: EmployerCandidateMessage = JSON.parse((event as MessageEvent).data)
+        lastId = message.id
+        onMessage(message)
+      })
+      source.addEventListener("read", (event) => {
+        onRead?.(JSON.parse((event as MessageEvent).data).message_id)
+      })
+      source.addEventListener("error", () => {
+        if (!closed && source?.readyState === EventSource.CLOSED) {
+          retry = setTimeout(connect, 3000)
+        }
+      })
+    }
+
+    connect()
+    return () => {
+      closed = true
+      if (retry) clearTimeout(retry)
+      source?.close()
+    }
+  }
+
   async getSimilarCompanyVacancies(vacancyId: number): Promise<{
     current_vacancy_id: number
     company: string
@@ -0,0 +1,214 @@
+"""
+Нагрузочный генератор: воспроизводит сценарии соискателей и работодателей против backend
+
+Сценарий соискателя: список вакансий -> вакансия -> отклик -> загрузка резюме ->
+AI-анализ -> несколько ходов чата. Сценарий работодателя: заявки по вакансии ->
+детали заявки -> принятие -> чат с кандидатом.
+
+Пример:
+    python run_load.py --base-url http://localhost:8000 --users 20 --duration 60
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+CV_TEXT = (
+    "Иван Петров. Python-разработчик, 4 года опыта. FastAPI, Django, PostgreSQL, Redis, Docker. "
+    "Москва, готов к гибридному формату. Английский B2."
+)
+ANSWERS = [
+    "Да, 4 года в продакшене, последние 2 года — FastAPI.",
+    "Да, готов к гибриду.",
+    "Да, PostgreSQL каждый день, Redis для кеша и очередей.",
+    "200–300k",
+]
+
+
+class Stats:
+    """Латентности и ошибки по эндпоинтам"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    @staticmethod
+    def percentile(values: List[float], percent: float) -> float:
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(percent / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def report(self, elapsed: float, journeys: int):
+        total = sum(len(v) for v in self.latencies.values())
+        print(f"\nDuration: {elapsed:.1f}s, journeys: {journeys}, requests: {total}, "
+              f"throughput: {total / elapsed:.1f} req/s")
+        header = f"{'endpoint':<40} {'count':>7} {'err':>5} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        print(header)
+        print("-" * len(header))
+        for name in sorted(self.latencies):
+            values = self.latencies[name]
+            print(
+                f"{name:<40} {len(values):>7} {self.errors[name]:>5} {len(values) / elapsed:>7.1f} "
+                f"{self.percentile(values, 50) * 1000:>9.1f} {self.percentile(values, 95) * 1000:>9.1f} "
+                f"{self.percentile(values, 99) * 1000:>9.1f}"
+            )
+
+
+class LoadClient:
+    """Обертка над httpx, записывающая латентность каждого запроса"""
+
+    def __init__(self, client: httpx.AsyncClient, stats: Stats):
+        self.client = client
+        self.stats = stats
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            self.stats.record(name, time.perf_counter() - started, response.is_success)
+            return response if response.is_success else None
+        except httpx.HTTPError:
+            self.stats.record(name, time.perf_counter() - started, False)
+            return None
+
+
+async def register(load: LoadClient, role: str) -> int:
+    """Регистрирует пользователя и возвращает его ID"""
+    response = await load.request("POST /auth/register", "POST", "/auth/register", json={
+        "email": f"load-{role}-{uuid.uuid4().hex[:12]}@example.com",
+        "password": "loadpass123",
+        "full_name": f"Load {role}",
+        "role": role,
+    })
+    if response is None:
+        raise RuntimeError(f"Не удалось зарегистрировать пользователя {role}")
+    return response.json()["id"]
+
+
+async def setup(load: LoadClient, vacancies: int) -> Dict[str, List[int]]:
+    """Создает работодателя и набор вакансий"""
+    employer_id = await register(load, "employer")
+    vacancy_ids = []
+    for i in range(vacancies):
+        response = await load.request("POST /vacancies", "POST", "/vacancies", params={"employer_id": employer_id}, json={
+            "title": f"Python Developer #{i}",
+            "company": "LoadTest Corp",
+            "location": "Москва",
+            "description": "Python 3+ года, FastAPI, PostgreSQL, Redis. Гибрид, Москва. Английский B1+.",
+        })
+        if response is not None:
+            vacancy_ids.append(response.json()["id"])
+    return {"employer_id": [employer_id], "vacancy_ids": vacancy_ids}
+
+
+async def candidate_journey(load: LoadClient, vacancy_ids: List[int], chat_turns: int, stream: bool) -> Optional[int]:
+    """Соискатель: просмотр, отклик, резюме, AI-анализ, чат. Возвращает ID заявки"""
+    seeker_id = await register(load, "job_seeker")
+    await load.request("GET /vacancies", "GET", "/vacancies", params={"page": 1, "per_page": 10})
+    vacancy_id = random.choice(vacancy_ids)
+    await load.request("GET /vacancies/{id}", "GET", f"/vacancies/{vacancy_id}")
+
+    response = await load.request("POST /applications", "POST", "/applications", params={"job_seeker_id": seeker_id}, json={
+        "vacancy_id": vacancy_id,
+        "cover_letter": "Хочу у вас работать",
+    })
+    if response is None:
+        return None
+    application_id = response.json()["id"]
+
+    await load.request(
+        "POST /applications/{id}/upload-resume", "POST", f"/applications/{application_id}/upload-resume",
+        files={"file": ("resume.txt", CV_TEXT.encode("utf-8"), "text/plain")},
+    )
+
+    response = await load.request("POST /applications/{id}/analyze", "POST", f"/applications/{application_id}/analyze", json={})
+    if response is None:
+        return application_id
+    analysis = response.json()
+    session_id = analysis["session_id"]
+    completed = analysis.get("is_completed", False)
+
+    for turn in range(chat_turns):
+        if completed:
+            break
+        body = {"session_id": session_id, "message": ANSWERS[turn % len(ANSWERS)]}
+        if stream:
+            response = await load.request(
+                "POST /applications/{id}/chat/stream", "POST", f"/applications/{application_id}/chat/stream", json=body
+            )
+            completed = response is not None and '"is_completed": true' in response.text
+        else:
+            response = await load.request("POST /applications/{id}/chat", "POST", f"/applications/{application_id}/chat", json=body)
+            completed = response is not None and response.json().get("is_completed", False)
+
+    await load.request("GET /messages", "GET", "/messages", params={"application_id": application_id})
+    return application_id
+
+
+async def employer_journey(load: LoadClient, vacancy_id: int, application_id: int, employer_id: int):
+    """Работодатель: заявки по вакансии, принятие, чат с кандидатом"""
+    await load.request("GET /applications", "GET", "/applications", params={"vacancy_id": vacancy_id, "per_page": 50})
+    await load.request(
+        "POST /applications/{id}/action", "POST", f"/applications/{application_id}/action",
+        json={"action": "accept", "message": "Приглашаем на интервью"},
+    )
+    await load.request(
+        "POST /applications/{id}/employer-chat", "POST", f"/applications/{application_id}/employer-chat",
+        params={"sender_user_id": employer_id}, json={"content": "Когда вам удобно созвониться?", "application_id": application_id},
+    )
+    await load.request("GET /applications/{id}/employer-chat", "GET", f"/applications/{application_id}/employer-chat")
+
+
+async def user_loop(load: LoadClient, context: Dict[str, List[int]], deadline: float, args, counter: List[int]):
+    while time.time() < deadline and (args.journeys is None or counter[0] < args.journeys):
+        counter[0] += 1
+        try:
+            application_id = await candidate_journey(load, context["vacancy_ids"], args.chat_turns, args.stream)
+            if application_id is not None and random.random() < args.employer_ratio:
+                await employer_journey(load, context["vacancy_ids"][0], application_id, context["employer_id"][0])
+        except RuntimeError as e:
+            print(f"⚠️ {e}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест MyLink backend")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=10, help="Число одновременных виртуальных пользователей")
+    parser.add_argument("--duration", type=float, default=60.0, help="Длительность теста, секунды")
+    parser.add_argument("--journeys", type=int, default=None, help="Остановиться после N сценариев")
+    parser.add_argument("--vacancies", type=int, default=5)
+    parser.add_argument("--chat-turns", type=int, default=4)
+    parser.add_argument("--employer-ratio", type=float, default=0.3, help="Доля заявок, которые принимает работодатель")
+    parser.add_argument("--stream", action="store_true", help="Использовать потоковый чат (SSE)")
+    args = parser.parse_args()
+
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120.0, limits=limits) as client:
+        load = LoadClient(client, stats)
+        context = await setup(load, args.vacancies)
+        if not context["vacancy_ids"]:
+            raise SystemExit("Не удалось создать вакансии")
+        # Статистику подготовки в отчет не включаем
+        stats.latencies.clear()
+        stats.errors.clear()
+
+        counter = [0]
+        started = time.time()
+        deadline = started + args.duration
+        await asyncio.gather(*(user_loop(load, context, deadline, args, counter) for _ in range(args.users)))
+        stats.report(time.time() - started, counter[0])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,208 @@
+"""
+Заглушка AI-ассистента для нагрузочного тестирования backend без вызовов OpenAI
+
+Реализует те же эндпоинты, что и ai-assistent/main.py (/chat/start, /chat/turn,
+/chat/turn/stream, /sessions/{id}, /sessions/{id}/analysis), с настраиваемой задержкой
+ответа и выдачей [RESULT].
+
+Переменные окружения:
+    STUB_LATENCY        - распределение задержки одного LLM-вызова:
+                          fixed:<ms> | uniform:<min_ms>,<max_ms> | lognormal:<median_ms>,<sigma>
+                          (по умолчанию lognormal:1200,0.5)
+    STUB_TURNS          - после скольких ответов кандидата выдавать [RESULT] (по умолчанию 3)
+    STUB_RESULT_ON_START - выдавать [RESULT] сразу в /chat/start (по умолчанию 0)
+    STUB_PORT           - порт (по умолчанию 8001)
+"""
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Optional, Dict, Any
+from datetime import datetime
+import asyncio
+import json
+import os
+import random
+import uvicorn
+
+app = FastAPI(title="SmartBot Stub Assistant", version="1.0.0")
+
+# Сессии храним в памяти процесса — для нагрузочного теста этого достаточно
+sessions: Dict[str, Dict[str, Any]] = {}
+
+
+def parse_latency(spec: str):
+    """Разбирает спецификацию распределения задержки, возвращает функцию -> секунды"""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0] / 1000.0
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000.0
+    if kind == "lognormal":
+        median_ms, sigma = values
+        return lambda: random.lognormvariate(0.0, sigma) * median_ms / 1000.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+sample_latency = parse_latency(os.getenv("STUB_LATENCY", "lognormal:1200,0.5"))
+TURNS_TO_RESULT = int(os.getenv("STUB_TURNS", "3"))
+RESULT_ON_START = os.getenv("STUB_RESULT_ON_START", "0") == "1"
+
+QUESTIONS = [
+    "Спасибо за отклик! Сколько лет вы работаете с Python в продакшене?",
+    "Готовы ли вы к работе в офисе 3 дня в неделю? [Да/Нет]",
+    "Есть ли у вас опыт работы с PostgreSQL и Redis?",
+    "Какие ожидания по зарплате? [До 200k/200–300k/300k+]",
+]
+
+
+class ChatStartRequest(BaseModel):
+    vacancy_text: str
+    cv_text: Optional[str] = None
+    session_id: Optional[str] = None
+
+
+class ChatTurnRequest(BaseModel):
+    session_id: str
+    message_from_candidate: str
+
+
+def build_reply(question_count: int, completed: bool) -> str:
+    """Текст ответа в формате настоящего ассистента (с блоком [RESULT] при завершении)"""
+    if not completed:
+        return QUESTIONS[question_count % len(QUESTIONS)]
+    percent = random.randint(20, 95)
+    tags = "" if percent > 70 else "exp_gap, skill_mismatch"
+    return (
+        "Спасибо за отклик! Мы свяжемся с вами в ближайшее время.\n\n"
+        "[RESULT]\n"
+        f"match_percent: {percent}\n"
+        f"summary_one_liner: \"Подходит на {percent}%\"\n"
+        f"rejection_tags: \"{tags}\"\n"
+        "reasons: [\"опыт Python\", \"знает PostgreSQL\"]"
+    )
+
+
+def build_response(session_id: str, session: Dict[str, Any], reply: str) -> Dict[str, Any]:
+    bot_reply = reply.split("[RESULT]")[0].strip()
+    completed = "[RESULT]" in reply
+    if completed:
+        percent = int(reply.split("match_percent:")[1].split("\n")[0])
+        session.update({
+            "is_completed": True,
+            "relevance_percent": percent,
+            "summary": f"Подходит на {percent}%",
+            "reasons": ["опыт Python", "знает PostgreSQL"],
+            "rejection_tags": [] if percent > 70 else ["exp_gap", "skill_mismatch"],
+        })
+    session["messages"].append({"role": "assistant", "content": reply})
+    session["updated_at"] = datetime.utcnow().isoformat()
+    return {
+        "session_id": session_id,
+        "bot_reply": bot_reply,
+        "relevance_percent": session["relevance_percent"],
+        "reasons": session["reasons"],
+        "summary_for_employer": session["summary"],
+        "dialog_stage": "completed" if completed else "questioning",
+        "is_completed": completed,
+        "rejection_tags": session.get("rejection_tags", []),
+        "detailed_analysis": None,
+        "analysis_status": "ready" if completed else None,
+        "suggest_alternative_vacancy": completed and session["relevance_percent"] < 50,
+        "alternative_vacancy_reason": None,
+    }
+
+
+def get_session(session_id: str) -> Dict[str, Any]:
+    session = sessions.get(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy", "stub": True, "sessions": len(sessions)}
+
+
+@app.post("/chat/start")
+async def start_chat(request: ChatStartRequest):
+    session_id = request.session_id or f"session_{datetime.utcnow().timestamp()}"
+    now = datetime.utcnow().isoformat()
+    session = {
+        "vacancy_text": request.vacancy_text,
+        "cv_text": request.cv_text,
+        "messages": [],
+        "question_count": 0,
+        "is_completed": False,
+        "relevance_percent": 50,
+        "summary": "Идет уточнение деталей",
+        "reasons": ["Требуется дополнительная информация"],
+        "created_at": now,
+        "updated_at": now,
+    }
+    sessions[session_id] = session
+    await asyncio.sleep(sample_latency())
+    return build_response(session_id, session, build_reply(0, RESULT_ON_START))
+
+
+@app.post("/chat/turn")
+async def chat_turn(request: ChatTurnRequest):
+    session = get_session(request.session_id)
+    session["messages"].append({"role": "user", "content": request.message_from_candidate})
+    session["question_count"] += 1
+    await asyncio.sleep(sample_latency())
+    completed = session["is_completed"] or session["question_count"] >= TURNS_TO_RESULT
+    return build_response(request.session_id, session, build_reply(session["question_count"], completed))
+
+
+@app.post("/chat/turn/stream")
+async def chat_turn_stream(request: ChatTurnRequest):
+    session = get_session(request.session_id)
+    session["messages"].append({"role": "user", "content": request.message_from_candidate})
+    session["question_count"] += 1
+    completed = session["is_completed"] or session["question_count"] >= TURNS_TO_RESULT
+    reply = build_reply(session["question_count"], completed)
+
+    async def event_stream():
+        # Распределяем задержку по словам видимой части ответа
+        words = reply.split("[RESULT]")[0].split(" ")
+        total = sample_latency()
+        for word in words:
+            await asyncio.sleep(total / len(words))
+            yield f"event: token\ndata: {json.dumps({'text': word + ' '}, ensure_ascii=False)}\n\n"
+        final = build_response(request.session_id, session, reply)
+        yield f"event: result\ndata: {json.dumps(final, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.get("/sessions/{session_id}/analysis")
+async def get_session_analysis(session_id: str):
+    session = get_session(session_id)
+    completed = session["is_completed"]
+    return {
+        "session_id": session_id,
+        "analysis_status": "ready" if completed else None,
+        "detailed_analysis": "**ОБЩАЯ ОЦЕНКА:** stub" if completed else None,
+    }
+
+
+@app.get("/sessions/{session_id}")
+async def get_session_info(session_id: str):
+    session = get_session(session_id)
+    return {
+        "session_id": session_id,
+        "question_count": session["question_count"],
+        "is_completed": session["is_completed"],
+        "relevance_percent": session["relevance_percent"],
+        "summary": session["summary"],
+        "reasons": session["reasons"],
+        "created_at": session["created_at"],
+        "updated_at": session["updated_at"],
+        "message_count": len(session["messages"]),
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("STUB_PORT", "8001")), log_level="warning")